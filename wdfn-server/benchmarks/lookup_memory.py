@@ -0,0 +1,58 @@
+"""
+Compare the memory held by the lookups, as loaded into each worker, when they are parsed with json.loads and
+with waterdata.lookups.load_lookup_json, with and without compact records.
+
+Usage: python -m benchmarks.lookup_memory
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+from waterdata import app
+from waterdata.lookups import load_lookup_json
+
+LOADERS = {
+    'json.loads': json.loads,
+    'load_lookup_json': load_lookup_json,
+    'load_lookup_json (compact)': lambda text: load_lookup_json(text, compact_records=True)
+}
+
+
+def measure(loader, text):
+    """
+    Return the time in seconds taken to load text and the memory in bytes held by the result.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    loader(text)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = loader(text)  # pylint: disable=W0612
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size
+
+
+def main():
+    """Run the benchmark and print a table of the results."""
+    print(f'{"file":<34}{"loader":<30}{"time (s)":>10}{"held (MB)":>11}')
+    totals = {name: 0 for name in LOADERS}
+    for setting in ('NWIS_CODE_LOOKUP_FILENAME', 'COUNTRY_STATE_COUNTY_LOOKUP_FILENAME', 'HUC_LOOKUP_FILENAME'):
+        filename = app.config[setting]
+        with open(os.path.join(app.config['DATA_DIR'], filename), 'r') as f:
+            text = f.read()
+        for name, loader in LOADERS.items():
+            elapsed, size = measure(loader, text)
+            totals[name] += size
+            print(f'{filename:<34}{name:<30}{elapsed:>10.3f}{size / 1e6:>11.1f}')
+    for name, size in totals.items():
+        print(f'{"total":<34}{name:<30}{"":>10}{size / 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare the throughput and peak memory of the RDB parsers on a large, synthetic site listing.
+
+Usage: python -m benchmarks.rdb_parser [--rows ROWS] [--repeat REPEAT]
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+from requests import Response
+
+from waterdata.services.nwissite import LISTING_COLUMNS
+from waterdata.utils import iter_rdb_lines, parse_rdb, parse_rdb_records
+
+EXPANDED_COLUMNS = [
+    'agency_cd', 'site_no', 'station_nm', 'site_tp_cd', 'lat_va', 'long_va', 'dec_lat_va', 'dec_long_va',
+    'coord_meth_cd', 'coord_acy_cd', 'coord_datum_cd', 'dec_coord_datum_cd', 'district_cd', 'state_cd',
+    'county_cd', 'country_cd', 'land_net_ds', 'map_nm', 'map_scale_fc', 'alt_va', 'alt_meth_cd', 'alt_acy_va',
+    'alt_datum_cd', 'huc_cd', 'basin_cd', 'topo_cd', 'instruments_cd', 'construction_dt', 'inventory_dt',
+    'drain_area_va', 'contrib_drain_area_va', 'tz_cd', 'local_time_fg', 'reliability_cd', 'gw_file_cd',
+    'nat_aqfr_cd', 'aqfr_cd', 'aqfr_type_cd', 'well_depth_va', 'hole_depth_va', 'depth_src_cd', 'project_no'
+]
+
+
+def make_rdb(rows):
+    """
+    Return the bytes of an RDB file with rows records of expanded site output.
+    :param int rows:
+    :rtype: bytes
+    """
+    lines = ['# US Geological Survey', '# Synthetic site listing', '#']
+    lines.append('\t'.join(EXPANDED_COLUMNS))
+    lines.append('\t'.join('5s' for _ in EXPANDED_COLUMNS))
+    for row in range(rows):
+        values = [f'{column}-{row % 97}' for column in EXPANDED_COLUMNS]
+        values[0] = 'USGS'
+        values[1] = f'{row:08d}'
+        values[2] = f'SOME RIVER NEAR SOME TOWN {row}'
+        values[3] = 'ST'
+        lines.append('\t'.join(values))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def make_response(body):
+    """
+    Return an unread response with body.
+    :param bytes body:
+    :rtype: requests.Response
+    """
+    response = Response()
+    response.status_code = 200
+    response.encoding = 'utf-8'
+    response.raw = io.BytesIO(body)
+    return response
+
+
+PARSERS = {
+    'parse_rdb': lambda response: list(parse_rdb(response.iter_lines(decode_unicode=True))),
+    'parse_rdb_records': lambda response: list(parse_rdb_records(iter_rdb_lines(response))),
+    'parse_rdb_records (listing columns)':
+        lambda response: list(parse_rdb_records(iter_rdb_lines(response), columns=LISTING_COLUMNS))
+}
+
+
+def measure(parser, body, repeat):
+    """
+    Return the best time in seconds and the peak memory in bytes used to parse body.
+    """
+    best_time = None
+    for _ in range(repeat):
+        response = make_response(body)
+        start = time.perf_counter()
+        parser(response)
+        elapsed = time.perf_counter() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    response = make_response(body)
+    tracemalloc.start()
+    result = parser(response)  # pylint: disable=W0612
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best_time, peak
+
+
+def main():
+    """Run the benchmark and print a table of the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    body = make_rdb(args.rows)
+    print(f'{args.rows} rows, {len(EXPANDED_COLUMNS)} columns, {len(body) / 1e6:.1f} MB')
+    print(f'{"parser":<38}{"time (s)":>10}{"rows/s":>12}{"peak (MB)":>12}')
+    for name, parse in PARSERS.items():
+        elapsed, peak = measure(parse, body, args.repeat)
+        print(f'{name:<38}{elapsed:>10.3f}{args.rows / elapsed:>12,.0f}{peak / 1e6:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Compare the time taken by the single pass rollup and the previous sort and groupby rollup on large,
+synthetic series catalogs like those of sites with hundreds of water-quality parameters. Both rollups
+must give the same result.
+
+Usage: python -m benchmarks.rollup_dataseries [--sizes SIZE [SIZE ...]] [--repeat REPEAT]
+"""
+import argparse
+import itertools
+import random
+import time
+
+import pendulum
+
+from waterdata.location_utils import _extract_group_summary_data, rollup_dataseries
+
+PARAMETER_GROUPS = ['Physical', 'Nutrient', 'Inorganics, Major, Metals', 'Organics, pesticide', 'ALL']
+DATA_TYPES = ['Unit Values', 'Daily Values', 'Water-quality', 'Field measurements']
+OTHER_DATA_TYPES = ['Peak Measurements', 'Site Visits', 'USGS Annual Water Data Reports Site']
+
+
+def _code(code, name=None):
+    return {'code': code, 'name': code if name is None else name}
+
+
+def make_catalog(size, seed=0):
+    """
+    Return a disambiguated series catalog with size series.
+    :param int size:
+    :param int seed: seed for the random choices
+    :rtype: list of dict
+    """
+    rng = random.Random(seed)
+    catalog = []
+    for _ in range(size):
+        begin_date = f'{rng.randint(1900, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+        end_date = f'{rng.randint(2011, 2021)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+        if rng.random() < 0.1:
+            parm_cd = _code('')
+            parm_grp_cd = _code('')
+            data_type_cd = _code('xx', rng.choice(OTHER_DATA_TYPES))
+        else:
+            parameter_code = f'{rng.randint(0, 99999):05d}'
+            group = rng.choice(PARAMETER_GROUPS)
+            parm_cd = _code(parameter_code, f'Parameter {parameter_code}')
+            parm_grp_cd = _code(group[:3].upper(), group)
+            data_type_cd = _code('xx', rng.choice(DATA_TYPES))
+        catalog.append({
+            'agency_cd': _code('USGS', 'U.S. Geological Survey'),
+            'site_no': _code('01646500'),
+            'data_type_cd': data_type_cd,
+            'parm_cd': parm_cd,
+            'parm_grp_cd': parm_grp_cd,
+            'begin_date': _code(begin_date),
+            'end_date': _code(end_date)
+        })
+    return catalog
+
+
+def _baseline_collapse_series_by_column(grouped_series, sort_data_col):
+    def key_sort(item):
+        return item[sort_data_col]['code']
+
+    rolled_up_series = {}
+    for key, grp in grouped_series:
+        series_by_pcode = itertools.groupby(sorted(grp, key=key_sort), key=key_sort)
+        grp_pcode_series = []
+        for key_pc, pc_grp in series_by_pcode:
+            series_by_pc = list(pc_grp)
+            start_dates = [pendulum.parse(series['begin_date']['code']) for series in series_by_pc]
+            end_dates = [pendulum.parse(series['end_date']['code']) for series in series_by_pc]
+            grp_pcode_series.append({
+                'start_date': min(start_dates),
+                'end_date': max(end_dates),
+                'data_types': [series['data_type_cd']['name'] for series in series_by_pc],
+                'parameter_code': key_pc,
+                'parameter_name': series_by_pc[0]['parm_cd']['name']
+            })
+        rolled_up_series[key] = grp_pcode_series
+    return rolled_up_series
+
+
+def baseline_rollup_dataseries(dataseries):
+    """
+    The rollup before it was made a single pass, which sorts and groups the catalog with itertools.groupby,
+    parses every date with pendulum.parse and filters the series without parameters with a list scan.
+    :param list dataseries:
+    :rtype: list
+    """
+    display_series = list(itertools.filterfalse(
+        lambda x: x['parm_cd']['code'] == '' and x['parm_grp_cd']['code'] == '',
+        dataseries
+    ))
+    other_series = [s for s in dataseries if s not in display_series]
+
+    def parm_grp_sort(item):
+        return item['parm_grp_cd']['name']
+
+    pg_grouped_series = itertools.groupby(sorted(display_series, key=parm_grp_sort), key=parm_grp_sort)
+    rollup_by_parameter_grp = _baseline_collapse_series_by_column(pg_grouped_series, 'parm_cd')
+    rollup_by_parameter_grp.pop('ALL', None)
+    parameter_groups = [_extract_group_summary_data(v, k) for k, v in rollup_by_parameter_grp.items()]
+
+    def data_type_sort(item):
+        return item['data_type_cd']['name']
+
+    dt_grouped_series = itertools.groupby(sorted(other_series, key=data_type_sort), key=data_type_sort)
+    rollup_by_dt_code = _baseline_collapse_series_by_column(dt_grouped_series, 'data_type_cd')
+    data_type_groups = [_extract_group_summary_data(v) for v in rollup_by_dt_code.values()]
+
+    return parameter_groups + data_type_groups
+
+
+ROLLUPS = {
+    'baseline': baseline_rollup_dataseries,
+    'rollup_dataseries': rollup_dataseries
+}
+
+
+def measure(rollup, catalog, repeat):
+    """
+    Return the best time in seconds to roll up catalog with rollup.
+    """
+    best_time = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rollup(catalog)
+        elapsed = time.perf_counter() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return best_time
+
+
+def main():
+    """Run the benchmark and print a table of the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"rollup":<20}{"series":>10}{"time (ms)":>12}{"series/s":>14}')
+    for size in args.sizes:
+        catalog = make_catalog(size)
+        assert baseline_rollup_dataseries(catalog) == rollup_dataseries(catalog), 'Expected the same rollup'
+        for name, rollup in ROLLUPS.items():
+            elapsed = measure(rollup, catalog, args.repeat)
+            print(f'{name:<20}{size:>10}{elapsed * 1000:>12.2f}{size / elapsed:>14,.0f}')
+
+
+if __name__ == '__main__':
+    main()
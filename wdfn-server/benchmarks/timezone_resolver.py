@@ -0,0 +1,142 @@
+"""
+Compare the lookup time and the memory held by the local time zone resolver and by the previous resolver, which
+tested every edge of the polygons whose bounding boxes overlap the cell of the point. The synthetic boundaries are
+strips of time zones with detailed, winding sides, like the coastlines and rivers of the published boundaries. Both
+resolvers must give the same time zones.
+
+Usage: python -m benchmarks.timezone_resolver [--zones ZONES] [--vertices VERTICES] [--points POINTS]
+"""
+import argparse
+import gc
+import math
+import random
+import time
+import tracemalloc
+
+from waterdata.services.timezone import LocalTimeZoneResolver
+
+
+def make_features(zones, vertices, seed=0):
+    """
+    Return GeoJSON features of zones time zones, side by side between longitudes -130 and -60 and latitudes 20
+    and 60. Each side between two time zones has vertices positions.
+    :param int zones:
+    :param int vertices:
+    :param int seed: seed for the random positions
+    :rtype: list of dict
+    """
+    rng = random.Random(seed)
+    width = 70 / zones
+    sides = [[[-130.0, 20.0], [-130.0, 60.0]]]
+    for zone in range(1, zones):
+        longitude = -130 + zone * width
+        side = []
+        for vertex in range(vertices):
+            longitude = min(max(longitude + rng.gauss(0, 0.02), -130 + (zone - 0.5) * width),
+                            -130 + (zone + 0.5) * width)
+            side.append([longitude, 20 + 40 * vertex / (vertices - 1)])
+        sides.append(side)
+    sides.append([[-60.0, 20.0], [-60.0, 60.0]])
+    return [{
+        'type': 'Feature',
+        'properties': {'tzid': f'Zone/{zone}'},
+        'geometry': {'type': 'Polygon', 'coordinates': [sides[zone] + sides[zone + 1][::-1] + [sides[zone][0]]]}
+    } for zone in range(zones)]
+
+
+class BaselineResolver:
+    """
+    The resolver before the edges were indexed by cell, which buckets the polygons by bounding box and tests
+    every edge of the candidate polygons.
+    """
+
+    def __init__(self, features, cell_size=1.0):
+        self.cell_size = cell_size
+        self._grid = {}
+        for feature in features:
+            rings = feature['geometry']['coordinates'][0]
+            longitudes = [position[0] for position in rings]
+            latitudes = [position[1] for position in rings]
+            min_col, min_row = self._cell(min(longitudes), min(latitudes))
+            max_col, max_row = self._cell(max(longitudes), max(latitudes))
+            for col in range(min_col, max_col + 1):
+                for row in range(min_row, max_row + 1):
+                    self._grid.setdefault((col, row), []).append((feature['properties']['tzid'], rings))
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def get_iana_time_zone(self, latitude, longitude):
+        """Return the time zone of the point or None."""
+        for time_zone, ring in self._grid.get(self._cell(longitude, latitude), []):
+            inside = False
+            x1, y1 = ring[-1]
+            for x2, y2 in ring:
+                if (y2 > latitude) != (y1 > latitude) and longitude < (x1 - x2) * (latitude - y2) / (y1 - y2) + x2:
+                    inside = not inside
+                x1, y1 = x2, y2
+            if inside:
+                return time_zone
+        return None
+
+
+def build(factory, zones, vertices):
+    """
+    Return the resolver made by factory, the time in seconds taken to make it and the memory in bytes it holds
+    once the features are released.
+    """
+    features = make_features(zones, vertices)
+    gc.collect()
+    start = time.perf_counter()
+    factory(features)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    resolver = factory(make_features(zones, vertices))
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resolver, elapsed, size
+
+
+def measure(resolver, points):
+    """
+    Return the time zones of points and the mean time in seconds of a lookup.
+    """
+    start = time.perf_counter()
+    time_zones = [resolver.get_iana_time_zone(latitude, longitude) for latitude, longitude in points]
+    return time_zones, (time.perf_counter() - start) / len(points)
+
+
+def main():
+    """Run the benchmark and print a table of the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--zones', type=int, default=8)
+    parser.add_argument('--vertices', type=int, default=20000)
+    parser.add_argument('--points', type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    points = [(rng.uniform(20, 60), rng.uniform(-130, -60)) for _ in range(args.points)]
+    resolvers = {
+        'baseline': BaselineResolver,
+        'LocalTimeZoneResolver': lambda features: LocalTimeZoneResolver(features, memo_size=0),
+        'LocalTimeZoneResolver (memoized)': LocalTimeZoneResolver
+    }
+
+    print(f'{args.zones} time zones, {args.vertices} vertices per side, {args.points} points')
+    print(f'{"resolver":<36}{"build (s)":>10}{"held (MB)":>11}{"lookup (us)":>13}')
+    expected = None
+    for name, factory in resolvers.items():
+        resolver, build_time, size = build(factory, args.zones, args.vertices)
+        time_zones, lookup_time = measure(resolver, points)
+        if name.endswith('(memoized)'):
+            time_zones, lookup_time = measure(resolver, points)
+        expected = expected or time_zones
+        assert time_zones == expected, 'Expected the same time zones'
+        print(f'{name:<36}{build_time:>10.2f}{size / 1e6:>11.1f}{lookup_time * 1e6:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
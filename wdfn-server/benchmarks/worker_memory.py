@@ -0,0 +1,143 @@
+"""
+Report the memory used by each gunicorn worker, with and without GUNICORN_PRELOAD_APP. Linux only.
+
+The unique set size (USS) of a worker is the memory which would be freed if it exited, that is the pages
+it does not share with the master or the other workers. The proportional set size (PSS) divides each shared
+page between the processes sharing it.
+
+Usage:
+    python -m benchmarks.worker_memory [--workers WORKERS] [--requests REQUESTS]
+    python -m benchmarks.worker_memory --pid MASTER_PID
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+# Pages which only use the lookups, so they render without calling upstream services
+WARM_UP_PATHS = ['/states/', '/states/55/', '/hydrological-unit/', '/hydrological-unit/07/']
+
+
+def get_memory(pid):
+    """
+    Return the RSS, PSS and USS of a process in kB.
+    :param int pid:
+    :rtype: dict
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    }
+
+
+def get_children(pid):
+    """
+    Return the process ids of the children of a process.
+    :param int pid:
+    :rtype: list of int
+    """
+    children = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children', 'r') as f:
+            children.extend(int(child) for child in f.read().split())
+    return children
+
+
+def report(master_pid):
+    """
+    Print the memory of the master and each of its workers and return the mean worker USS in kB.
+    :param int master_pid:
+    :rtype: float
+    """
+    print(f'{"process":<16}{"RSS (MB)":>10}{"PSS (MB)":>10}{"USS (MB)":>10}')
+    master = get_memory(master_pid)
+    print(f'{"master " + str(master_pid):<16}{master["rss"] / 1024:>10.1f}{master["pss"] / 1024:>10.1f}'
+          f'{master["uss"] / 1024:>10.1f}')
+    worker_uss = []
+    for pid in get_children(master_pid):
+        worker = get_memory(pid)
+        worker_uss.append(worker['uss'])
+        print(f'{"worker " + str(pid):<16}{worker["rss"] / 1024:>10.1f}{worker["pss"] / 1024:>10.1f}'
+              f'{worker["uss"] / 1024:>10.1f}')
+    mean_uss = sum(worker_uss) / len(worker_uss) if worker_uss else 0
+    print(f'mean worker USS {mean_uss / 1024:.1f} MB')
+    return mean_uss
+
+
+def _wait_for_workers(process, url, workers, timeout=60):
+    """
+    Wait until the server answers and has all of its workers.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited')
+        try:
+            urlopen(url, timeout=5).read()
+            if len(get_children(process.pid)) == workers:
+                return
+        except URLError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError('gunicorn did not start')
+
+
+def measure(preload, workers, requests, port):
+    """
+    Start gunicorn, warm up its workers with requests to pages which use the lookups, report their memory
+    and stop it.
+    :return: mean worker USS in kB
+    :rtype: float
+    """
+    env = dict(os.environ, GUNICORN_PRELOAD_APP='true' if preload else 'false')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', 'waterdata:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        _wait_for_workers(process, base_url + WARM_UP_PATHS[0], workers)
+        # Give the workers which have not served a request time to finish loading the application
+        time.sleep(2)
+        for request_number in range(requests):
+            urlopen(base_url + WARM_UP_PATHS[request_number % len(WARM_UP_PATHS)], timeout=30).read()
+        print(f'GUNICORN_PRELOAD_APP={"true" if preload else "false"}, {workers} workers, {requests} requests')
+        return report(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    """Run the report."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pid', type=int, help='report the workers of a running gunicorn master')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    if args.pid:
+        report(args.pid)
+        return
+
+    before = measure(False, args.workers, args.requests, args.port)
+    print()
+    after = measure(True, args.workers, args.requests, args.port)
+    print()
+    print(f'mean worker USS: {before / 1024:.1f} MB without preload, {after / 1024:.1f} MB with preload')
+
+
+if __name__ == '__main__':
+    main()
@@ -33,6 +33,11 @@ NWISWEB_ENDPOINTS = {
 }
 
 WEATHER_SERVICE_ENDPOINT = 'https://api.weather.gov'
+# Path to a GeoJSON file of time zone boundaries with a tzid property, for example combined.json from
+# https://github.com/evansiroky/timezone-boundary-builder/releases. When set, time zones are resolved locally and
+# the weather service is only used as a fallback, if enabled.
+TIME_ZONE_BOUNDARIES_FILE = None
+WEATHER_SERVICE_TIME_ZONE_FALLBACK_ENABLED = True
 # For SIFTA cooperator site service - gives us the information needed to show the cooperator logos
 COOPERATOR_SERVICE_ENDPOINT = 'https://water.usgs.gov/customer/stories/'
 
@@ -62,6 +67,128 @@ TNM_USGS_IMAGERY_TOPO_ENDPOINT = 'https://basemap.nationalmap.gov/arcgis/rest/se
 TNM_HYDRO_ENDPOINT = 'https://basemap.nationalmap.gov/arcgis/rest/services/USGSHydroCached/MapServer'
 
 MONITORING_LOCATION_CAMERA_ENDPOINT = 'https://apps.usgs.gov/sstl/'
+# Seconds between refreshes of the camera metadata and before retrying an empty or failed refresh
+MONITORING_LOCATION_CAMERA_METADATA_TTL = 60 * 60
+MONITORING_LOCATION_CAMERA_METADATA_RETRY = 5 * 60
+
+# Maximum number of threads per worker used to call independent upstream services in parallel
+UPSTREAM_MAX_WORKERS = 8
+
+# Time budget in seconds for all of the upstream calls made by a route, keyed by view function name. Each upstream
+# call is limited to the time remaining. Optional upstream calls are served from the cache or skipped when less than
+# REQUEST_DEADLINE_OPTIONAL_RESERVE seconds remain.
+REQUEST_DEADLINES = {
+    'monitoring_location': 15,
+    'hydrological_unit_locations': 20,
+    'county_station_locations': 20,
+    'networks': 10
+}
+REQUEST_DEADLINE_OPTIONAL_RESERVE = 3
+
+# HTTP transport settings for each upstream service. The 'default' entry is used for any setting an upstream does not
+# override. Timeouts are in seconds. Retries apply to connection failures and 502, 503 and 504 responses.
+# The circuit breaker opens after failure_threshold consecutive failures and lets a probe request through after
+# reset_timeout seconds.
+UPSTREAM_TRANSPORT = {
+    'default': {
+        'connect_timeout': 3.05,
+        'read_timeout': 10,
+        'retries': 2,
+        'backoff_factor': 0.2,
+        'pool_connections': 4,
+        'pool_maxsize': UPSTREAM_MAX_WORKERS,
+        'failure_threshold': 5,
+        'reset_timeout': 30
+    },
+    'nwis_site': {
+        'read_timeout': 20
+    },
+    'cooperator': {
+        'read_timeout': 5
+    },
+    'weather_service': {
+        'read_timeout': 5
+    },
+    'camera': {
+        'read_timeout': 15
+    },
+    'observations': {},
+    'edge_purge': {}
+}
+
+# Caching of upstream service responses. Times are in seconds.
+# Use the 'memory' backend for a cache per worker process or 'sqlite' for a cache shared by all workers on a host
+UPSTREAM_CACHE_BACKEND = 'memory'
+# Path of the 'sqlite' backend's database file. Its directory must only be writable by the server user and is created
+# with mode 0700 if it is missing. If None, upstream_cache.sqlite in the Flask instance directory is used.
+UPSTREAM_CACHE_SQLITE_PATH = None
+UPSTREAM_CACHE_MAX_SIZE = 5000
+# Within this time after a response expires, it is served while it is refreshed in the background
+UPSTREAM_CACHE_STALE_WHILE_REVALIDATE = 5 * 60
+# Within this time after a response expires, it is served if the upstream service fails
+UPSTREAM_CACHE_STALE_IF_ERROR = 24 * 60 * 60
+# Time to live for each NWIS site service query type. Remove a query type to disable caching it.
+SITE_SERVICE_CACHE_TTLS = {
+    'site_data': 6 * 60 * 60,
+    'period_of_record': 60 * 60,
+    'huc_sites': 6 * 60 * 60,
+    'county_sites': 6 * 60 * 60
+}
+COOPERATOR_SERVICE_CACHE_TTL = 24 * 60 * 60
+WEATHER_SERVICE_CACHE_TTL = 7 * 24 * 60 * 60
+MONITORING_LOCATIONS_OBSERVATIONS_CACHE_TTL = 60 * 60
+# Rendered monitoring-location pages kept by each worker. A page is only reused while the upstream responses it
+# was rendered from are unchanged.
+MONITORING_LOCATION_PAGE_CACHE_MAX_SIZE = 500
+MONITORING_LOCATION_PAGE_CACHE_TTL = 60 * 60
+# Rendered template fragments, such as the site description and the lookup tables, kept by each worker. The key of a
+# fragment is given in its {% cache %} tag. Set FRAGMENT_CACHE_MAX_SIZE to 0 to render every fragment.
+FRAGMENT_CACHE_MAX_SIZE = 2000
+FRAGMENT_CACHE_TTL = 60 * 60
+
+# Set CDN_CACHEABLE_RESPONSES to True when the application is behind a CDN or shared cache. Pages are then the same
+# for every visitor: the server does not set the banner cookie, a script hides the banner notices after the first
+# visit and Internet Explorer is served the same page as other browsers. Responses get the Cache-Control header and
+# the Vary headers for their route below and a SURROGATE_KEY_HEADER listing the keys the edge can purge them by.
+# Error responses are sent with Cache-Control: no-store.
+CDN_CACHEABLE_RESPONSES = False
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+CACHE_CONTROL = {
+    'home': 'public, max-age=300, s-maxage=3600',
+    'provisional_data_statement': 'public, max-age=3600, s-maxage=86400',
+    'iv_data_availability': 'public, max-age=3600, s-maxage=86400',
+    'monitoring_location': 'public, max-age=60, s-maxage=900, stale-while-revalidate=300, stale-if-error=86400',
+    'hydrological_unit': 'public, max-age=3600, s-maxage=86400',
+    'hydrological_unit_locations': 'public, max-age=300, s-maxage=3600, stale-if-error=86400',
+    'states_counties': 'public, max-age=3600, s-maxage=86400',
+    'county_station_locations': 'public, max-age=300, s-maxage=3600, stale-if-error=86400',
+    'networks': 'public, max-age=300, s-maxage=3600, stale-if-error=86400',
+    'time_series_component': 'public, max-age=3600, s-maxage=86400',
+    'questions_comments': 'no-store',
+    'feedback_submitted': 'no-store',
+    'upstream_status': 'no-store',
+    'lookup_status': 'no-store',
+    'purge': 'no-store'
+}
+CACHE_VARY = {
+    'monitoring_location': ['Accept']
+}
+# Cache-Control of the responses of the routes above which were built while an upstream call failed or was skipped
+# for the request deadline, so that shared caches soon replace them with the complete page
+DEGRADED_CACHE_CONTROL = 'public, max-age=0, s-maxage=60'
+
+# Surrogate keys are purged with a POST to /purge/ or with `python manage.py purge`. This removes the cached upstream
+# responses of the pages tagged with the keys and posts the keys as {"surrogate_keys": [...]} to EDGE_PURGE_ENDPOINT
+# with EDGE_PURGE_HEADERS, as the Fastly batch purge API expects. Requests to /purge/ must have PURGE_API_TOKEN as a
+# bearer token. The route is disabled if PURGE_API_TOKEN is not set. Purges are refused unless UPSTREAM_CACHE_BACKEND is
+# 'sqlite', because the 'memory' backend of every other worker would keep the stale responses and refill the CDN.
+PURGE_API_TOKEN = None
+EDGE_PURGE_ENDPOINT = None
+EDGE_PURGE_HEADERS = {}
+
+# Directory of the state, county and hydrologic unit pages rendered by `python manage.py prerender`. If it is set,
+# WhiteNoise serves the pages in it instead of the application rendering them. Restart the server after rendering.
+PRERENDERED_PAGES_DIR = None
 
 LOGGING_ENABLED = True
 LOGGING_DIRECTORY = None
@@ -72,6 +199,18 @@ NWIS_CODE_LOOKUP_FILENAME = 'nwis_lookup.json'
 COUNTRY_STATE_COUNTY_LOOKUP_FILENAME = 'nwis_country_state_lookup.json'
 HUC_LOOKUP_FILENAME = 'huc_lookup.json'
 
+# Path of a SQLite file compiled from the lookup files with `python manage.py compile-lookups`. If it is set
+# and the file was compiled from the current lookup files, the lookups are read from it on demand instead
+# of being loaded from the JSON files at startup. LOOKUP_STORE_CACHE_SIZE is the number of entries which
+# each worker keeps in memory.
+LOOKUP_STORE_PATH = None
+LOOKUP_STORE_CACHE_SIZE = 5000
+
+# When the lookups are loaded from the JSON files, repeated strings and identical objects are stored once. If
+# LOOKUP_COMPACT_RECORDS is True, the innermost objects are also stored as read only, tuple backed records,
+# which uses less memory but takes longer to load.
+LOOKUP_COMPACT_RECORDS = False
+
 GA_TRACKING_CODE = ''
 ENABLE_USGS_GA = False
 
@@ -1,5 +1,38 @@
+import gc
 import multiprocessing
+import os
 
 
 bind = ':5050'
 workers = multiprocessing.cpu_count()*2 + 1
+
+# Set GUNICORN_PRELOAD_APP=true to load the application, including the lookups, once in the master process.
+# The workers then share the master's memory copy-on-write instead of each loading their own copy. Garbage
+# collection is disabled while the application loads and everything it allocated is frozen out of the
+# collector before the workers are forked, so collections in the workers do not write to the shared pages.
+preload_app = os.getenv('GUNICORN_PRELOAD_APP', 'false').lower() == 'true'
+
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):  # pylint: disable=W0613
+    """
+    Called in the master process once the application has been loaded, before the workers are forked.
+    The workers inherit the frozen objects and the enabled collector.
+    """
+    if preload_app:
+        # Load the lookup tables which are otherwise loaded on first use, so the workers share them
+        from waterdata import app  # pylint: disable=C0415
+        app.config['NWIS_CODE_LOOKUP'].load_all()
+        gc.freeze()
+        gc.enable()
+
+
+def post_worker_init(worker):  # pylint: disable=W0613
+    """
+    Called in each worker once it has loaded the application. Background threads are started here because
+    a worker does not inherit the threads of the master.
+    """
+    from waterdata.services.camera import start_camera_metadata_refresh  # pylint: disable=C0415
+    start_camera_metadata_refresh()
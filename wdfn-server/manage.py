@@ -4,6 +4,8 @@
 Entrypoint for Flask development server.
 """
 
+import os
+
 import click
 from flask.cli import FlaskGroup
 
@@ -37,7 +39,9 @@ def generate_lookups(datadir, **lookups):
     if lookups['nwis'] or lookups['gen_all']:
         click.echo('Generating NWIS code lookup file...')
         from waterdata.commands.lookup_generation import generate_lookup_file
+        from waterdata.lookups import write_json_file_offsets
         generate_lookup_file(datadir)
+        write_json_file_offsets(os.path.join(datadir, app.config.get('NWIS_CODE_LOOKUP_FILENAME')))
 
     if lookups['regions'] or lookups['gen_all']:
         click.echo('Generating region lookup file...')
@@ -50,5 +54,80 @@ def generate_lookups(datadir, **lookups):
         generate_hucs_file(datadir)
 
 
+@cli.command()
+@click.option('--datadir', type=click.Path(dir_okay=True, file_okay=False),
+              default=app.config.get('DATA_DIR'),
+              help='Directory of the NWIS code lookup file.')
+def index_lookups(datadir):
+    """
+    Records the offsets of the tables of the NWIS code lookup file, so that workers read each table without
+    scanning the file. The offsets are recorded when the file is generated; run this after changing it otherwise.
+    """
+    from waterdata.lookups import write_json_file_offsets
+    path = os.path.join(datadir, app.config.get('NWIS_CODE_LOOKUP_FILENAME'))
+    count = write_json_file_offsets(path)
+    click.echo(f'Wrote the offsets of {count} tables of {path}')
+
+
+@cli.command()
+@click.option('--output', type=click.Path(dir_okay=False),
+              default=app.config.get('LOOKUP_STORE_PATH') or os.path.join(app.config.get('DATA_DIR'), 'lookups.db'),
+              help='Path of the SQLite lookup store to create.')
+def compile_lookups(output):
+    """
+    Compiles the lookup files into a SQLite lookup store which is read on demand. Set LOOKUP_STORE_PATH
+    to the output path to use it.
+    """
+    from waterdata.lookups import compile_lookup_store
+    data_dir = app.config.get('DATA_DIR')
+    count = compile_lookup_store(
+        output,
+        os.path.join(data_dir, app.config.get('NWIS_CODE_LOOKUP_FILENAME')),
+        os.path.join(data_dir, app.config.get('COUNTRY_STATE_COUNTY_LOOKUP_FILENAME')),
+        os.path.join(data_dir, app.config.get('HUC_LOOKUP_FILENAME'))
+    )
+    click.echo(f'Wrote {count} lookup entries to {output}')
+
+
+@cli.command()
+@click.argument('keys', nargs=-1, required=True)
+def purge(keys):
+    """
+    Purges the pages tagged with the surrogate KEYS, such as site/01646500, county/24/031, huc/02070008 or
+    network/RTS. The cached upstream responses of those pages are removed and the keys are purged from the
+    edge cache. This requires UPSTREAM_CACHE_BACKEND to be sqlite, which the running server shares.
+    """
+    from waterdata.views import is_upstream_cache_shared, purge_surrogate_keys
+    if not is_upstream_cache_shared():
+        raise click.ClickException('Purging requires the sqlite UPSTREAM_CACHE_BACKEND, which is shared with the '
+                                   'running server')
+    purged_keys, edge_purged = purge_surrogate_keys(keys)
+    click.echo(f'Purged {" ".join(purged_keys)}')
+    if not edge_purged:
+        click.echo('The edge cache was not purged')
+
+
+@cli.command()
+@click.option('--output', type=click.Path(file_okay=False),
+              default=app.config.get('PRERENDERED_PAGES_DIR') or os.path.join(app.config.get('DATA_DIR'), 'pages'),
+              help='Directory to write the pages to.')
+@click.option('--force', is_flag=True, default=False,
+              help='Render the pages even if the lookups and templates have not changed.')
+def prerender(output, force):
+    """
+    Renders the state, county and hydrologic unit pages into a directory which is served as static files
+    when PRERENDERED_PAGES_DIR is set to it. The pages are only rendered again when the lookup files,
+    templates or settings they are rendered from change.
+    """
+    from waterdata import lookup_paths
+    from waterdata.prerender import prerender_pages
+    counts = prerender_pages(output, lookup_paths, force=force)
+    if counts is None:
+        click.echo(f'The pages in {output} are up to date')
+    else:
+        click.echo(f'Rendered {counts["rendered"]} pages, wrote {counts["written"]} changed pages and removed '
+                   f'{counts["removed"]} pages in {output}')
+
+
 if __name__ == '__main__':
     cli()
@@ -7,6 +7,7 @@ Entrypoint for Flask development server.
 import argparse
 
 from waterdata import app
+from waterdata.services.camera import start_camera_metadata_refresh
 
 
 def run_server(port=5050):
@@ -19,6 +20,7 @@ def run_server(port=5050):
         host = host_val
     else:
         host = '127.0.0.1'
+    start_camera_metadata_refresh()
     app.run(host=host, port=port, threaded=True)
     # run from the command line as follows
     # python run.py -ht <ip address of your choice>
@@ -43,18 +43,37 @@ try:
 except FileNotFoundError:
     pass
 
-# Read lookup files and save to the app.config
-with open(os.path.join(app.config.get('DATA_DIR'),
-                       app.config.get('NWIS_CODE_LOOKUP_FILENAME')), 'r') as f:
-    app.config['NWIS_CODE_LOOKUP'] = json.loads(f.read())
-
-with open(os.path.join(app.config.get('DATA_DIR'),
-                       app.config.get('COUNTRY_STATE_COUNTY_LOOKUP_FILENAME')), 'r') as f:
-    app.config['COUNTRY_STATE_COUNTY_LOOKUP'] = json.loads(f.read())
-
-with open(os.path.join(app.config.get('DATA_DIR'),
-                       app.config.get('HUC_LOOKUP_FILENAME')), 'r') as f:
-    app.config['HUC_LOOKUP'] = json.loads(f.read())
+# Read lookup files and save to the app.config, unless they have been compiled into a lookup store.
+# The NWIS code tables are only loaded when they are first used.
+from .lookups import LazyLookupTables, LookupIndex, SQLiteLookupIndex, is_lookup_store_current, \
+    load_lookup_json  # pylint: disable=C0413
+lookup_paths = [
+    os.path.join(app.config.get('DATA_DIR'), app.config.get(filename_setting))
+    for filename_setting in ('NWIS_CODE_LOOKUP_FILENAME', 'COUNTRY_STATE_COUNTY_LOOKUP_FILENAME', 'HUC_LOOKUP_FILENAME')
+]
+lookup_store_path = app.config.get('LOOKUP_STORE_PATH')
+if lookup_store_path and is_lookup_store_current(lookup_store_path, *lookup_paths):
+    app.config['LOOKUP_INDEX'] = SQLiteLookupIndex(lookup_store_path,
+                                                   cache_size=app.config.get('LOOKUP_STORE_CACHE_SIZE'))
+    app.config['NWIS_CODE_LOOKUP'] = LazyLookupTables(app.config['LOOKUP_INDEX'].get_code_table_names,
+                                                      app.config['LOOKUP_INDEX'].get_code_table)
+else:
+    if lookup_store_path:
+        app.logger.warning(f'Lookup store {lookup_store_path} is missing or out of date, loading the lookup files')
+
+    compact_records = app.config.get('LOOKUP_COMPACT_RECORDS')
+    app.config['NWIS_CODE_LOOKUP'] = LazyLookupTables.from_json_file(lookup_paths[0], compact_records=compact_records)
+
+    with open(lookup_paths[1], 'r') as f:
+        app.config['COUNTRY_STATE_COUNTY_LOOKUP'] = load_lookup_json(f.read(), compact_records=compact_records)
+
+    with open(lookup_paths[2], 'r') as f:
+        app.config['HUC_LOOKUP'] = load_lookup_json(f.read(), compact_records=compact_records)
+
+    # Index the lookups for constant time access while rendering pages
+    app.config['LOOKUP_INDEX'] = LookupIndex(app.config['NWIS_CODE_LOOKUP'],
+                                             app.config['COUNTRY_STATE_COUNTY_LOOKUP'],
+                                             app.config['HUC_LOOKUP'])
 
 # Load static assets manifest file, which maps source file names to the
 # corresponding versioned/hashed file name.
@@ -82,3 +101,16 @@ if os.getenv('CONTAINER_RUN', False):
 
 from . import views  # pylint: disable=C0413
 from . import filters  # pylint: disable=C0413
+from . import fragment_cache  # pylint: disable=C0413
+
+# The application without the pre-rendered pages, which `python manage.py prerender` renders the pages with
+page_rendering_wsgi_app = app.wsgi_app
+
+# Serve the pages rendered by `python manage.py prerender`. The routes must be registered first, because the
+# headers of each page are set from its route when the files are added.
+prerendered_pages_dir = app.config.get('PRERENDERED_PAGES_DIR')
+if prerendered_pages_dir and os.path.isdir(prerendered_pages_dir):
+    from whitenoise import WhiteNoise
+    from .prerender import add_prerendered_page_headers  # pylint: disable=C0413
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root=prerendered_pages_dir, index_file=True,
+                              add_headers_function=add_prerendered_page_headers)
@@ -0,0 +1,616 @@
+"""
+Caches used to hold responses from upstream services.
+
+Two cache backends are provided. LRUCache keeps entries in the memory of the current process.
+SQLiteCache keeps entries in a SQLite database file, so all gunicorn workers on a host share them.
+"""
+from collections import OrderedDict
+import hashlib
+import hmac
+import os
+import pickle
+import sqlite3
+import tempfile
+from threading import Event, Lock, Thread, local
+import time
+from urllib.parse import urlencode
+
+from . import app
+from .deadline import DeadlineExceeded, get_remaining_time
+from .transport import record_upstream_failure
+
+
+def make_cache_key(prefix, params):
+    """
+    Build a cache key from a dictionary of query parameters. Parameters are sorted and their values
+    converted to strings so that equivalent dictionaries produce the same key.
+
+    :param str prefix: identifies the service, typically its endpoint
+    :param dict params: query parameters
+    :rtype: str
+    """
+    normalized_params = sorted((str(key), str(value)) for key, value in params.items())
+    return f'{prefix}?{urlencode(normalized_params)}'
+
+
+class CacheBackend:
+    """
+    Interface for a thread safe, size bounded cache which evicts the least recently used entry when full.
+    Each entry expires after its time to live.
+    """
+
+    def get(self, key, default=None):
+        """
+        Return the value stored for key or default if it is missing or expired.
+        :param str key:
+        :param default: value returned on a miss
+        """
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value for key, evicting the least recently used entry if the cache is full.
+        :param str key:
+        :param value:
+        :param int ttl: time to live in seconds. If None, the backend's default time to live is used
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Remove key from the cache if present.
+        :param str key:
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Remove all entries from the cache. The counters are not reset.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """
+        Return the cache counters.
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """
+    Cache backend which keeps entries in the memory of the current process.
+    """
+
+    def __init__(self, max_size=1000, default_ttl=300, clock=time.time):
+        """
+        Constructor method.
+
+        :param int max_size: maximum number of entries to keep
+        :param int default_ttl: time to live in seconds for entries which are set without one
+        :param function clock: returns the current time in seconds
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Return the value stored for key or default if it is missing or expired.
+        :param str key:
+        :param default: value returned on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value for key, evicting the least recently used entry if the cache is full.
+        :param str key:
+        :param value:
+        :param int ttl: time to live in seconds. If None, default_ttl is used
+        """
+        expires = self.clock() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """
+        Remove key from the cache if present.
+        :param str key:
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all entries from the cache. The counters are not reset.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return the cache counters.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def _check_private(path, mode_mask):
+    """
+    Raise ValueError unless path is owned by the current user and none of the permission bits in mode_mask
+    are set.
+    :param str path:
+    :param int mode_mask: permission bits which must not be set
+    """
+    status = os.lstat(path)
+    if status.st_uid != os.geteuid() or status.st_mode & mode_mask:
+        raise ValueError(f'{path} must be owned by the server user and not accessible by other users')
+
+
+def _get_signing_key(path):
+    """
+    Return the key in the file at path, creating the file with a random key if it does not exist. The key is
+    written to a temporary file which is then linked to path, so other processes never read a partial key.
+    :param str path:
+    :rtype: bytes
+    """
+    if not os.path.exists(path):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(os.urandom(32))
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+    _check_private(path, 0o077)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache backend which keeps pickled entries in a SQLite database file. Every process using the same
+    file shares the entries, so the cache is populated once per host rather than once per worker.
+    Hit, miss and eviction counters are for the current process only.
+
+    The database file and its directory must only be accessible by the server user. The directory is created
+    with mode 0700 and the file with mode 0600 if they do not exist. Each entry is signed with HMAC-SHA256
+    using a random key kept in a private file next to the database, and entries with a bad signature are
+    discarded without being unpickled.
+
+    Reads only write to the database when an entry's access time is older than access_resolution, and
+    each process trims the cache to max_size after every eviction_interval entries it sets, so the cache
+    briefly holds more than max_size entries. Database errors are logged and treated as a miss.
+    """
+
+    def __init__(self, path, max_size=1000, default_ttl=300, clock=time.time, access_resolution=60,
+                 eviction_interval=100):
+        """
+        Constructor method.
+
+        :param str path: path of the SQLite database file, or ':memory:'. It is created if it does not exist.
+            ValueError is raised if it or its directory can be accessed by other users.
+        :param int max_size: maximum number of entries to keep
+        :param int default_ttl: time to live in seconds for entries which are set without one
+        :param function clock: returns the current time in seconds
+        :param int access_resolution: seconds within which repeated reads of an entry do not update its access time
+        :param int eviction_interval: number of entries set by this process between evictions
+        """
+        self.path = path
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self.access_resolution = access_resolution
+        self.eviction_interval = eviction_interval
+        self._local = local()
+        self._lock = Lock()
+        self._sets_since_eviction = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._signing_key = os.urandom(32) if path == ':memory:' else self._prepare_files()
+
+    def _prepare_files(self):
+        """
+        Create the directory and database file with private permissions if they are missing, check that
+        they are private and return the signing key.
+        :rtype: bytes
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        _check_private(directory, 0o022)
+        os.close(os.open(self.path, os.O_CREAT | os.O_RDWR | getattr(os, 'O_NOFOLLOW', 0), 0o600))
+        _check_private(self.path, 0o077)
+        return _get_signing_key(f'{self.path}.key')
+
+    def _sign(self, payload):
+        return hmac.new(self._signing_key, payload, hashlib.sha256).digest()
+
+    def _dumps(self, value):
+        """
+        Return the pickled value preceded by its signature.
+        :rtype: bytes
+        """
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return self._sign(payload) + payload
+
+    def _loads(self, data):
+        """
+        Return the value of a signed entry.
+        :param bytes data:
+        :raises ValueError: if the signature does not match
+        """
+        signature, payload = data[:hashlib.sha256().digest_size], data[hashlib.sha256().digest_size:]
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise ValueError('Bad signature')
+        return pickle.loads(payload)
+
+    def _connection(self):
+        """
+        Return a connection for the current thread. A new connection is opened after a fork because
+        SQLite connections must not be shared between processes.
+        :rtype: sqlite3.Connection
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _log_error(self, action, err):
+        self._count('errors')
+        app.logger.warning(f'Upstream cache {action} failed: {err!r}')
+
+    def get(self, key, default=None):
+        now = self.clock()
+        try:
+            connection = self._connection()
+            row = connection.execute('SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[1] <= now:
+                connection.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now))
+                row = None
+            elif row is not None and now - row[2] >= self.access_resolution:
+                connection.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as err:
+            self._log_error('read', err)
+            row = None
+        value = None
+        if row is not None:
+            try:
+                value = self._loads(row[0])
+            except ValueError:
+                app.logger.warning(f'Discarding upstream cache entry {key} with a bad signature')
+                self.delete(key)
+                row = None
+        if row is None:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return value
+
+    def _evict_if_due(self, connection):
+        """
+        Delete the least recently used entries beyond max_size once every eviction_interval entries set.
+        :param sqlite3.Connection connection:
+        """
+        with self._lock:
+            self._sets_since_eviction += 1
+            if self._sets_since_eviction < self.eviction_interval:
+                return
+            self._sets_since_eviction = 0
+        cursor = connection.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+            (self.max_size,)
+        )
+        self._count('evictions', cursor.rowcount)
+
+    def set(self, key, value, ttl=None):
+        now = self.clock()
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        try:
+            connection = self._connection()
+            connection.execute('INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                               (key, self._dumps(value), expires, now))
+            self._evict_if_due(connection)
+        except sqlite3.Error as err:
+            self._log_error('write', err)
+
+    def delete(self, key):
+        try:
+            self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        except sqlite3.Error as err:
+            self._log_error('delete', err)
+
+    def clear(self):
+        try:
+            self._connection().execute('DELETE FROM cache')
+        except sqlite3.Error as err:
+            self._log_error('clear', err)
+
+    def stats(self):
+        try:
+            size = self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        except sqlite3.Error as err:
+            self._log_error('count', err)
+            size = None
+        with self._lock:
+            return {
+                'size': size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'errors': self.errors
+            }
+
+
+def create_cache_backend(backend, max_size, sqlite_path=None):
+    """
+    Create a cache backend.
+
+    :param str backend: 'memory' for a cache in the current process or 'sqlite' for a cache shared by
+        all processes on the host
+    :param int max_size: maximum number of entries to keep
+    :param str sqlite_path: path of the SQLite database file, required for the 'sqlite' backend
+    :rtype: CacheBackend
+    """
+    if backend == 'memory':
+        return LRUCache(max_size=max_size)
+    if backend == 'sqlite':
+        return SQLiteCache(sqlite_path, max_size=max_size)
+    raise ValueError(f'Unknown cache backend {backend}')
+
+
+class _InFlightCall:
+    """
+    A call which is in progress along with its eventual outcome.
+    """
+    # pylint: disable=R0903
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key so that only one of them runs. The other callers wait
+    for it to finish and share its result, or its exception. A waiting caller raises DeadlineExceeded if
+    its own deadline passes first.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = Lock()
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """
+        Return the result of func, or of the call to func already in progress for key.
+
+        :param str key: identifies the call
+        :param function func: function with no arguments
+        :return: result of func
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            if not call.done.wait(get_remaining_time()):
+                raise DeadlineExceeded(f'Deadline passed while waiting for {key}')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def _start_daemon_thread(func):
+    """
+    Run func in a daemon thread.
+    :param function func: function with no arguments
+    """
+    Thread(target=func, daemon=True).start()
+
+
+class ResponseCache:
+    """
+    Caches responses from an upstream service in a cache backend. Concurrent requests for a response
+    which is not cached are coalesced so that the upstream service is called once. Besides serving fresh
+    responses, it can serve a response past its time to live:
+        - stale while revalidate - within stale_while_revalidate seconds after the time to live, the
+          stale response is returned immediately and refreshed in the background.
+        - stale if error - within stale_if_error seconds after the time to live, the stale response is
+          returned if the upstream service fails to return a good response.
+    A stale response is also returned, without calling the upstream service, once the request deadline
+    has passed. A stale response returned for the deadline is recorded as an upstream failure.
+    """
+
+    def __init__(self, store, stale_while_revalidate=0, stale_if_error=0, clock=time.time,
+                 run_in_background=_start_daemon_thread):
+        """
+        Constructor method.
+
+        :param CacheBackend store: cache backend which holds the responses
+        :param int stale_while_revalidate: seconds after the time to live during which a stale response is
+            served while it is refreshed
+        :param int stale_if_error: seconds after the time to live during which a stale response is served
+            when the upstream service fails
+        :param function clock: returns the current time in seconds
+        :param function run_in_background: called with a function of no arguments which refreshes an entry
+        """
+        self.store = store
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self.clock = clock
+        self.run_in_background = run_in_background
+        self._refreshing = set()
+        self._single_flight = SingleFlight()
+        self._lock = Lock()
+        self.stale_hits = 0
+        self.background_refreshes = 0
+
+    def fetch(self, key, loader, ttl):
+        """
+        Return the response for key, calling loader if there is no usable cached response.
+
+        :param str key: cache key
+        :param function loader: function with no arguments which returns a tuple of the response and
+            a boolean which is True if the response is good and can be cached
+        :param int ttl: time to live in seconds of a good response
+        :return: the response
+        """
+        entry = self.store.get(key)
+        now = self.clock()
+        if entry is not None:
+            value, stored_at = entry
+            age = now - stored_at
+            if age < ttl:
+                return value
+            if age < ttl + self.stale_while_revalidate:
+                self._refresh_in_background(key, loader, ttl)
+                self._count_stale_hit()
+                return value
+            if get_remaining_time() == 0:
+                record_upstream_failure(f'{key}: deadline passed, serving stale response')
+                self._count_stale_hit()
+                return value
+
+        try:
+            value, is_good = self._single_flight.do(key, lambda: self._load(key, loader, ttl))
+        except DeadlineExceeded:
+            # The deadline passed while another caller was loading the response
+            record_upstream_failure(f'{key}: deadline passed while waiting for another caller')
+            if entry is not None:
+                self._count_stale_hit()
+                return entry[0]
+            # With the deadline passed, the loader returns its error response without a request
+            value, is_good = loader()
+        if is_good:
+            return value
+        if entry is not None and now - entry[1] < ttl + self.stale_if_error:
+            self._count_stale_hit()
+            return entry[0]
+        return value
+
+    def _load(self, key, loader, ttl):
+        """
+        Call loader and store its response if it is good.
+        :returns
+            - value - the response
+            - is_good - True if the response is good
+        """
+        value, is_good = loader()
+        if is_good:
+            self._store(key, value, ttl)
+        return value, is_good
+
+    def _store(self, key, value, ttl):
+        self.store.set(key, (value, self.clock()), ttl + max(self.stale_while_revalidate, self.stale_if_error))
+
+    def _count_stale_hit(self):
+        with self._lock:
+            self.stale_hits += 1
+
+    def _refresh_in_background(self, key, loader, ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.background_refreshes += 1
+
+        def refresh():
+            try:
+                self._single_flight.do(key, lambda: self._load(key, loader, ttl))
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self.run_in_background(refresh)
+
+    def delete(self, key):
+        """
+        Remove key from the cache.
+        :param str key:
+        """
+        self.store.delete(key)
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        self.store.clear()
+
+    def stats(self):
+        """
+        Return the store counters along with the stale serving counters.
+        :rtype: dict
+        """
+        stats = self.store.stats()
+        with self._lock:
+            stats.update({
+                'stale_hits': self.stale_hits,
+                'background_refreshes': self.background_refreshes,
+                'coalesced': self._single_flight.coalesced
+            })
+        return stats
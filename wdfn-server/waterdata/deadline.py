@@ -0,0 +1,79 @@
+"""
+Deadline for the upstream calls made while handling a request.
+
+The deadline is held in a context variable so that it follows the request into the threads used
+by utils.execute_concurrently. The HTTP transport limits each upstream call to the time remaining.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+from requests.exceptions import Timeout
+
+_DEADLINE = ContextVar('waterdata_deadline', default=None)
+
+
+class DeadlineExceeded(Timeout):
+    """
+    Raised instead of making an upstream request when the deadline has passed. It is a Timeout so
+    callers fall back the same way they do when the upstream is too slow.
+    """
+
+
+def get_remaining_time():
+    """
+    Return the seconds remaining before the current deadline, or None if there is no deadline.
+    :rtype: float or None
+    """
+    expires = _DEADLINE.get()
+    if expires is None:
+        return None
+    return max(expires - time.monotonic(), 0.0)
+
+
+def set_deadline(seconds):
+    """
+    Set a deadline seconds from now. An existing, earlier deadline is kept.
+    :param float seconds:
+    :return: token to pass to reset_deadline
+    """
+    expires = time.monotonic() + seconds
+    current = _DEADLINE.get()
+    if current is not None:
+        expires = min(expires, current)
+    return _DEADLINE.set(expires)
+
+
+def reset_deadline(token):
+    """
+    Restore the deadline which was in effect before set_deadline returned token.
+    :param token:
+    """
+    _DEADLINE.reset(token)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Context manager which sets a deadline seconds from now for the calls made within it.
+    :param float seconds:
+    """
+    token = set_deadline(seconds)
+    try:
+        yield
+    finally:
+        reset_deadline(token)
+
+
+def call_within_deadline(seconds, func, *args):
+    """
+    Call func with args under a deadline seconds from now. If seconds is None, func is called
+    under the current deadline.
+    :param seconds: float or None
+    :param function func:
+    :return: result of func
+    """
+    if seconds is None:
+        return func(*args)
+    with deadline(seconds):
+        return func(*args)
@@ -0,0 +1,170 @@
+"""
+Response headers which let shared caches and CDNs store pages.
+
+When CDN_CACHEABLE_RESPONSES is True, a page is the same for every visitor to its URL. The server does not
+set the banner cookie and does not check the user agent. Each response gets the Cache-Control and Vary
+headers configured for its route and a surrogate key header. The keys in that header name the route and
+the site, state, county, hydrologic unit or network the page shows, so the edge can purge every page
+which depends on one of them. A monitoring-location page also has the keys of its site's county and hydrologic
+unit, so purging either purges the pages of its sites. A page built while an upstream call failed or was skipped
+gets DEGRADED_CACHE_CONTROL instead, so that shared caches soon replace it with a complete page. EdgePurger
+purges keys through the CDN's purge API.
+"""
+from flask import g, request
+from requests.exceptions import RequestException
+
+from . import app
+from .transport import create_session, get_upstream_failures
+
+# Surrogate key prefix for each route argument
+_VIEW_ARG_KEY_PREFIXES = {
+    'site_no': 'site',
+    'state_cd': 'state',
+    'huc_cd': 'huc',
+    'network_cd': 'network'
+}
+
+
+def is_cdn_cacheable():
+    """
+    Return True if responses are made cacheable by shared caches.
+    :rtype: bool
+    """
+    return app.config['CDN_CACHEABLE_RESPONSES']
+
+
+def is_internet_explorer():
+    """
+    Return True if the page should be rendered for Internet Explorer. Pages are not rendered differently
+    for Internet Explorer when they are CDN cacheable, because they would have to vary on the user agent.
+    :rtype: bool
+    """
+    return not is_cdn_cacheable() and request.user_agent.browser == 'msie'
+
+
+def hide_banner_notices():
+    """
+    Return True if the banner notices should be left out of the page because the visitor has seen them.
+    When pages are CDN cacheable, the notices are always included and a script hides them instead.
+    :rtype: bool
+    """
+    return not is_cdn_cacheable() and request.cookies.get('no-show-banner-message') is not None
+
+
+def get_surrogate_key(prefix, *values):
+    """
+    Return the surrogate key for a site, state, county, hydrologic unit or network.
+
+    :param str prefix: kind of key, for example 'site' or 'county'
+    :param values: codes identifying the item
+    :rtype: str
+    """
+    return '/'.join((prefix,) + tuple(str(value) for value in values))
+
+
+def get_site_surrogate_keys(site):
+    """
+    Return the surrogate keys of the county and hydrologic unit which list a site.
+
+    :param dict site: site metadata from the site service
+    :rtype: list of str
+    """
+    keys = []
+    if site.get('state_cd') and site.get('county_cd'):
+        keys.append(get_surrogate_key('county', site['state_cd'], site['county_cd']))
+    if site.get('huc_cd'):
+        keys.append(get_surrogate_key('huc', site['huc_cd']))
+    return keys
+
+
+def add_surrogate_keys(*keys):
+    """
+    Add surrogate keys to the response for the current request.
+    :param keys: surrogate keys
+    """
+    g.setdefault('surrogate_keys', set()).update(keys)
+
+
+def get_surrogate_keys(endpoint, view_args):
+    """
+    Return the surrogate keys for a route and its arguments. Empty arguments, as on the top level
+    pages, do not give keys.
+
+    :param str endpoint: name of the route
+    :param dict view_args: arguments of the route
+    :rtype: list of str
+    """
+    keys = [endpoint]
+    for name, value in view_args.items():
+        if name in _VIEW_ARG_KEY_PREFIXES and value:
+            keys.append(get_surrogate_key(_VIEW_ARG_KEY_PREFIXES[name], value))
+    if view_args.get('state_cd') and view_args.get('county_cd'):
+        keys.append(get_surrogate_key('county', view_args['state_cd'], view_args['county_cd']))
+    return keys
+
+
+def add_cache_headers(response):
+    """
+    Add the Cache-Control, Vary and surrogate key headers for the current route to response if pages are
+    CDN cacheable. Error responses are not stored, and responses built while an upstream call failed or was skipped
+    are only stored briefly.
+
+    :param response: Flask response
+    :return: response
+    """
+    if not is_cdn_cacheable() or request.endpoint is None:
+        return response
+
+    if response.status_code >= 400:
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    cache_control = app.config['CACHE_CONTROL'].get(request.endpoint)
+    if cache_control is not None and get_upstream_failures():
+        cache_control = app.config['DEGRADED_CACHE_CONTROL']
+    if cache_control is not None:
+        response.headers['Cache-Control'] = cache_control
+    for header in app.config['CACHE_VARY'].get(request.endpoint, ()):
+        response.vary.add(header)
+
+    keys = get_surrogate_keys(request.endpoint, request.view_args or {})
+    keys.extend(sorted(g.get('surrogate_keys', set()).difference(keys)))
+    response.headers[app.config['SURROGATE_KEY_HEADER']] = ' '.join(keys)
+    return response
+
+
+class EdgePurger:
+    """
+    Purges surrogate keys from the edge cache by posting them to the purge API of the CDN.
+    """
+
+    def __init__(self, endpoint, headers=None):
+        """
+        Constructor method.
+
+        :param str endpoint: URL of the purge API, or None if there is no edge cache to purge
+        :param dict headers: headers sent with each purge, such as the API token
+        """
+        self.endpoint = endpoint
+        self.headers = headers or {}
+        self.session = create_session('edge_purge')
+
+    def purge(self, keys):
+        """
+        Purge keys from the edge cache.
+
+        :param list keys: surrogate keys
+        :return: True if the edge cache accepted the purge
+        :rtype: bool
+        """
+        if not self.endpoint or not keys:
+            return False
+        try:
+            response = self.session.post(self.endpoint, json={'surrogate_keys': list(keys)}, headers=self.headers)
+        except RequestException as err:
+            app.logger.error(repr(err))
+            return False
+        if response.status_code != 200:
+            app.logger.error(f'Edge cache purge failed with status {response.status_code}')
+            return False
+        return True
@@ -0,0 +1,79 @@
+"""
+Caching of rendered template fragments. Must be imported (via waterdata.__init__) for the `cache` tag to register.
+
+A template wraps an expensive fragment in a `cache` tag, listing the values the fragment depends on:
+
+    {% cache 'description', stations[0].site_no, data_version %}...{% endcache %}
+    {% cache 'county_table', state_cd, ttl=86400 %}...{% endcache %}
+
+The fragment is rendered once and reused by every render of the same template with the same values until its
+time to live, or FRAGMENT_CACHE_TTL, has passed. The values must identify everything the fragment shows, since
+the variables it reads are not part of the key. A fragment is rendered without the cache if a value is undefined
+or FRAGMENT_CACHE_MAX_SIZE is 0.
+"""
+import hashlib
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2.runtime import Undefined
+
+from . import app
+from .cache import LRUCache
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Jinja2 extension adding the `cache` tag. The rendered fragments are kept in the fragment_cache attribute of the
+    environment, and the tag does nothing if it is None.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_args = []
+        ttl = nodes.Const(None)
+        while parser.stream.current.type != 'block_end':
+            if key_args:
+                parser.stream.expect('comma')
+            if parser.stream.current.test('name:ttl') and parser.stream.look().test('assign'):
+                parser.stream.skip(2)
+                ttl = parser.parse_expression()
+                break
+            key_args.append(parser.parse_expression())
+        if not key_args:
+            parser.fail('cache tag requires at least one key argument', lineno)
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('_cache_support', [nodes.Const(parser.name), nodes.List(key_args), ttl])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, template_name, key_args, ttl, caller):
+        """
+        Return the rendered fragment for key_args from the cache, rendering it with caller if it is missing.
+
+        :param str template_name: name of the template containing the fragment
+        :param list key_args: values the fragment depends on
+        :param int ttl: time to live in seconds, or None for the cache's default
+        :param caller: renders the fragment
+        :rtype: str
+        """
+        cache = self.environment.fragment_cache
+        if cache is None or any(isinstance(arg, Undefined) for arg in key_args):
+            return caller()
+
+        key = 'fragment:' + hashlib.sha256(repr((template_name, key_args)).encode('utf-8')).hexdigest()
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            cache.set(key, fragment, ttl)
+        return fragment
+
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+if app.config.get('FRAGMENT_CACHE_MAX_SIZE'):
+    app.jinja_env.fragment_cache = LRUCache(max_size=app.config['FRAGMENT_CACHE_MAX_SIZE'],
+                                            default_ttl=app.config['FRAGMENT_CACHE_TTL'])
@@ -3,13 +3,18 @@ Utility functions and classes for working with
 USGS water services.
 
 """
-from datetime import datetime
 import itertools
+import operator
+import re
+from types import MappingProxyType
 
-from flask import url_for
 import pendulum
 
 from .constants import US_STATES
+from .lookups import index_state_abbreviations
+
+
+_STATE_ABBREVIATIONS = index_state_abbreviations(US_STATES)
 
 
 def get_state_abbreviation(state_full_name):
@@ -20,98 +25,117 @@ def get_state_abbreviation(state_full_name):
     :return: state two letter abbreviation
     :rtype: str
     """
-    state = filter(lambda record: record['name'] == state_full_name, US_STATES)
-    try:
-        state_abbrev = next(state).get('abbreviation')
-    except StopIteration:
-        state_abbrev = None
-    return state_abbrev
+    return _STATE_ABBREVIATIONS.get(state_full_name)
 
 
-def get_disambiguated_values(location, code_lookups, country_state_county_lookups, huc_lookups):
+def _get_disambiguated_value(key, value, location, lookup_index):
     """
-    Convert values for keys that contains codes to human readable names using the lookups
+    Convert the value for key in location to a human readable name using the lookups
+    :param str key:
+    :param str value:
     :param dict location:
-    :param dict code_lookups:
-    :param dict country_state_county_lookups:
+    :param waterdata.lookups.LookupIndex lookup_index:
     :rtype: dict
     """
+    country_code = location.get('country_cd')
+    state_code = location.get('state_cd')
 
-    def get_state_name(country_code, state_code):
-        """
-        Return the name of the state with country_code and state_code
-        :param str country_code:
-        :param str state_code:
-        :rtype: str
-        """
-        country_lookup = country_state_county_lookups.get(country_code, {})
-        state_lookup = country_lookup.get('state_cd', {})
+    if key == 'state_cd' and country_code and state_code:
+        state_name = lookup_index.get_state_name(country_code, state_code)
+        return {
+            'name': state_name or state_code,
+            'abbreviation': lookup_index.get_state_abbreviation(state_name),
+            'code': state_code if state_name != state_code else None
+        }
 
-        return state_lookup.get(state_code, {}).get('name')
+    if key == 'district_cd' and country_code and value:
+        state_name = lookup_index.get_state_name(country_code, value)
+        return {
+            'name': state_name or value,
+            'abbreviation': lookup_index.get_state_abbreviation(state_name),
+            'code': value if state_name != value else None
+        }
 
-    transformed_location = {}
+    if key == 'county_cd' and country_code and state_code:
+        county_name = lookup_index.get_county_name(country_code, state_code, value)
+        return {
+            'name': county_name or value,
+            'code': value if county_name != value else None
+        }
 
-    country_code = location.get('country_cd')
-    state_code = location.get('state_cd')
-    county_code = location.get('county_cd')
-    district_code = location.get('district_cd')
-
-    for (key, value) in location.items():
-        if key == 'state_cd' and country_code and state_code:
-            state_name = get_state_name(country_code, state_code)
-            transformed_value = {
-                'name': state_name or state_code,
-                'abbreviation': get_state_abbreviation(state_name),
-                'code': state_code if state_name != state_code else None
-            }
+    if lookup_index.has_code_table(key):
+        if key == 'parm_grp_cd':
+            value_dict = lookup_index.get_code(key, value)
+            # if a value can't be found for a parameter group code (usually because there isn't a parameter group),
+            # try looking it up based on the value of the parameter code
+            if value_dict is None:
+                parameter_metadata = lookup_index.get_code('parm_cd', location['parm_cd']) or {}
+                value_dict = {'name': parameter_metadata.get('group', value)}
+        else:
+            value_dict = lookup_index.get_code(key, value) or {'name': value}
+        return dict(code=value, **value_dict)
+
+    if key == 'huc_cd':
+        return {
+            'name': lookup_index.get_huc_name(value),
+            'code': value,
+            'url': lookup_index.get_huc_url(value)
+        }
 
-        elif key == 'district_cd' and country_code and district_code:
-            state_name = get_state_name(country_code, district_code)
-            transformed_value = {
-                'name': state_name or district_code,
-                'abbreviation': get_state_abbreviation(state_name),
-                'code': district_code if state_name != district_code else None
-            }
+    return {
+        'name': value,
+        'code': value
+    }
 
-        elif key == 'county_cd' and country_code and state_code and country_code:
-            country_lookup = country_state_county_lookups.get(country_code, {})
-            state_lookup = country_lookup.get('state_cd', {}).get(state_code, {})
-            county_lookup = state_lookup.get('county_cd', {})
 
-            county_name = county_lookup.get(county_code, {}).get('name')
-            transformed_value = {
-                'name': county_name or county_code,
-                'code': county_code if county_name != county_code else None
-            }
+def get_disambiguated_values(location, lookup_index):
+    """
+    Convert values for keys that contains codes to human readable names using the lookups
+    :param dict location:
+    :param waterdata.lookups.LookupIndex lookup_index:
+    :rtype: dict
+    """
+    return {
+        key: _get_disambiguated_value(key, value, location, lookup_index)
+        for (key, value) in location.items()
+    }
 
-        elif key in code_lookups:
-            if key == 'parm_grp_cd':
-                value_dict = code_lookups.get(key).get(value)
-                # if a value can't be found for a parameter group code (usually because there isn't a parameter group),
-                # try looking it up based on the value of the parameter code
-                if value_dict is None:
-                    parm_code = location['parm_cd']
-                    parameter_metadata = code_lookups.get('parm_cd').get(parm_code) or {}
-                    value_dict = {'name': parameter_metadata.get('group', value)}
-            else:
-                value_dict = code_lookups.get(key).get(value) or {'name': value}
-            transformed_value = dict(code=value, **value_dict)
-
-        elif key == 'huc_cd':
-            transformed_value = {
-                'name': huc_lookups['hucs'].get(value, {}).get('huc_nm'),
-                'code': value,
-                'url': url_for('hydrological_unit', huc_cd=value)
-            }
 
-        else:
-            transformed_value = {
-                'name': value,
-                'code': value
-            }
-        transformed_location[key] = transformed_value
+# Keys whose human readable value depends on other values in the location
+_LOCATION_KEYS = ('state_cd', 'district_cd', 'county_cd')
 
-    return transformed_location
+
+def get_disambiguated_series(dataseries, lookup_index):
+    """
+    Convert the values of every series in a series catalog to human readable names using the lookups.
+    The values repeat heavily between series, so each distinct value is converted once and the
+    resulting read only mapping is shared by all of the series with it.
+
+    :param iterable dataseries: series catalog, a list of dict
+    :param waterdata.lookups.LookupIndex lookup_index:
+    :return: list with a dict for each series like the one returned by get_disambiguated_values, with read only
+        mappings as the values
+    :rtype: list
+    """
+    translations = {}
+    disambiguated_series = []
+    for series in dataseries:
+        disambiguated = {}
+        for (key, value) in series.items():
+            if key == 'parm_grp_cd':
+                context = series.get('parm_cd')
+            elif key in _LOCATION_KEYS:
+                context = (series.get('country_cd'), series.get('state_cd'))
+            else:
+                context = None
+            translation_key = (key, value, context)
+            translation = translations.get(translation_key)
+            if translation is None:
+                translation = MappingProxyType(_get_disambiguated_value(key, value, series, lookup_index))
+                translations[translation_key] = translation
+            disambiguated[key] = translation
+        disambiguated_series.append(disambiguated)
+    return disambiguated_series
 
 
 def build_linked_data(location_number, location_name, agency_code, latitude, longitude, available_parameter_codes):
@@ -156,6 +180,55 @@ def build_linked_data(location_number, location_name, agency_code, latitude, lon
     return linked_data
 
 
+# Dates in the series catalog are YYYY, YYYY-MM or YYYY-MM-DD. Comparing them as strings orders them by date.
+_SERIES_DATE_PATTERN = re.compile(r'(\d{4})(?:-(\d{2})(?:-(\d{2}))?)?')
+
+
+def _parse_series_date(date_string):
+    """
+    Parse a date from the series catalog into a pendulum DateTime at midnight UTC, the same as pendulum.parse
+    but without the overhead of detecting the format for the common fixed formats.
+
+    :param str date_string:
+    :rtype: pendulum.DateTime
+    """
+    match = _SERIES_DATE_PATTERN.fullmatch(date_string)
+    if match is None:
+        return pendulum.parse(date_string)
+    year, month, day = match.groups()
+    return pendulum.datetime(int(year), int(month or 1), int(day or 1))
+
+
+def _get_date_extent(date_strings, extent):
+    """
+    Return the earliest or latest of date_strings as a pendulum DateTime. If all of the dates have a fixed
+    format, they are compared as strings and only the result is parsed.
+
+    :param list date_strings:
+    :param function extent: min or max
+    :rtype: pendulum.DateTime
+    """
+    if all(_SERIES_DATE_PATTERN.fullmatch(date_string) for date_string in date_strings):
+        return _parse_series_date(extent(date_strings))
+    return extent(_parse_series_date(date_string) for date_string in date_strings)
+
+
+def _group_series(dataseries, key):
+    """
+    Group dataseries by key in a single pass.
+
+    :param iterable dataseries:
+    :param function key: returns the value to group a series by
+    :return: pairs of a key value and the list of series with it, sorted by the key value. The series
+        in each list are in their original order.
+    :rtype: list
+    """
+    groups = {}
+    for series in dataseries:
+        groups.setdefault(key(series), []).append(series)
+    return sorted(groups.items(), key=operator.itemgetter(0))
+
+
 def _collapse_series_by_column(grouped_series, sort_data_col):
     """
     For each grouped series, take each of its timeseries and
@@ -167,44 +240,22 @@ def _collapse_series_by_column(grouped_series, sort_data_col):
     10 years, gets shut down, but is started back up and site visits
     resume).
 
-    :param itertools.groupby grouped_series: dataseries grouped by some value (e.g. parameter group, data type, etc.)
+    :param list grouped_series: pairs of a value (e.g. parameter group, data type, etc.) and the dataseries with it
     :param str sort_data_col: value of a key in the time series data
     :return: groupings with one entry for each unique value within a data column/key
     :rtype: dict
 
     """
-    def key_sort(item):
-        """
-        sort by some code
-
-        :param item:
-        :return:
-
-        """
-        return item[sort_data_col]['code']
-
     rolled_up_series = {}
     # for each parameter group grouping...
     for key, grp in grouped_series:
-        series_by_pcode = itertools.groupby(sorted(grp, key=key_sort), key=key_sort)
         # for each grouping within a key grouping...
         grp_pcode_series = []
-        for key_pc, pc_grp in series_by_pcode:
-            series_by_pc = list(pc_grp)
-            # determine the start and end dates of the group
-            start_dates = [
-                pendulum.parse(series['begin_date']['code']) for series in series_by_pc
-            ]
-            end_dates = [
-                pendulum.parse(series['end_date']['code']) for series in series_by_pc
-            ]
-            # collect data types
-            data_types = [series['data_type_cd']['name'] for series in series_by_pc]
-
+        for key_pc, series_by_pc in _group_series(grp, lambda series: series[sort_data_col]['code']):
             pc_metadata = {
-                'start_date': min(start_dates),
-                'end_date': max(end_dates),
-                'data_types': data_types,
+                'start_date': _get_date_extent([series['begin_date']['code'] for series in series_by_pc], min),
+                'end_date': _get_date_extent([series['end_date']['code'] for series in series_by_pc], max),
+                'data_types': [series['data_type_cd']['name'] for series in series_by_pc],
                 'parameter_code': key_pc,
                 'parameter_name': series_by_pc[0]['parm_cd']['name']
             }
@@ -259,25 +310,16 @@ def rollup_dataseries(dataseries):
     # handle annual reports, peak value measurements, site visits, and active ground water sites
     # basically everything that doesn't have a parameter code and parameter group separate from the
     # data types that do.
-    display_series = list(itertools.filterfalse(
-        lambda x: x['parm_cd']['code'] == '' and x['parm_grp_cd']['code'] == '',
-        dataseries
-    ))
-    other_series = [s for s in dataseries if s not in display_series]
+    display_series = []
+    other_series = []
+    for series in dataseries:
+        if series['parm_cd']['code'] == '' and series['parm_grp_cd']['code'] == '':
+            other_series.append(series)
+        else:
+            display_series.append(series)
 
     # handle series with parameter groups
-    def parm_grp_sort(item):
-        """
-        parameter group name sort function
-
-        :param item:
-        :return:
-
-        """
-        return item['parm_grp_cd']['name']
-
-    pg_sorted = sorted(display_series, key=parm_grp_sort)
-    pg_grouped_series = itertools.groupby(pg_sorted, key=parm_grp_sort)
+    pg_grouped_series = _group_series(display_series, lambda series: series['parm_grp_cd']['name'])
     rollup_by_parameter_grp = _collapse_series_by_column(pg_grouped_series, 'parm_cd')
     # remove the `ALL` parameter group
     # it's the amalgamation of the other groups
@@ -285,23 +327,42 @@ def rollup_dataseries(dataseries):
     parameter_groups = [_extract_group_summary_data(v, k) for k, v in rollup_by_parameter_grp.items()]
 
     # handle series that don't have parameter codes and parameter group codes
-    def data_type_sort(item):
-        """
-        data type code name sort function
-
-        :param item:
-        :return:
-
-        """
-        return item['data_type_cd']['name']
-
-    dt_sorted = sorted(other_series, key=data_type_sort)
-    dt_grouped_series = itertools.groupby(dt_sorted, key=data_type_sort)
+    dt_grouped_series = _group_series(other_series, lambda series: series['data_type_cd']['name'])
     rollup_by_dt_code = _collapse_series_by_column(dt_grouped_series, 'data_type_cd')
     data_type_groups = [_extract_group_summary_data(v) for v in rollup_by_dt_code.values()]
 
     return parameter_groups + data_type_groups
 
+def get_period_of_record_by_data_type(site_records):
+    """
+    Return the merged period of record for each unique parameter code of each data type in site_records,
+    in a single pass over site_records. The begin and end dates are ISO YYYY-MM-DD strings so they are
+    compared as strings.
+
+    :param site_records: list of period of records (dict), typically for a single site
+    :return: dict - keys are the data type codes and the value for each is a dict like the one returned
+        by get_period_of_record_by_parm_cd
+    """
+    records_by_data_type = {}
+    for record in site_records:
+        records_by_parm_cd = records_by_data_type.setdefault(record['data_type_cd'], {})
+        begin_date = record['begin_date']
+        end_date = record['end_date']
+        merged_record = records_by_parm_cd.get(record['parm_cd'])
+        if merged_record is None:
+            records_by_parm_cd[record['parm_cd']] = {
+                'begin_date': begin_date,
+                'end_date': end_date
+            }
+        else:
+            if begin_date < merged_record['begin_date']:
+                merged_record['begin_date'] = begin_date
+            if end_date > merged_record['end_date']:
+                merged_record['end_date'] = end_date
+
+    return records_by_data_type
+
+
 def get_period_of_record_by_parm_cd(site_records, data_type_cd='uv'):
     """
     Return the merged period of record for each unique parameter code with data_type_cd in site_records
@@ -310,37 +371,9 @@ def get_period_of_record_by_parm_cd(site_records, data_type_cd='uv'):
     :param data_type_cd: string - only site_records items that match data_type_cd will be considered by this function
     :return: dict - keys are the parmCds and the value for each will be a dict with begin_date and end_date keys.
     """
-
-    date_format = '%Y-%m-%d'
-    data_type_records_iter = filter(lambda record: record['data_type_cd'] == data_type_cd, site_records)
-    mapped_records_iter = map(lambda record: {
-        'parm_cd': record['parm_cd'],
-        'begin_date': record['begin_date'],
-        'end_date': record['end_date']
-    }, data_type_records_iter)
-
-    records_by_parm_cd = {}
-    for record in mapped_records_iter:
-        this_parm_cd = record['parm_cd']
-
-        if this_parm_cd in records_by_parm_cd:
-            record_begin_datetime = datetime.strptime(record['begin_date'], date_format)
-            current_begin_datetime = datetime.strptime(records_by_parm_cd[this_parm_cd]['begin_date'], date_format)
-            if record_begin_datetime < current_begin_datetime:
-                records_by_parm_cd[this_parm_cd]['begin_date'] = record['begin_date']
-
-            record_end_datetime = datetime.strptime(record['end_date'], date_format)
-            current_end_datetime = datetime.strptime(records_by_parm_cd[this_parm_cd]['end_date'], date_format)
-            if record_end_datetime > current_end_datetime:
-                records_by_parm_cd[this_parm_cd]['end_date'] = record['end_date']
-
-        else:
-            records_by_parm_cd[this_parm_cd] = {
-                'begin_date': record['begin_date'],
-                'end_date': record['end_date']
-            }
-
-    return records_by_parm_cd
+    return get_period_of_record_by_data_type(
+        record for record in site_records if record['data_type_cd'] == data_type_cd
+    ).get(data_type_cd, {})
 
 
 def get_default_parameter_code(iv_parameters, gw_parameters):
@@ -0,0 +1,740 @@
+"""
+Index over the NWIS code, country/state/county and HUC lookups.
+
+The lookups are nested dictionaries read from the JSON files in DATA_DIR. LookupIndex is built once at
+startup and answers the questions asked of them while rendering a page with a single dictionary access.
+
+The NWIS code tables are parsed one at a time, when they are first used, from the spans of the file recorded by
+write_json_file_offsets when the file was generated.
+
+The lookups can also be compiled into a SQLite file with compile_lookup_store. SQLiteLookupIndex has the
+same accessors as LookupIndex but reads the entries from the file on demand, so workers do not parse
+the JSON files at startup or keep all of the lookups in memory.
+"""
+from collections.abc import Mapping
+import hashlib
+import json
+import math
+import os
+from threading import Lock, local
+import sqlite3
+
+from flask import url_for
+
+from .cache import LRUCache
+from .constants import US_STATES
+from .utils import RdbRecord
+
+
+def index_state_abbreviations(states):
+    """
+    Return a dictionary of state name to two letter abbreviation. If a name appears more than once,
+    the first abbreviation is used.
+
+    :param list states: list of dict with name and abbreviation keys
+    :rtype: dict
+    """
+    return {state['name']: state.get('abbreviation') for state in reversed(states)}
+
+
+def load_lookup_json(text, compact_records=False):
+    """
+    Parse a lookup JSON document. The lookups repeat the same strings and small objects many times, so
+    equal string values are stored once and objects with equal contents are shared. The returned lookups
+    must not be modified.
+
+    :param str text: JSON document
+    :param bool compact_records: if True, objects which do not contain other objects are returned as
+        read only waterdata.utils.RdbRecord mappings which share one key index for each set of keys
+    :rtype: dict
+    """
+    strings = {}
+    objects = {}
+    key_indexes = {}
+
+    def share_object(pairs):
+        pairs = tuple(
+            (key, strings.setdefault(value, value) if isinstance(value, str) else value)
+            for key, value in pairs
+        )
+        try:
+            shared_object = objects.get(pairs)
+            hashable = True
+        except TypeError:
+            shared_object = None
+            hashable = False
+        if shared_object is not None:
+            return shared_object
+
+        if compact_records and pairs and not any(isinstance(value, Mapping) for _, value in pairs):
+            keys = tuple(key for key, _ in pairs)
+            key_index = key_indexes.get(keys)
+            if key_index is None:
+                key_index = key_indexes[keys] = {key: position for position, key in enumerate(keys)}
+            shared_object = RdbRecord(key_index, tuple(value for _, value in pairs))
+        else:
+            shared_object = dict(pairs)
+        if hashable:
+            objects[pairs] = shared_object
+        return shared_object
+
+    return json.loads(text, object_pairs_hook=share_object)
+
+
+def index_json_object(text):
+    """
+    Return the position of each value in the top level object of a JSON document, so that the values can be
+    parsed one at a time. The values are scanned but not kept.
+
+    :param str text: JSON document containing an object
+    :return: dict of key to the start and end of its value in text
+    :rtype: dict
+    """
+    # The nested values only need to be skipped over, so nothing is built for their objects
+    decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: None)
+    whitespace = json.decoder.WHITESPACE
+    spans = {}
+    position = whitespace.match(text, 0).end()
+    if text[position:position + 1] != '{':
+        raise ValueError('Expected a JSON object')
+    position = whitespace.match(text, position + 1).end()
+    if text[position:position + 1] == '}':
+        return spans
+    while True:
+        if text[position:position + 1] != '"':
+            raise ValueError(f'Expected a key at {position}')
+        key, position = json.decoder.scanstring(text, position + 1)
+        position = whitespace.match(text, position).end()
+        if text[position:position + 1] != ':':
+            raise ValueError(f'Expected ":" at {position}')
+        start = whitespace.match(text, position + 1).end()
+        _, end = decoder.raw_decode(text, start)
+        spans[key] = (start, end)
+        position = whitespace.match(text, end).end()
+        delimiter = text[position:position + 1]
+        position = whitespace.match(text, position + 1).end()
+        if delimiter == '}':
+            return spans
+        if delimiter != ',':
+            raise ValueError(f'Expected "," or "}}" at {position}')
+
+
+def _get_json_file_offsets_path(path):
+    """
+    Return the path of the file holding the offsets of the values in the JSON file at path.
+    :param str path:
+    :rtype: str
+    """
+    return f'{os.path.splitext(path)[0]}.offsets.json'
+
+
+def _scan_json_file(data):
+    """
+    Return the byte offsets of the start and end of each value in the top level object of a JSON file.
+    :param bytes data: content of the file, encoded in UTF-8
+    :rtype: dict
+    """
+    text = data.decode('utf-8')
+    spans = index_json_object(text)
+    if len(text) == len(data):
+        # Every character is a single byte
+        return spans
+    offsets = {}
+    position = byte_position = 0
+    for key, (start, end) in spans.items():
+        start_offset = byte_position + len(text[position:start].encode('utf-8'))
+        end_offset = start_offset + len(text[start:end].encode('utf-8'))
+        offsets[key] = (start_offset, end_offset)
+        position, byte_position = end, end_offset
+    return offsets
+
+
+def write_json_file_offsets(path):
+    """
+    Scan the JSON file at path, which contains an object, and write the byte offsets of its values next to it
+    with the digest of its content. Run it whenever the file is generated, so that index_json_file does not
+    scan the file.
+    :param str path:
+    :return: number of values
+    :rtype: int
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offsets = _scan_json_file(data)
+    offsets_path = _get_json_file_offsets_path(path)
+    temporary_path = f'{offsets_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump({'sha256': hashlib.sha256(data).hexdigest(), 'offsets': offsets}, f, indent=2)
+        f.write('\n')
+    os.replace(temporary_path, offsets_path)
+    return len(offsets)
+
+
+def index_json_file(path):
+    """
+    Return the byte offsets of the start and end of each value in the top level object of a JSON file. The
+    offsets written by write_json_file_offsets are used if they were written for the current content of the
+    file, otherwise the file is scanned.
+    :param str path:
+    :return: dict of key to the start and end of its value in the file
+    :rtype: dict
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        with open(_get_json_file_offsets_path(path), 'r') as f:
+            recorded = json.load(f)
+        if recorded['sha256'] == hashlib.sha256(data).hexdigest():
+            return {key: (start, end) for key, (start, end) in recorded['offsets'].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return _scan_json_file(data)
+
+
+class LazyLookupTables(Mapping):
+    """
+    Read only mapping of table name to lookup table, such as the NWIS code tables, which loads each table
+    the first time it is accessed. Checking whether a table exists does not load it. The names of the
+    tables which have been loaded are in loaded_tables.
+    """
+
+    def __init__(self, get_table_names, load_table):
+        """
+        Constructor method.
+
+        :param function get_table_names: returns the names of the tables. Called once, on first use.
+        :param function load_table: returns the table with the name passed to it
+        """
+        self._get_table_names = get_table_names
+        self._load_table = load_table
+        self._table_names = None
+        self._tables = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_json_file(cls, path, compact_records=False):
+        """
+        Return a LazyLookupTables for a JSON file containing an object of tables. The file is not read until
+        the tables are first used. The offsets of the tables are then found with index_json_file, and each
+        table is read from its offsets and parsed with load_lookup_json when it is first accessed.
+        :param str path:
+        :param bool compact_records: passed to load_lookup_json
+        :rtype: LazyLookupTables
+        """
+        offsets = {}
+
+        def get_table_names():
+            offsets.update(index_json_file(path))
+            return list(offsets)
+
+        def load_table(table):
+            start, end = offsets[table]
+            with open(path, 'rb') as f:
+                f.seek(start)
+                text = f.read(end - start).decode('utf-8')
+            return load_lookup_json(text, compact_records=compact_records)
+
+        return cls(get_table_names, load_table)
+
+    @property
+    def table_names(self):
+        """
+        Names of the tables.
+        :rtype: tuple
+        """
+        if self._table_names is None:
+            with self._lock:
+                if self._table_names is None:
+                    self._table_names = tuple(self._get_table_names())
+        return self._table_names
+
+    @property
+    def loaded_tables(self):
+        """
+        Names of the tables which have been loaded, in the order they were first used.
+        :rtype: list
+        """
+        return list(self._tables)
+
+    def load_all(self):
+        """
+        Load every table, for example before forking worker processes which then share them.
+        """
+        for table in self.table_names:
+            self[table]  # pylint: disable=W0104
+
+    def __getitem__(self, table):
+        try:
+            return self._tables[table]
+        except KeyError:
+            pass
+        if table not in self.table_names:
+            raise KeyError(table)
+        with self._lock:
+            if table not in self._tables:
+                self._tables[table] = self._load_table(table)
+        return self._tables[table]
+
+    def __contains__(self, table):
+        return table in self.table_names
+
+    def __iter__(self):
+        return iter(self.table_names)
+
+    def __len__(self):
+        return len(self.table_names)
+
+
+class LookupIndex:
+    """
+    Constant time accessors for the lookups.
+    """
+
+    def __init__(self, code_lookups, country_state_county_lookups, huc_lookups, states=US_STATES):
+        """
+        Constructor method.
+
+        :param dict code_lookups: NWIS code tables, keyed by RDB column name
+        :param dict country_state_county_lookups: states and counties keyed by country code
+        :param dict huc_lookups: hydrologic units keyed by HUC and the HUCs of each class
+        :param list states: list of dict with the name and abbreviation of each state
+        """
+        self.code_lookups = code_lookups
+        self.huc_lookups = huc_lookups
+        self._state_abbreviations = index_state_abbreviations(states)
+        self._states = {}
+        self._counties = {}
+        for country_cd, country_lookup in country_state_county_lookups.items():
+            for state_cd, state_lookup in country_lookup.get('state_cd', {}).items():
+                self._states[(country_cd, state_cd)] = state_lookup
+                for county_cd, county_lookup in state_lookup.get('county_cd', {}).items():
+                    self._counties[(country_cd, state_cd, county_cd)] = county_lookup
+        self._state_children = {
+            country_cd: country_lookup.get('state_cd', {})
+            for country_cd, country_lookup in country_state_county_lookups.items()
+        }
+        self._hucs = huc_lookups.get('hucs', {})
+        self._huc_classes = huc_lookups.get('classes', {})
+
+    def get_state_abbreviation(self, state_name):
+        """
+        Return a state's two letter abbreviation or None.
+        :param str state_name:
+        :rtype: str
+        """
+        return self._state_abbreviations.get(state_name)
+
+    def get_states(self, country_cd):
+        """
+        Return the states of a country keyed by state code.
+        :param str country_cd:
+        :rtype: dict
+        """
+        return self._state_children.get(country_cd, {})
+
+    def get_state(self, country_cd, state_cd):
+        """
+        Return the lookup for a state, including its counties, or None.
+        :param str country_cd:
+        :param str state_cd:
+        :rtype: dict
+        """
+        return self._states.get((country_cd, state_cd))
+
+    def get_state_name(self, country_cd, state_cd):
+        """
+        Return the name of a state or None.
+        :param str country_cd:
+        :param str state_cd:
+        :rtype: str
+        """
+        return (self._states.get((country_cd, state_cd)) or {}).get('name')
+
+    def get_county(self, country_cd, state_cd, county_cd):
+        """
+        Return the lookup for a county or None.
+        :param str country_cd:
+        :param str state_cd:
+        :param str county_cd:
+        :rtype: dict
+        """
+        return self._counties.get((country_cd, state_cd, county_cd))
+
+    def get_county_name(self, country_cd, state_cd, county_cd):
+        """
+        Return the name of a county or None.
+        :param str country_cd:
+        :param str state_cd:
+        :param str county_cd:
+        :rtype: str
+        """
+        return (self._counties.get((country_cd, state_cd, county_cd)) or {}).get('name')
+
+    def get_huc(self, huc_cd):
+        """
+        Return the lookup for a hydrologic unit or None.
+        :param str huc_cd:
+        :rtype: dict
+        """
+        return self._hucs.get(huc_cd)
+
+    def get_huc_name(self, huc_cd):
+        """
+        Return the name of a hydrologic unit or None.
+        :param str huc_cd:
+        :rtype: str
+        """
+        return (self._hucs.get(huc_cd) or {}).get('huc_nm')
+
+    def get_huc_class(self, huc_class):
+        """
+        Return the HUCs of a class, for example HUC2.
+        :param str huc_class:
+        :rtype: list
+        """
+        return self._huc_classes.get(huc_class, [])
+
+    @staticmethod
+    def get_huc_url(huc_cd):
+        """
+        Return the URL of the page for a hydrologic unit. Must be called within a request.
+        :param str huc_cd:
+        :rtype: str
+        """
+        return url_for('hydrological_unit', huc_cd=huc_cd)
+
+    def has_code_table(self, table):
+        """
+        Return True if there is an NWIS code table for the RDB column, table.
+        :param str table:
+        :rtype: bool
+        """
+        return table in self.code_lookups
+
+    def get_code_table(self, table):
+        """
+        Return the NWIS code table for an RDB column, keyed by code.
+        :param str table:
+        :rtype: dict
+        """
+        return self.code_lookups.get(table, {})
+
+    def get_code(self, table, code):
+        """
+        Return the lookup for code in an NWIS code table or None.
+        :param str table:
+        :param str code:
+        :rtype: dict
+        """
+        return self.code_lookups.get(table, {}).get(code)
+
+    def get_code_name(self, table, code):
+        """
+        Return the name of code in an NWIS code table or None.
+        :param str table:
+        :param str code:
+        :rtype: str
+        """
+        return (self.code_lookups.get(table, {}).get(code) or {}).get('name')
+
+
+# Version of the layout of the lookup store. Stores with another version are not used.
+LOOKUP_STORE_VERSION = 1
+
+
+def _get_source_signature(source_paths):
+    """
+    Return the size and modification time of each source file, used to tell if a lookup store is current.
+    :param list source_paths:
+    :rtype: list
+    """
+    signature = []
+    for source_path in source_paths:
+        stat = os.stat(source_path)
+        signature.append([os.path.basename(source_path), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def _iter_lookup_entries(code_lookups, country_state_county_lookups, huc_lookups):
+    """
+    Generate the (map, key, value) entries of a lookup store. Each map is a dictionary of the lookups.
+    """
+    for table, codes in code_lookups.items():
+        yield 'code_table', table, None
+        for code, code_lookup in codes.items():
+            yield f'code:{table}', code, code_lookup
+    for country_cd, country_lookup in country_state_county_lookups.items():
+        for state_cd, state_lookup in country_lookup.get('state_cd', {}).items():
+            yield f'state:{country_cd}', state_cd, state_lookup
+            for county_cd, county_lookup in state_lookup.get('county_cd', {}).items():
+                yield f'county:{country_cd}:{state_cd}', county_cd, county_lookup
+    for huc_cd, huc_lookup in huc_lookups.get('hucs', {}).items():
+        yield 'huc', huc_cd, huc_lookup
+    for huc_class, huc_cds in huc_lookups.get('classes', {}).items():
+        yield 'huc_class', huc_class, huc_cds
+
+
+def compile_lookup_store(store_path, code_lookup_path, country_state_county_lookup_path, huc_lookup_path):
+    """
+    Compile the lookup files into a SQLite file with one row for each entry of each lookup. The file
+    is written next to store_path and then moved into place, so running workers keep reading the old file.
+
+    :param str store_path: path of the SQLite file to create
+    :param str code_lookup_path: path of the NWIS code lookup JSON file
+    :param str country_state_county_lookup_path: path of the country, state and county lookup JSON file
+    :param str huc_lookup_path: path of the HUC lookup JSON file
+    :return: number of entries written
+    :rtype: int
+    """
+    source_paths = [code_lookup_path, country_state_county_lookup_path, huc_lookup_path]
+    lookups = []
+    for source_path in source_paths:
+        with open(source_path, 'r') as f:
+            lookups.append(json.loads(f.read()))
+
+    temporary_path = f'{store_path}.{os.getpid()}.tmp'
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    connection = sqlite3.connect(temporary_path)
+    try:
+        connection.execute('CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)')
+        connection.execute(
+            'CREATE TABLE entries (map TEXT, key TEXT, position INTEGER, value TEXT, PRIMARY KEY (map, key)) '
+            'WITHOUT ROWID'
+        )
+        connection.execute('CREATE INDEX entries_position ON entries (map, position)')
+        entries = (
+            (map_name, key, position, json.dumps(value, separators=(',', ':')))
+            for position, (map_name, key, value) in enumerate(_iter_lookup_entries(*lookups))
+        )
+        connection.executemany('INSERT INTO entries VALUES (?, ?, ?, ?)', entries)
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)', [
+            ('version', str(LOOKUP_STORE_VERSION)),
+            ('sources', json.dumps(_get_source_signature(source_paths)))
+        ])
+        count = connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temporary_path, store_path)
+    return count
+
+
+def is_lookup_store_current(store_path, *source_paths):
+    """
+    Return True if store_path is a lookup store compiled from the current versions of source_paths.
+    :param str store_path:
+    :param source_paths: paths of the lookup JSON files
+    :rtype: bool
+    """
+    if not os.path.exists(store_path):
+        return False
+    try:
+        connection = sqlite3.connect(f'file:{store_path}?mode=ro', uri=True)
+        try:
+            metadata = dict(connection.execute('SELECT key, value FROM metadata'))
+        finally:
+            connection.close()
+        return (metadata.get('version') == str(LOOKUP_STORE_VERSION) and
+                json.loads(metadata.get('sources', '[]')) == _get_source_signature(source_paths))
+    except (sqlite3.Error, OSError, ValueError):
+        return False
+
+
+_MISSING = object()
+
+
+class SQLiteLookupIndex:
+    """
+    Lookup index which reads the entries from a SQLite file compiled by compile_lookup_store as they
+    are needed. Entries which have been read are kept in a size bounded LRU cache. It has the same
+    accessors as LookupIndex.
+    """
+
+    def __init__(self, store_path, cache_size=5000, states=US_STATES):
+        """
+        Constructor method.
+
+        :param str store_path: path of the SQLite file
+        :param int cache_size: maximum number of entries to keep in memory
+        :param list states: list of dict with the name and abbreviation of each state
+        """
+        self.store_path = store_path
+        self._cache = LRUCache(max_size=cache_size, default_ttl=math.inf)
+        self._local = local()
+        self._state_abbreviations = index_state_abbreviations(states)
+        self._code_tables = frozenset(self.get_code_table_names())
+
+    def _connection(self):
+        """
+        Return a read only connection for the current thread, opening a new one after a fork.
+        :rtype: sqlite3.Connection
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(f'file:{self.store_path}?mode=ro&immutable=1', uri=True)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _get(self, map_name, key):
+        """
+        Return the value of key in a map of the store or None.
+        :param str map_name:
+        :param str key:
+        """
+        cache_key = f'{map_name}\x1f{key}'
+        value = self._cache.get(cache_key, _MISSING)
+        if value is _MISSING:
+            row = self._connection().execute(
+                'SELECT value FROM entries WHERE map = ? AND key = ?', (map_name, key)
+            ).fetchone()
+            value = json.loads(row[0]) if row else None
+            self._cache.set(cache_key, value)
+        return value
+
+    def _get_map(self, map_name):
+        """
+        Return all of the entries of a map of the store as a dict, in the order of the lookup file.
+        :param str map_name:
+        :rtype: dict
+        """
+        cache_key = f'{map_name}\x1f'
+        value = self._cache.get(cache_key)
+        if value is None:
+            rows = self._connection().execute(
+                'SELECT key, value FROM entries WHERE map = ? ORDER BY position', (map_name,)
+            )
+            value = {key: json.loads(entry_value) for key, entry_value in rows}
+            self._cache.set(cache_key, value)
+        return value
+
+    def get_state_abbreviation(self, state_name):
+        """
+        Return a state's two letter abbreviation or None.
+        :param str state_name:
+        :rtype: str
+        """
+        return self._state_abbreviations.get(state_name)
+
+    def get_states(self, country_cd):
+        """
+        Return the states of a country keyed by state code.
+        :param str country_cd:
+        :rtype: dict
+        """
+        return self._get_map(f'state:{country_cd}')
+
+    def get_state(self, country_cd, state_cd):
+        """
+        Return the lookup for a state, including its counties, or None.
+        :param str country_cd:
+        :param str state_cd:
+        :rtype: dict
+        """
+        return self._get(f'state:{country_cd}', state_cd)
+
+    def get_state_name(self, country_cd, state_cd):
+        """
+        Return the name of a state or None.
+        :param str country_cd:
+        :param str state_cd:
+        :rtype: str
+        """
+        return (self.get_state(country_cd, state_cd) or {}).get('name')
+
+    def get_county(self, country_cd, state_cd, county_cd):
+        """
+        Return the lookup for a county or None.
+        :param str country_cd:
+        :param str state_cd:
+        :param str county_cd:
+        :rtype: dict
+        """
+        return self._get(f'county:{country_cd}:{state_cd}', county_cd)
+
+    def get_county_name(self, country_cd, state_cd, county_cd):
+        """
+        Return the name of a county or None.
+        :param str country_cd:
+        :param str state_cd:
+        :param str county_cd:
+        :rtype: str
+        """
+        return (self.get_county(country_cd, state_cd, county_cd) or {}).get('name')
+
+    def get_huc(self, huc_cd):
+        """
+        Return the lookup for a hydrologic unit or None.
+        :param str huc_cd:
+        :rtype: dict
+        """
+        return self._get('huc', huc_cd)
+
+    def get_huc_name(self, huc_cd):
+        """
+        Return the name of a hydrologic unit or None.
+        :param str huc_cd:
+        :rtype: str
+        """
+        return (self.get_huc(huc_cd) or {}).get('huc_nm')
+
+    def get_huc_class(self, huc_class):
+        """
+        Return the HUCs of a class, for example HUC2.
+        :param str huc_class:
+        :rtype: list
+        """
+        return self._get('huc_class', huc_class) or []
+
+    get_huc_url = staticmethod(LookupIndex.get_huc_url)
+
+    def has_code_table(self, table):
+        """
+        Return True if there is an NWIS code table for the RDB column, table.
+        :param str table:
+        :rtype: bool
+        """
+        return table in self._code_tables
+
+    def get_code_table_names(self):
+        """
+        Return the names of the NWIS code tables.
+        :rtype: list
+        """
+        return list(self._get_map('code_table'))
+
+    def get_code_table(self, table):
+        """
+        Return the NWIS code table for an RDB column, keyed by code.
+        :param str table:
+        :rtype: dict
+        """
+        return self._get_map(f'code:{table}')
+
+    def get_code(self, table, code):
+        """
+        Return the lookup for code in an NWIS code table or None.
+        :param str table:
+        :param str code:
+        :rtype: dict
+        """
+        if table not in self._code_tables:
+            return None
+        return self._get(f'code:{table}', code)
+
+    def get_code_name(self, table, code):
+        """
+        Return the name of code in an NWIS code table or None.
+        :param str table:
+        :param str code:
+        :rtype: str
+        """
+        return (self.get_code(table, code) or {}).get('name')
+
+    def stats(self):
+        """
+        Return the counters of the in memory cache of entries.
+        :rtype: dict
+        """
+        return self._cache.stats()
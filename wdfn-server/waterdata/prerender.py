@@ -0,0 +1,215 @@
+"""
+Pre-rendering of the state, county and hydrologic unit pages.
+
+Apart from the lists of monitoring locations, these pages only depend on the lookups and the templates.
+`python manage.py prerender` renders them into a directory with one index.html for each page URL. When
+PRERENDERED_PAGES_DIR is set to that directory, WhiteNoise serves the pages without calling the application.
+A manifest in the directory records a fingerprint of what the pages were rendered from. Later runs do nothing
+until the fingerprint changes, and then only rewrite the pages whose content changed.
+"""
+import hashlib
+import json
+import os
+import re
+
+from flask import url_for
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import Client
+
+from . import app, page_rendering_wsgi_app, __version__
+from .edge_cache import get_surrogate_keys
+
+MANIFEST_FILENAME = 'prerender-manifest.json'
+
+# Routes which are pre-rendered
+PRERENDERED_ENDPOINTS = ('states_counties', 'hydrological_unit')
+
+HUC_CLASSES = ('HUC2', 'HUC4', 'HUC6', 'HUC8')
+
+_CONFIG_REFERENCE_PATTERN = re.compile(r'config\.([A-Z][A-Z0-9_]*)')
+
+
+def get_prerender_paths(lookup_index):
+    """
+    Return the URL paths of the pages to pre-render.
+
+    :param lookup_index: waterdata.lookups.LookupIndex or SQLiteLookupIndex
+    :rtype: list of str
+    """
+    paths = []
+    with app.test_request_context():
+        if app.config['STATE_COUNTY_PAGES_ENABLED']:
+            paths.append(url_for('states_counties'))
+            for state_cd in lookup_index.get_states('US'):
+                paths.append(url_for('states_counties', state_cd=state_cd))
+                state = lookup_index.get_state('US', state_cd) or {}
+                paths.extend(url_for('states_counties', state_cd=state_cd, county_cd=county_cd)
+                             for county_cd in state.get('county_cd', {}))
+        if app.config['HYDROLOGIC_PAGES_ENABLED']:
+            paths.append(url_for('hydrological_unit'))
+            for huc_class in HUC_CLASSES:
+                paths.extend(url_for('hydrological_unit', huc_cd=huc_cd)
+                             for huc_cd in lookup_index.get_huc_class(huc_class))
+    return paths
+
+
+def _get_template_files():
+    """
+    Return the names and paths of the template files, sorted by name.
+    :rtype: list of tuple
+    """
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    paths = (
+        os.path.join(directory, filename)
+        for directory, _, filenames in os.walk(template_dir)
+        for filename in filenames
+    )
+    return sorted((os.path.relpath(path, template_dir), path) for path in paths)
+
+
+def get_prerender_fingerprint(lookup_paths):
+    """
+    Return a fingerprint of everything the pre-rendered pages are built from: the application version, the
+    lookup files, the templates, the asset manifest and the settings which the templates read.
+
+    :param list lookup_paths: paths of the lookup files
+    :rtype: str
+    """
+    digest = hashlib.sha256(__version__.encode('utf-8'))
+    config_names = {'STATIC_ROOT', 'STATE_COUNTY_PAGES_ENABLED', 'HYDROLOGIC_PAGES_ENABLED'}
+    source_files = [(os.path.basename(path), path) for path in lookup_paths] + _get_template_files()
+    if app.config.get('ASSET_MANIFEST_PATH'):
+        source_files.append(('asset manifest', app.config['ASSET_MANIFEST_PATH']))
+    for name, path in source_files:
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest.update(name.encode('utf-8'))
+        digest.update(hashlib.sha256(content).digest())
+        if path.endswith('.html'):
+            config_names.update(_CONFIG_REFERENCE_PATTERN.findall(content.decode('utf-8')))
+    # The lookups are covered by their files
+    config_names.discard('LOOKUP_INDEX')
+    settings = sorted((name, repr(app.config.get(name))) for name in config_names)
+    digest.update(repr(settings).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _get_page_file(output_dir, path):
+    """
+    Return the file a page is written to.
+    :param str output_dir:
+    :param str path: URL path of the page
+    :rtype: str
+    """
+    return os.path.join(output_dir, *[part for part in path.split('/') if part], 'index.html')
+
+
+def _write_if_changed(filename, content):
+    """
+    Write content to filename unless the file already has that content.
+    :param str filename:
+    :param bytes content:
+    :return: True if the file was written
+    :rtype: bool
+    """
+    try:
+        with open(filename, 'rb') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temp_filename = f'{filename}.tmp'
+    with open(temp_filename, 'wb') as f:
+        f.write(content)
+    os.replace(temp_filename, filename)
+    return True
+
+
+def _read_manifest(output_dir):
+    """
+    Return the manifest of the pages in output_dir, or an empty manifest.
+    :param str output_dir:
+    :rtype: dict
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'fingerprint': None, 'pages': []}
+
+
+def prerender_pages(output_dir, lookup_paths, force=False):
+    """
+    Render the state, county and hydrologic unit pages into output_dir. The pages are rendered as they are
+    when responses are CDN cacheable, since they are served to every visitor. Pages which no longer exist
+    are removed. The pages are rendered by the application even when output_dir is served as
+    PRERENDERED_PAGES_DIR.
+
+    :param str output_dir: directory of the pre-rendered pages
+    :param list lookup_paths: paths of the lookup files
+    :param bool force: if True, render the pages even if the fingerprint has not changed
+    :returns: None if the pages are up to date, otherwise a dict of the number of pages rendered, written
+        and removed
+    """
+    cdn_cacheable = app.config['CDN_CACHEABLE_RESPONSES']
+    app.config['CDN_CACHEABLE_RESPONSES'] = True
+    try:
+        fingerprint = get_prerender_fingerprint(lookup_paths)
+        manifest = _read_manifest(output_dir)
+        if not force and manifest['fingerprint'] == fingerprint and \
+                all(os.path.exists(_get_page_file(output_dir, path)) for path in manifest['pages']):
+            return None
+
+        # Render with the application itself, since the pages already written would be served in its place
+        client = Client(page_rendering_wsgi_app, app.response_class, use_cookies=False)
+        pages = []
+        written = 0
+        for path in get_prerender_paths(app.config['LOOKUP_INDEX']):
+            response = client.get(path)
+            if response.status_code != 200:
+                app.logger.warning(f'Not pre-rendering {path}, which returned {response.status_code}')
+                continue
+            pages.append(path)
+            if _write_if_changed(_get_page_file(output_dir, path), response.get_data()):
+                written += 1
+    finally:
+        app.config['CDN_CACHEABLE_RESPONSES'] = cdn_cacheable
+
+    removed = 0
+    for path in set(manifest['pages']).difference(pages):
+        try:
+            os.remove(_get_page_file(output_dir, path))
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    _write_if_changed(os.path.join(output_dir, MANIFEST_FILENAME),
+                      json.dumps({'fingerprint': fingerprint, 'pages': pages}, indent=1).encode('utf-8'))
+    return {
+        'rendered': len(pages),
+        'written': written,
+        'removed': removed
+    }
+
+
+def add_prerendered_page_headers(headers, path, url):  # pylint: disable=W0613
+    """
+    WhiteNoise add_headers_function which gives a pre-rendered page the Cache-Control and surrogate key
+    headers of the route which renders it, when responses are CDN cacheable.
+
+    :param headers: headers of the static file
+    :param str path: path of the file
+    :param str url: URL path the file is served at
+    """
+    if not app.config['CDN_CACHEABLE_RESPONSES']:
+        return
+    try:
+        endpoint, view_args = app.url_map.bind('localhost').match(url)
+    except HTTPException:
+        return
+    if endpoint not in PRERENDERED_ENDPOINTS:
+        return
+    cache_control = app.config['CACHE_CONTROL'].get(endpoint)
+    if cache_control is not None:
+        headers['Cache-Control'] = cache_control
+    headers[app.config['SURROGATE_KEY_HEADER']] = ' '.join(get_surrogate_keys(endpoint, view_args))
@@ -1,6 +1,9 @@
 """
 Service to return metadata about available camera images
 """
+import os
+from threading import Event, Lock, Thread
+import time
 
 from .. import app
 from ..utils import execute_get_request
@@ -31,7 +34,8 @@ def fetch_camera_metadata():
     """
     result = {}
     resp = execute_get_request(ML_CAMERA_ENDPOINT,
-                               'php/getAllEnabledCameras.php')
+                               'php/getAllEnabledCameras.php',
+                               upstream='camera')
     if resp.status_code == 200:
         try:
             result = resp.json()
@@ -40,6 +44,101 @@ def fetch_camera_metadata():
     return result
 
 
+class CameraMetadataStore:
+    """
+    Holds the camera details for all enabled cameras, indexed by USGS site number. The metadata is
+    refreshed by a background thread so that looking up a site never waits for the camera service.
+    The thread is started by start_camera_metadata_refresh when a server process starts.
+    An empty or failed fetch is retried after a shorter interval and the previous index is kept.
+    """
+
+    def __init__(self, fetch=fetch_camera_metadata, ttl=60 * 60, negative_ttl=5 * 60):
+        """
+        Constructor method.
+
+        :param function fetch: returns the camera metadata as a dictionary with a 'data' list
+        :param int ttl: seconds between refreshes after a successful fetch
+        :param int negative_ttl: seconds before retrying after an empty or failed fetch
+        """
+        self.fetch = fetch
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cameras_by_site = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._refresher_pid = None
+        self.last_refresh = None
+
+    def refresh(self):
+        """
+        Fetch the camera metadata and swap in a new index.
+        :return: True if any camera metadata was fetched
+        :rtype: bool
+        """
+        cameras_by_site = {}
+        for camera in self.fetch().get('data', []):
+            cameras_by_site.setdefault(camera['usgsSiteNumber'], []).append(_get_camera_details(camera))
+        if not cameras_by_site:
+            return False
+
+        with self._lock:
+            self._cameras_by_site = {site_no: tuple(cameras) for site_no, cameras in cameras_by_site.items()}
+            self.last_refresh = time.time()
+        return True
+
+    def _refresh_periodically(self):
+        while not self._stop.is_set():
+            try:
+                is_good = self.refresh()
+            except Exception as err:  # pylint: disable=W0703
+                app.logger.error(f'Camera metadata refresh failed: {err!r}')
+                is_good = False
+            self._stop.wait(self.ttl if is_good else self.negative_ttl)
+
+    def start(self):
+        """
+        Start the background refresh thread if it is not running in this process. A forked worker
+        does not inherit its parent's threads so each process starts its own.
+        """
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher_pid = os.getpid()
+        self._stop.clear()
+        Thread(target=self._refresh_periodically, name='camera-metadata', daemon=True).start()
+
+    def stop(self):
+        """
+        Stop the background refresh thread after its current refresh.
+        """
+        self._stop.set()
+        with self._lock:
+            self._refresher_pid = None
+
+    def get_cameras(self, site_no):
+        """
+        Return the camera details for site_no, which are empty until the first refresh has completed.
+        :param str site_no: USGS site number
+        :rtype: tuple of dict
+        """
+        return self._cameras_by_site.get(site_no, ())
+
+
+camera_metadata_store = CameraMetadataStore(  # pylint: disable=C0103
+    ttl=app.config['MONITORING_LOCATION_CAMERA_METADATA_TTL'],
+    negative_ttl=app.config['MONITORING_LOCATION_CAMERA_METADATA_RETRY']
+)
+
+
+def start_camera_metadata_refresh():
+    """
+    Start refreshing the camera metadata in this process if the camera feature is enabled. Called by the
+    server when a worker starts, not while handling a request.
+    """
+    if app.config['MONITORING_LOCATION_CAMERA_ENABLED']:
+        camera_metadata_store.start()
+
+
 def get_monitoring_location_camera_details(site_no):
     """
     Returns meta data for the camera images available for site_no
@@ -47,9 +146,4 @@ def get_monitoring_location_camera_details(site_no):
     :return list of dictionaries with keys for links to med_video, small_video, and details
     :rtype list
     """
-    if not app.config.get('MONITORING_LOCATION_CAMERA_METADATA', {}):
-        app.config['MONITORING_LOCATION_CAMERA_METADATA'] = fetch_camera_metadata().get('data', [])
-
-    ml_camera_data = list(filter(lambda x: x['usgsSiteNumber'] == site_no,
-                                 app.config['MONITORING_LOCATION_CAMERA_METADATA']))
-    return list(map(_get_camera_details, ml_camera_data))
+    return list(camera_metadata_store.get_cameras(site_no))
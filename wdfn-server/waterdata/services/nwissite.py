@@ -3,51 +3,113 @@ Class and functions for calling NWIS services and working with
 the returned data.
 
 """
-from requests import exceptions as request_exceptions, Session
-from ..utils import parse_rdb
+from requests import exceptions as request_exceptions
+from ..cache import make_cache_key
+from ..utils import iter_rdb_lines, parse_rdb_records, parse_rdb_table
 
 from .. import app
+from ..transport import create_session
+
+# The RDB columns needed to list the sites in a hydrologic unit or county
+LISTING_COLUMNS = ('agency_cd', 'site_no', 'station_nm', 'site_tp_cd')
 
 
 class SiteService:
     """
     Provides access to the NWIS site service
     """
+    _DEFAULT_PARAMS = {
+        'format': 'rdb'
+    }
 
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, cache=None, cache_ttls=None):
         """
         Constructor method.
 
         :param str endpoint: the scheme, host and path to the NWIS site service
+        :param waterdata.cache.ResponseCache cache: optional cache for successful responses
+        :param dict cache_ttls: time to live in seconds for each query type ('site_data', 'period_of_record',
+            'huc_sites', 'county_sites'). Query types which are missing are not cached.
         """
         self.endpoint = endpoint
-        self.session = Session()
+        self.session = create_session('nwis_site')
+        self.cache = cache
+        self.cache_ttls = cache_ttls or {}
 
-    def get(self, params):
+    def get(self, params, query_type=None, columns=None, columnar=False):
         """
-        Returns a tuple containing the request status code and a list of dictionaries that represent the contents of
-        RDB file
+        Returns a tuple containing the request status code and a list of read only mappings that represent the
+        contents of RDB file. Successful responses are cached if the service has a cache and a time to live for
+        query_type. The returned list may be shared with other callers so it should not be modified.
 
         :param dict params:
+        :param str query_type: key into cache_ttls for the time to live of the response
+        :param columns: optional iterable of the RDB columns to keep. If None, all columns are kept.
+        :param bool columnar: if True, a successful response is returned as a waterdata.utils.RdbTable
         :returns
             - status_code - status code returned from the service request
             - reason - string
-            - site_data - list of dictionaries
+            - site_data - list of waterdata.utils.RdbRecord or waterdata.utils.RdbTable
+        """
+        default_params = dict(self._DEFAULT_PARAMS, **params)
+
+        ttl = self.cache_ttls.get(query_type)
+        if self.cache is None or ttl is None:
+            result, _ = self._fetch(default_params, columns, columnar)
+            return result
+        return self.cache.fetch(self._get_cache_key(default_params, columns, columnar),
+                                lambda: self._fetch(default_params, columns, columnar),
+                                ttl)
+
+    def invalidate(self, params, columns=None, columnar=False):
+        """
+        Remove the cached response to a request, so the next identical request is sent to the site service.
+        The arguments are those passed to get.
+
+        :param dict params:
+        :param columns: optional iterable of the RDB columns kept
+        :param bool columnar: if True, the response was requested as a waterdata.utils.RdbTable
+        """
+        if self.cache is not None:
+            self.cache.delete(self._get_cache_key(dict(self._DEFAULT_PARAMS, **params), columns, columnar))
+
+    def _get_cache_key(self, params, columns=None, columnar=False):
+        """
+        Return the cache key of a request.
+        :param dict params: query parameters including the defaults
+        :param columns: optional iterable of the RDB columns kept
+        :param bool columnar:
+        :rtype: str
+        """
+        cache_prefix = self.endpoint if columns is None else f'{self.endpoint}[{",".join(sorted(columns))}]'
+        if columnar:
+            cache_prefix = f'{cache_prefix}[columnar]'
+        return make_cache_key(cache_prefix, params)
+
+    def _fetch(self, params, columns=None, columnar=False):
+        """
+        Request params from the site service.
+        :param dict params:
+        :param columns: optional iterable of the RDB columns to keep
+        :param bool columnar: if True, parse a successful response into an RdbTable
+        :returns
+            - result - tuple of the status code, reason and list of dictionaries
+            - is_good - True if the request was successful
         """
         app.logger.debug(f'Requesting data from {self.endpoint}')
-        default_params = {
-            'format': 'rdb'
-        }
-        default_params.update(params)
         try:
-            response = self.session.get(self.endpoint, params=default_params)
+            response = self.session.get(self.endpoint, params=params)
         except (request_exceptions.Timeout, request_exceptions.ConnectionError) as err:
             app.logger.error(repr(err))
-            return 500, repr(err), None
+            return (500, repr(err), None), False
         if response.status_code == 200:
-            return 200, response.reason, list(parse_rdb(response.iter_lines(decode_unicode=True)))
+            if columnar:
+                site_data = parse_rdb_table(iter_rdb_lines(response), columns=columns)
+            else:
+                site_data = list(parse_rdb_records(iter_rdb_lines(response), columns=columns))
+            return (200, response.reason, site_data), True
 
-        return response.status_code, response.reason, []
+        return (response.status_code, response.reason, []), False
 
     def get_site_data(self, site_no, agency_cd=''):
         """
@@ -60,13 +122,7 @@ class SiteService:
             - reason - string
             - site_metadata - list of dict representing the data returned in the rdb file
         """
-        params = {
-            'sites': site_no,
-            'siteOutput': 'expanded'
-        }
-        if agency_cd:
-            params['agencyCd'] = agency_cd
-        return self.get(params)
+        return self.get(self._get_site_params(site_no, agency_cd, siteOutput='expanded'), query_type='site_data')
 
     def get_period_of_record(self, site_no, agency_cd=''):
         """
@@ -79,14 +135,33 @@ class SiteService:
             - reason - string
             - periodOfRecord - list of dict representing the period of record for the data available at the site
         """
-        params = {
-            'sites': site_no,
-            'seriesCatalogOutput': True,
-            'siteStatus': 'all'
-        }
+        return self.get(self._get_site_params(site_no, agency_cd, seriesCatalogOutput=True, siteStatus='all'),
+                        query_type='period_of_record')
+
+    def invalidate_site(self, site_no, agency_cd=''):
+        """
+        Remove the cached metadata and period of record of a site, as requested with agency_cd and without
+        an agency.
+        :param str site_no: site identifier
+        :param str agency_cd: identifier for the agency that owns the site
+        """
+        for agency in {'', agency_cd}:
+            self.invalidate(self._get_site_params(site_no, agency, siteOutput='expanded'))
+            self.invalidate(self._get_site_params(site_no, agency, seriesCatalogOutput=True, siteStatus='all'))
+
+    @staticmethod
+    def _get_site_params(site_no, agency_cd, **params):
+        """
+        Return the query parameters for a request about a site.
+        :param str site_no: site identifier
+        :param str agency_cd: identifier for the agency that owns the site, which may be blank
+        :param params: other query parameters
+        :rtype: dict
+        """
+        site_params = dict({'sites': site_no}, **params)
         if agency_cd:
-            params['agencyCd'] = agency_cd
-        return self.get(params)
+            site_params['agencyCd'] = agency_cd
+        return site_params
 
     def get_huc_sites(self, huc_cd):
         """
@@ -97,11 +172,18 @@ class SiteService:
         :returns: all sites in the specified HUC
             - status - status code from response
             - reason - string
-            - sites - list of dict representing the sites in huc_cd
+            - sites - waterdata.utils.RdbTable of the sites in huc_cd
         """
         return self.get({
             'huc': huc_cd
-        })
+        }, query_type='huc_sites', columns=LISTING_COLUMNS, columnar=True)
+
+    def invalidate_huc_sites(self, huc_cd):
+        """
+        Remove the cached sites of a hydrologic unit.
+        :param str huc_cd: hydrologic unit code
+        """
+        self.invalidate({'huc': huc_cd}, columns=LISTING_COLUMNS, columnar=True)
 
     def get_county_sites(self, state_county_cd):
         """
@@ -111,8 +193,15 @@ class SiteService:
         :returns: all sites in the specified county
             - status - status code from response
             - reason - string
-            - sites - list of dict representing the site in state_county_cd
+            - sites - waterdata.utils.RdbTable of the sites in state_county_cd
          """
         return self.get({
             'countyCd': state_county_cd
-        })
+        }, query_type='county_sites', columns=LISTING_COLUMNS, columnar=True)
+
+    def invalidate_county_sites(self, state_county_cd):
+        """
+        Remove the cached sites of a county.
+        :param str state_county_cd: FIPS ID for a statecounty
+        """
+        self.invalidate({'countyCd': state_county_cd}, columns=LISTING_COLUMNS, columnar=True)
@@ -1,9 +1,10 @@
 """
 Class and functions for calling the observations OGC endpoint for monitoring location collections
 """
-from requests import exceptions as request_exceptions, Session
+from requests import exceptions as request_exceptions
 
 from .. import app
+from ..transport import create_session
 
 
 class MonitoringLocationNetworkService:
@@ -11,9 +12,18 @@ class MonitoringLocationNetworkService:
     Provide access to the OGC Observations API service for networks of monitoring locations
     """
 
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, cache=None, cache_ttl=None):
+        """
+        Constructor method.
+
+        :param str endpoint: the scheme, host and path to the observations collections endpoint
+        :param waterdata.cache.ResponseCache cache: optional cache for successful responses
+        :param int cache_ttl: time to live in seconds of cached responses
+        """
         self.endpoint = endpoint
-        self.session = Session()
+        self.session = create_session('observations')
+        self.cache = cache
+        self.cache_ttl = cache_ttl
 
     def get_networks(self, network_cd=''):
         """
@@ -24,17 +34,39 @@ class MonitoringLocationNetworkService:
         a dictionary containing a list of collections.
         """
         url = f"{self.endpoint}{network_cd}"
+        if self.cache is None or self.cache_ttl is None:
+            network_data, _ = self._fetch(url)
+            return network_data
+        return self.cache.fetch(url, lambda: self._fetch(url), self.cache_ttl)
+
+    def invalidate_networks(self, network_cd=''):
+        """
+        Remove the cached network data for the specified network, or the list of networks if network_cd is blank.
+
+        :param network_cd: collections-id
+        """
+        if self.cache is not None:
+            self.cache.delete(f'{self.endpoint}{network_cd}')
+
+    def _fetch(self, url):
+        """
+        Request the network data from url.
+        :param str url:
+        :returns
+            - network_data - dict
+            - is_good - True if the request was successful
+        """
         try:
             response = self.session.get(url, params={'f': 'json'})
         except (request_exceptions.Timeout, request_exceptions.ConnectionError) as err:
             app.logger.error(repr(err))
-            return {}
+            return {}, False
 
         if response.status_code != 200:
-            return {}
+            return {}, False
         try:
             resp_json = response.json()
         except ValueError:
-            return {}
+            return {}, False
         else:
-            return resp_json
+            return resp_json, True
@@ -1,18 +1,28 @@
 """
 Helpers to retrieve SIFTA cooperator data.
 """
-from requests import exceptions as request_exceptions, Session
+from requests import exceptions as request_exceptions
 
 from .. import app
+from ..transport import create_session
 
 
 class SiftaService:
     """
     Provide access to a service that returns cooperator data
     """
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, cache=None, cache_ttl=None):
+        """
+        Constructor method.
+
+        :param str endpoint: the scheme, host and path to the cooperator service
+        :param waterdata.cache.ResponseCache cache: optional cache for successful responses
+        :param int cache_ttl: time to live in seconds of cached responses
+        """
         self.endpoint = endpoint
-        self.session = Session()
+        self.session = create_session('cooperator')
+        self.cache = cache
+        self.cache_ttl = cache_ttl
 
     def get_cooperators(self, site_no):
         """
@@ -22,17 +32,39 @@ class SiftaService:
         :return Array of dict
         """
         url = f'{self.endpoint}{site_no}'
+        if self.cache is None or self.cache_ttl is None:
+            cooperators, _ = self._fetch(url)
+            return cooperators
+        return self.cache.fetch(url, lambda: self._fetch(url), self.cache_ttl)
+
+    def invalidate_cooperators(self, site_no):
+        """
+        Remove the cached cooperators of a site.
+
+        :param site_no: USGS site number
+        """
+        if self.cache is not None:
+            self.cache.delete(f'{self.endpoint}{site_no}')
+
+    def _fetch(self, url):
+        """
+        Request the cooperators from url.
+        :param str url:
+        :returns
+            - cooperators - list of dict
+            - is_good - True if the request was successful
+        """
         try:
             response = self.session.get(url)
         except (request_exceptions.Timeout, request_exceptions.ConnectionError) as err:
             app.logger.error(repr(err))
-            return []
+            return [], False
 
         if response.status_code != 200:
-            return []
+            return [], False
         try:
             resp_json = response.json()
         except ValueError:
-            return []
+            return [], False
         else:
-            return resp_json.get('Customers', [])
+            return resp_json.get('Customers', []), True
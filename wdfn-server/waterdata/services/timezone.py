@@ -1,20 +1,219 @@
 """
 Helpers to retrieve timezone information for a location
 """
-from requests import exceptions as request_exceptions, Session
+from array import array
+import json
+import math
+
+from requests import exceptions as request_exceptions
 
 from .. import app
+from ..cache import LRUCache
+from ..transport import create_session
+
+
+def _orientation(x1, y1, x2, y2, x, y):
+    """
+    Return a positive number if the point is left of the edge from (x1, y1) to (x2, y2), a negative number if it
+    is right of it and 0 if it is on the line through the edge.
+    :rtype: float
+    """
+    return (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)
+
+
+class _TimeZonePolygon:
+    """
+    A polygon, with its holes, belonging to a time zone. The positions of all the rings are kept in a single array
+    of longitude, latitude pairs, and an edge is identified by the index of the pair it starts from.
+    """
+    # pylint: disable=R0903
+    __slots__ = ('time_zone', 'coordinates', 'edges')
+
+    def __init__(self, time_zone, rings):
+        self.time_zone = time_zone
+        self.coordinates = array('d')
+        self.edges = array('I')
+        for ring in rings:
+            first = len(self.coordinates) // 2
+            for position in ring:
+                self.coordinates.extend((position[0], position[1]))
+            if ring[0][:2] != ring[-1][:2]:
+                self.coordinates.extend((ring[0][0], ring[0][1]))
+            self.edges.extend(range(first, len(self.coordinates) // 2 - 1))
+
+    def edge(self, index):
+        """
+        Return the positions at the ends of an edge.
+        :param int index:
+        :rtype: tuple of float (x1, y1, x2, y2)
+        """
+        offset = 2 * index
+        return tuple(self.coordinates[offset:offset + 4])
+
+
+class LocalTimeZoneResolver:
+    """
+    Resolves the IANA time zone of a point from time zone boundary polygons held in memory. Each polygon is
+    indexed in a grid of cells: a cell keeps the edges of the polygon which touch it and whether its bottom right
+    corner is inside the polygon. A cell the polygon covers without any edge is marked as inside. A point is inside
+    the polygon if an odd number of edges cross the path from the corner of its cell, up the right side of the
+    cell and left to the point, so a lookup only tests the edges in one cell. The results are memoized.
+    """
+
+    def __init__(self, features, cell_size=1.0, memo_size=10000):
+        """
+        Constructor method.
+
+        :param list features: GeoJSON features with Polygon or MultiPolygon geometries and a tzid property
+        :param float cell_size: size in degrees of the grid cells
+        :param int memo_size: maximum number of points whose time zone is memoized
+        """
+        self.cell_size = cell_size
+        self._grid = {}
+        self._memo = LRUCache(max_size=memo_size, default_ttl=math.inf)
+        for feature in features:
+            time_zone = feature['properties']['tzid']
+            geometry = feature['geometry']
+            if geometry['type'] == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry['type'] == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+            for rings in polygons:
+                self._add_polygon(_TimeZonePolygon(time_zone, rings))
+
+    @classmethod
+    def from_geojson_file(cls, path, cell_size=1.0, memo_size=10000):
+        """
+        Create a resolver from a GeoJSON FeatureCollection file such as the ones published by
+        https://github.com/evansiroky/timezone-boundary-builder. The parsed file is released once it is indexed.
+        :param str path: path to the GeoJSON file
+        :param float cell_size: size in degrees of the grid cells
+        :param int memo_size: maximum number of points whose time zone is memoized
+        :rtype: LocalTimeZoneResolver
+        """
+        with open(path, 'r') as f:
+            feature_collection = json.load(f)
+        return cls(feature_collection.pop('features'), cell_size=cell_size, memo_size=memo_size)
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _edge_cells(self, x1, y1, x2, y2):
+        """
+        Return the cells the edge touches, including the cells it only touches at their sides or corners.
+        :rtype: generator of (col, row)
+        """
+        size = self.cell_size
+        for row in range(math.ceil(min(y1, y2) / size) - 1, math.floor(max(y1, y2) / size) + 1):
+            if y1 == y2:
+                start, end = 0.0, 1.0
+            else:
+                start, end = sorted(((row * size - y1) / (y2 - y1), ((row + 1) * size - y1) / (y2 - y1)))
+                start, end = max(start, 0.0), min(end, 1.0)
+                if start > end:
+                    continue
+            # Widen the clipped edge slightly so that rounding does not drop a cell it touches at a corner
+            low_x, high_x = sorted((x1 + start * (x2 - x1), x1 + end * (x2 - x1)))
+            low_x, high_x = low_x - size * 1e-9, high_x + size * 1e-9
+            for col in range(math.ceil(low_x / size) - 1, math.floor(high_x / size) + 1):
+                yield col, row
+
+    def _add_polygon(self, polygon):
+        size = self.cell_size
+        cell_edges = {}
+        # Edges crossing the grid line at the bottom of each row, with the corners of the row they pass right of
+        crossings = {}
+        for index in polygon.edges:
+            x1, y1, x2, y2 = polygon.edge(index)
+            for cell in self._edge_cells(x1, y1, x2, y2):
+                cell_edges.setdefault(cell, array('I')).append(index)
+            for row in range(math.ceil(min(y1, y2) / size), math.floor(max(y1, y2) / size) + 1):
+                if (y1 > row * size) != (y2 > row * size):
+                    crossings.setdefault(row, []).append((x1, y1, x2, y2))
+
+        def is_corner_inside(col, row):
+            x, y = (col + 1) * size, row * size
+            return sum(1 for x1, y1, x2, y2 in crossings.get(row, [])
+                       if _orientation(x1, y1, x2, y2, x, y) * (y2 - y1) > 0) % 2 == 1
+
+        xs = polygon.coordinates[0::2]
+        ys = polygon.coordinates[1::2]
+        min_col, min_row = self._cell(min(xs), min(ys))
+        max_col, max_row = self._cell(max(xs), max(ys))
+        for col in range(min_col, max_col + 1):
+            for row in range(min_row, max_row + 1):
+                if (col, row) not in cell_edges and is_corner_inside(col, row):
+                    self._grid.setdefault((col, row), []).append((polygon, None, True))
+        for (col, row), edges in cell_edges.items():
+            self._grid.setdefault((col, row), []).append((polygon, edges, is_corner_inside(col, row)))
+
+    def _contains(self, polygon, edges, corner_inside, x, y, col, row):
+        """
+        Return True if the point in the cell is inside the polygon. Points on an edge are resolved as if they were
+        moved slightly right and up, like the corner of the cell.
+        :rtype: bool
+        """
+        right, bottom = (col + 1) * self.cell_size, row * self.cell_size
+        inside = corner_inside
+        for index in edges:
+            x1, y1, x2, y2 = polygon.edge(index)
+            # From the point right to the side of the cell
+            if (y1 > y) != (y2 > y) and _orientation(x1, y1, x2, y2, x, y) * (y2 - y1) > 0 >= \
+                    _orientation(x1, y1, x2, y2, right, y) * (y2 - y1):
+                inside = not inside
+            # Up the side of the cell from its corner to the height of the point
+            if y > bottom and (x1 > right) != (x2 > right):
+                slope = (y2 - y1) * (x2 - x1)
+                above_bottom = _orientation(x1, y1, x2, y2, right, bottom) * (x2 - x1)
+                below_top = _orientation(x1, y1, x2, y2, right, y) * (x2 - x1)
+                if (above_bottom < 0 or (above_bottom == 0 and slope > 0)) and \
+                        (below_top > 0 or (below_top == 0 and slope <= 0)):
+                    inside = not inside
+        return inside
+
+    def get_iana_time_zone(self, latitude, longitude):
+        """
+        Returns the iana time zone string or None if the point is not within any time zone polygon
+        :param float latitude:
+        :param float longitude:
+        :return str
+        """
+        time_zone = self._memo.get((latitude, longitude), False)
+        if time_zone is False:
+            col, row = self._cell(longitude, latitude)
+            time_zone = next((polygon.time_zone for polygon, edges, corner_inside in self._grid.get((col, row), [])
+                              if edges is None or self._contains(polygon, edges, corner_inside,
+                                                                 longitude, latitude, col, row)),
+                             None)
+            self._memo.set((latitude, longitude), time_zone)
+        return time_zone
 
 
 class TimeZoneService:
     """
     Provide access to a service that returns the IANA time zone string for a given
-    lat/lon
+    lat/lon. If a local resolver is provided, it is used first and the remote service becomes
+    an optional fallback.
     """
 
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, cache=None, cache_ttl=None, local_resolver=None, remote_fallback=True):
+        """
+        Constructor method.
+
+        :param str endpoint: the scheme and host of the weather service
+        :param waterdata.cache.ResponseCache cache: optional cache for successful responses
+        :param int cache_ttl: time to live in seconds of cached responses
+        :param LocalTimeZoneResolver local_resolver: optional resolver used before the weather service
+        :param bool remote_fallback: if False, the weather service is not called when there is a local resolver
+        """
         self.endpoint = endpoint
-        self.session = Session()
+        self.session = create_session('weather_service')
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.local_resolver = local_resolver
+        self.remote_fallback = remote_fallback
 
     def get_iana_time_zone(self, latitude, longitude):
         """
@@ -23,14 +222,35 @@ class TimeZoneService:
         :param longitude: str
         :return str
         """
+        if self.local_resolver is not None:
+            try:
+                time_zone = self.local_resolver.get_iana_time_zone(float(latitude), float(longitude))
+            except ValueError:
+                time_zone = None
+            if time_zone or not self.remote_fallback:
+                return time_zone
+
         url = f'{self.endpoint}/points/{latitude},{longitude}'
+        if self.cache is None or self.cache_ttl is None:
+            time_zone, _ = self._fetch(url)
+            return time_zone
+        return self.cache.fetch(url, lambda: self._fetch(url), self.cache_ttl)
+
+    def _fetch(self, url):
+        """
+        Request the time zone from url.
+        :param str url:
+        :returns
+            - time_zone - str or None
+            - is_good - True if the request was successful
+        """
         try:
             response = self.session.get(url)
         except (request_exceptions.Timeout, request_exceptions.ConnectionError) as err:
             app.logger.error(repr(err))
-            return {}
+            return {}, False
         if response.status_code != 200:
-            return None
+            return None, False
 
         json_data = response.json()
-        return json_data['properties'].get('timeZone', None) if 'properties' in json_data else None
+        return json_data['properties'].get('timeZone', None) if 'properties' in json_data else None, True
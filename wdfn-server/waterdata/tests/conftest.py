@@ -5,6 +5,7 @@ pytest fixtures.
 import pytest
 
 from .. import app as my_app
+from ..services.camera import camera_metadata_store
 
 
 @pytest.fixture
@@ -14,3 +15,16 @@ def app():
     testing helpers.
     """
     return my_app
+
+
+@pytest.fixture(autouse=True, scope='session')
+def camera_metadata_refresh():
+    """
+    Keep the application's camera metadata store from calling the camera service, should a test start its
+    background refresh.
+    """
+    fetch = camera_metadata_store.fetch
+    camera_metadata_store.fetch = dict
+    yield camera_metadata_store
+    camera_metadata_store.stop()
+    camera_metadata_store.fetch = fetch
@@ -4,7 +4,9 @@ Tests for camera.py module
 import json
 from unittest import mock
 
-from ...services.camera import fetch_camera_metadata, get_monitoring_location_camera_details
+from ... import app
+from ...services.camera import CameraMetadataStore, fetch_camera_metadata, get_monitoring_location_camera_details, \
+    start_camera_metadata_refresh
 
 MOCK_CAMERA_METADATA = """
 {
@@ -93,50 +95,83 @@ def test_unparseable_json_fetch_camera_metadata():
         assert camera_metadata == {}
 
 
-def test_fetching_and_returning_camera_details(config):
-    if 'MONITORING_LOCATION_CAMERA_METADATA' in config:
-        del config['MONITORING_LOCATION_CAMERA_METADATA']
-    with mock.patch('waterdata.services.camera.execute_get_request') as r_mock:
-        response = mock.Mock()
-        response.status_code = 200
-        response.text = MOCK_CAMERA_METADATA
-        response.json.return_value = json.loads(MOCK_CAMERA_METADATA)
-        r_mock.return_value = response
+def test_refresh_indexes_camera_details():
+    store = CameraMetadataStore(fetch=lambda: json.loads(MOCK_CAMERA_METADATA))
 
-        details = get_monitoring_location_camera_details('04226000')
-        assert r_mock.called, 'Expect to fetch data'
-        assert len(details) == 1, 'Expected number of cameras'
-        assert 'name' in details[0], 'Expected key'
-        assert 'description' in details[0], 'Expected key'
-        assert 'med_video' in details[0], 'Expected key'
-        assert 'small_video' in details[0], 'Expected key'
-        assert 'most_recent_image' in details[0], 'Expected key'
-        assert 'details' in details[0], 'Expected key'
+    assert store.refresh()
+    details = store.get_cameras('04226000')
+    store.stop()
+    assert len(details) == 1, 'Expected number of cameras'
+    assert 'name' in details[0], 'Expected key'
+    assert 'description' in details[0], 'Expected key'
+    assert 'med_video' in details[0], 'Expected key'
+    assert 'small_video' in details[0], 'Expected key'
+    assert 'most_recent_image' in details[0], 'Expected key'
+    assert 'details' in details[0], 'Expected key'
 
 
-def test_no_fetch_existing_camera_details(config):
-    config['MONITORING_LOCATION_CAMERA_METADATA'] = json.loads(MOCK_CAMERA_METADATA).get('data')
-    with mock.patch('waterdata.services.camera.execute_get_request') as r_mock:
-        response = mock.Mock()
-        response.status_code = 200
-        response.text = MOCK_CAMERA_METADATA
-        response.json.return_value = json.loads(MOCK_CAMERA_METADATA)
-        r_mock.return_value = response
+def test_site_no_with_more_than_one_camera():
+    store = CameraMetadataStore(fetch=lambda: json.loads(MOCK_CAMERA_METADATA))
+    store.refresh()
+
+    assert len(store.get_cameras('425520078535601')) == 2, 'Expected number of cameras'
+    store.stop()
+
+
+def test_site_no_with_no_cameras():
+    store = CameraMetadataStore(fetch=lambda: json.loads(MOCK_CAMERA_METADATA))
+    store.refresh()
+
+    assert not store.get_cameras('425520078535602'), 'Expected number of cameras'
+    store.stop()
+
+
+def test_empty_refresh_keeps_previous_index():
+    fetch = mock.Mock(side_effect=[json.loads(MOCK_CAMERA_METADATA), {}])
+    store = CameraMetadataStore(fetch=fetch)
+
+    assert store.refresh()
+    assert not store.refresh()
+    assert len(store.get_cameras('04226000')) == 1, 'Expected number of cameras'
+    store.stop()
 
-        details = get_monitoring_location_camera_details('04226000')
-        assert not r_mock.called, 'Expect to not fetch data'
-        assert len(details) == 1, 'Expected number of cameras'
 
+def test_background_refresh_started_once():
+    fetch = mock.Mock(return_value=json.loads(MOCK_CAMERA_METADATA))
+    store = CameraMetadataStore(fetch=fetch)
+    with mock.patch('waterdata.services.camera.Thread') as thread_mock:
+        store.start()
+        store.start()
 
-def test_site_no_with_more_than_one_camera(config):
-    config['MONITORING_LOCATION_CAMERA_METADATA'] = json.loads(MOCK_CAMERA_METADATA).get('data')
+        assert thread_mock.call_count == 1
+        assert not fetch.called, 'Expect the refresh to run in the thread'
 
-    details = get_monitoring_location_camera_details('425520078535601')
-    assert len(details) == 2, 'Expected number of cameras'
 
+def test_lookup_does_not_start_refresh():
+    store = CameraMetadataStore(fetch=lambda: json.loads(MOCK_CAMERA_METADATA))
+    with mock.patch('waterdata.services.camera.Thread') as thread_mock:
+        store.get_cameras('04226000')
 
-def test_site_no_with_no_cameras(config):
-    config['MONITORING_LOCATION_CAMERA_METADATA'] = json.loads(MOCK_CAMERA_METADATA).get('data')
+        assert not thread_mock.called, 'Expect page lookups to not start the refresh'
 
-    details = get_monitoring_location_camera_details('425520078535602')
-    assert not details, 'Expected number of cameras'
+
+def test_start_camera_metadata_refresh():
+    with mock.patch('waterdata.services.camera.camera_metadata_store') as store_mock:
+        with mock.patch.dict(app.config, {'MONITORING_LOCATION_CAMERA_ENABLED': False}):
+            start_camera_metadata_refresh()
+        assert not store_mock.start.called
+
+        with mock.patch.dict(app.config, {'MONITORING_LOCATION_CAMERA_ENABLED': True}):
+            start_camera_metadata_refresh()
+        assert store_mock.start.called
+
+
+def test_get_monitoring_location_camera_details():
+    store = CameraMetadataStore(fetch=lambda: json.loads(MOCK_CAMERA_METADATA))
+    store.refresh()
+    with mock.patch('waterdata.services.camera.camera_metadata_store', store):
+        details = get_monitoring_location_camera_details('04226000')
+
+        assert isinstance(details, list)
+        assert len(details) == 1, 'Expected number of cameras'
+    store.stop()
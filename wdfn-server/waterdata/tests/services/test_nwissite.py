@@ -6,7 +6,9 @@ from unittest import TestCase
 
 from requests_mock import Mocker
 
+from ...cache import LRUCache, ResponseCache
 from ...services.nwissite import SiteService
+from ...utils import RdbTable
 from ..mock_test_data import SITE_RDB, PARAMETER_RDB
 
 
@@ -122,7 +124,9 @@ class TestSiteService(TestCase):
             self.assertIn('huc=07010101', session_mock.request_history[0].query)
             self.assertEqual(status_code, 200)
             self.assertEqual(reason, 'OK')
+            self.assertIsInstance(result, RdbTable)
             self.assertEqual(len(result), 1)
+            self.assertEqual(result[0]['site_no'], '01630500')
 
     def test_unsuccessful_get_huc_sites(self):
         with Mocker(session=self.site_service.session) as session_mock:
@@ -150,3 +154,68 @@ class TestSiteService(TestCase):
             self.assertEqual(status_code, 404)
             self.assertEqual(reason, 'Not found')
             self.assertEqual(len(result), 0)
+
+
+class TestCachedSiteService(TestCase):
+
+    def setUp(self):
+        self.endpoint = 'https://www.fakesiteservice.gov/nwis'
+        self.cache = ResponseCache(LRUCache())
+        self.site_service = SiteService(self.endpoint, cache=self.cache, cache_ttls={'site_data': 60})
+
+    def test_cached_query_type(self):
+        with Mocker(session=self.site_service.session) as session_mock:
+            session_mock.get(self.endpoint, text=SITE_RDB, reason='OK')
+            first_result = self.site_service.get_site_data('01630500')
+            second_result = self.site_service.get_site_data('01630500')
+            self.assertEqual(session_mock.call_count, 1)
+            self.assertEqual(first_result, second_result)
+            self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_different_sites_not_shared(self):
+        with Mocker(session=self.site_service.session) as session_mock:
+            session_mock.get(self.endpoint, text=SITE_RDB, reason='OK')
+            self.site_service.get_site_data('01630500')
+            self.site_service.get_site_data('01630501')
+            self.assertEqual(session_mock.call_count, 2)
+
+    def test_query_type_without_ttl_not_cached(self):
+        with Mocker(session=self.site_service.session) as session_mock:
+            session_mock.get(self.endpoint, text=PARAMETER_RDB, reason='OK')
+            self.site_service.get_period_of_record('01630500')
+            self.site_service.get_period_of_record('01630500')
+            self.assertEqual(session_mock.call_count, 2)
+
+    def test_errors_not_cached(self):
+        with Mocker(session=self.site_service.session) as session_mock:
+            session_mock.get(self.endpoint, reason='Bad server', status_code=500)
+            self.site_service.get_site_data('01630500')
+            self.site_service.get_site_data('01630500')
+            self.assertEqual(session_mock.call_count, 2)
+
+    def test_invalidate_site(self):
+        self.site_service.cache_ttls['period_of_record'] = 60
+        with Mocker(session=self.site_service.session) as session_mock:
+            session_mock.get(self.endpoint, text=SITE_RDB, reason='OK')
+            self.site_service.get_site_data('01630500')
+            self.site_service.get_site_data('01630500', 'USGS')
+            self.site_service.get_period_of_record('01630500', 'USGS')
+            self.site_service.get_site_data('01630501')
+            self.site_service.invalidate_site('01630500', 'USGS')
+            self.site_service.get_site_data('01630500')
+            self.site_service.get_site_data('01630500', 'USGS')
+            self.site_service.get_period_of_record('01630500', 'USGS')
+            self.site_service.get_site_data('01630501')
+            self.assertEqual(session_mock.call_count, 7)
+
+    def test_invalidate_huc_and_county_sites(self):
+        self.site_service.cache_ttls.update({'huc_sites': 60, 'county_sites': 60})
+        with Mocker(session=self.site_service.session) as session_mock:
+            session_mock.get(self.endpoint, text=SITE_RDB, reason='OK')
+            self.site_service.get_huc_sites('02070008')
+            self.site_service.get_county_sites('24031')
+            self.site_service.invalidate_huc_sites('02070008')
+            self.site_service.invalidate_county_sites('24031')
+            self.site_service.get_huc_sites('02070008')
+            self.site_service.get_county_sites('24031')
+            self.assertEqual(session_mock.call_count, 4)
@@ -6,6 +6,7 @@ import json
 
 from requests_mock import Mocker
 
+from ...cache import LRUCache, ResponseCache
 from ...services.ogc import MonitoringLocationNetworkService
 from ..mock_test_data import MOCK_NETWORKS_RESPONSE, MOCK_NETWORK_RESPONSE
 
@@ -54,3 +55,15 @@ def test_invalid_json():
         assert session_mock.call_count == 1
         assert session_mock.request_history[0].query == 'f=json'
         assert networks == {}, 'Expected empty response'
+
+
+def test_ogc_invalidate_networks():
+    network_service = MonitoringLocationNetworkService(ENDPOINT, cache=ResponseCache(LRUCache()), cache_ttl=60)
+    with Mocker(session=network_service.session) as session_mock:
+        session_mock.get(f'{ENDPOINT}monitoring-locations', text=MOCK_NETWORK_RESPONSE)
+        network_service.get_networks('monitoring-locations')
+        network_service.get_networks('monitoring-locations')
+        network_service.invalidate_networks('monitoring-locations')
+        network_service.get_networks('monitoring-locations')
+
+        assert session_mock.call_count == 2
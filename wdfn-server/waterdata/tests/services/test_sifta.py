@@ -3,9 +3,11 @@ Tests for the cooperator service calls.
 """
 
 import json
+from unittest import mock
 
 from requests_mock import Mocker
 
+from ...cache import LRUCache, ResponseCache
 from ...services.sifta import SiftaService
 
 
@@ -35,3 +37,32 @@ def test_sifta_handling_bad_status_code():
 
         assert session_mock.call_count == 1
         assert result == []
+
+
+def test_sifta_cached_response_served_if_error():
+    clock = mock.Mock(return_value=1000)
+    sifta_service = SiftaService(ENDPOINT,
+                                 cache=ResponseCache(LRUCache(clock=clock), stale_if_error=600, clock=clock),
+                                 cache_ttl=60)
+    with Mocker(session=sifta_service.session) as session_mock:
+        session_mock.get(f'{ENDPOINT}12345', text=MOCK_RESPONSE)
+        assert sifta_service.get_cooperators('12345') == MOCK_CUSTOMER_LIST
+
+        clock.return_value = 1100
+        session_mock.get(f'{ENDPOINT}12345', status_code=500)
+        result = sifta_service.get_cooperators('12345')
+
+        assert session_mock.call_count == 2
+        assert result == MOCK_CUSTOMER_LIST
+
+
+def test_sifta_invalidate_cooperators():
+    sifta_service = SiftaService(ENDPOINT, cache=ResponseCache(LRUCache()), cache_ttl=60)
+    with Mocker(session=sifta_service.session) as session_mock:
+        session_mock.get(f'{ENDPOINT}12345', text=MOCK_RESPONSE)
+        sifta_service.get_cooperators('12345')
+        sifta_service.get_cooperators('12345')
+        sifta_service.invalidate_cooperators('12345')
+        sifta_service.get_cooperators('12345')
+
+        assert session_mock.call_count == 2
@@ -1,9 +1,13 @@
 """
 Tests for timezone module
 """
+from array import array
+import math
+import random
+
 from requests_mock import Mocker
 
-from ...services.timezone import TimeZoneService
+from ...services.timezone import LocalTimeZoneResolver, TimeZoneService
 
 MOCK_RESPONSE = """
 {"id": "https://api.weather.gov/points/38.9498,-77.1276",
@@ -79,3 +83,126 @@ def test_bad_weather_service_response():
         result = time_zone_service.get_iana_time_zone('46.0', '-110.0')
         assert session_mock.call_count == 1
         assert result is None
+
+
+MOCK_FEATURES = [{
+    'type': 'Feature',
+    'properties': {'tzid': 'America/New_York'},
+    'geometry': {
+        'type': 'Polygon',
+        'coordinates': [
+            [[-80.0, 35.0], [-70.0, 35.0], [-70.0, 45.0], [-80.0, 45.0], [-80.0, 35.0]],
+            [[-76.0, 38.0], [-74.0, 38.0], [-74.0, 40.0], [-76.0, 40.0], [-76.0, 38.0]]
+        ]
+    }
+}, {
+    'type': 'Feature',
+    'properties': {'tzid': 'America/Chicago'},
+    'geometry': {
+        'type': 'MultiPolygon',
+        'coordinates': [
+            [[[-90.0, 35.0], [-80.0, 35.0], [-80.0, 45.0], [-90.0, 45.0], [-90.0, 35.0]]],
+            [[[-75.5, 38.5], [-74.5, 38.5], [-74.5, 39.5], [-75.5, 39.5], [-75.5, 38.5]]]
+        ]
+    }
+}]
+
+
+def test_local_resolver():
+    resolver = LocalTimeZoneResolver(MOCK_FEATURES)
+
+    assert resolver.get_iana_time_zone(38.9498, -77.1276) == 'America/New_York'
+    assert resolver.get_iana_time_zone(40.0, -85.5) == 'America/Chicago'
+    assert resolver.get_iana_time_zone(39.0, -75.0) == 'America/Chicago'
+    assert resolver.get_iana_time_zone(38.2, -75.8) is None
+    assert resolver.get_iana_time_zone(10.0, -85.0) is None
+
+
+def _point_in_rings(x, y, rings):
+    inside = False
+    for ring in rings:
+        x1, y1 = ring[-1]
+        for x2, y2 in ring:
+            if (y2 > y) != (y1 > y) and x < (x1 - x2) * (y - y2) / (y1 - y2) + x2:
+                inside = not inside
+            x1, y1 = x2, y2
+    return inside
+
+
+def _random_ring(rng, center_x, center_y, radius, vertex_count, snap):
+    ring = []
+    for index in range(vertex_count):
+        angle = 2 * math.pi * index / vertex_count
+        distance = radius * rng.uniform(0.3, 1.0)
+        x = center_x + distance * math.cos(angle)
+        y = center_y + distance * math.sin(angle)
+        ring.append([round(x * snap) / snap, round(y * snap) / snap])
+    return ring + [ring[0]]
+
+
+def test_local_resolver_matches_ray_casting():
+    rng = random.Random(0)
+    for snap in (2, 1000):
+        outer = _random_ring(rng, -100.0, 40.0, 6.0, 200, snap)
+        hole = _random_ring(rng, -100.0, 40.0, 1.5, 40, snap)
+        resolver = LocalTimeZoneResolver([{
+            'properties': {'tzid': 'America/Chicago'},
+            'geometry': {'type': 'Polygon', 'coordinates': [outer, hole]}
+        }], memo_size=0)
+
+        points = [(rng.uniform(34.0, 46.0), rng.uniform(-106.0, -94.0)) for _ in range(2000)]
+        points += [(latitude, longitude) for longitude, latitude in outer + hole]
+        points += [(float(latitude), float(longitude)) for latitude in range(34, 47) for longitude in range(-106, -93)]
+        for latitude, longitude in points:
+            expected = 'America/Chicago' if _point_in_rings(longitude, latitude, [outer, hole]) else None
+            assert resolver.get_iana_time_zone(latitude, longitude) == expected, (latitude, longitude)
+
+
+def test_local_resolver_memoizes():
+    resolver = LocalTimeZoneResolver(MOCK_FEATURES)
+    resolver.get_iana_time_zone(38.9498, -77.1276)
+    resolver.get_iana_time_zone(10.0, -85.0)
+    resolver._grid.clear()
+
+    assert resolver.get_iana_time_zone(38.9498, -77.1276) == 'America/New_York'
+    assert resolver.get_iana_time_zone(10.0, -85.0) is None
+    assert resolver.get_iana_time_zone(40.0, -85.5) is None
+
+
+def test_local_resolver_stores_arrays():
+    resolver = LocalTimeZoneResolver(MOCK_FEATURES)
+
+    for entries in resolver._grid.values():
+        for polygon, edges, _ in entries:
+            assert isinstance(polygon.coordinates, array)
+            assert edges is None or isinstance(edges, array)
+
+
+def test_local_resolver_used_before_weather_service():
+    time_zone_service = TimeZoneService(ENDPOINT, local_resolver=LocalTimeZoneResolver(MOCK_FEATURES))
+    with Mocker(session=time_zone_service.session) as session_mock:
+        result = time_zone_service.get_iana_time_zone('38.9498', '-77.1276')
+
+        assert session_mock.call_count == 0
+        assert result == 'America/New_York'
+
+
+def test_weather_service_fallback():
+    time_zone_service = TimeZoneService(ENDPOINT, local_resolver=LocalTimeZoneResolver(MOCK_FEATURES))
+    with Mocker(session=time_zone_service.session) as session_mock:
+        session_mock.get(f'{ENDPOINT}/points/10.0,-85.0', text=MOCK_RESPONSE)
+        result = time_zone_service.get_iana_time_zone('10.0', '-85.0')
+
+        assert session_mock.call_count == 1
+        assert result == 'America/New_York'
+
+
+def test_weather_service_fallback_disabled():
+    time_zone_service = TimeZoneService(ENDPOINT,
+                                        local_resolver=LocalTimeZoneResolver(MOCK_FEATURES),
+                                        remote_fallback=False)
+    with Mocker(session=time_zone_service.session) as session_mock:
+        result = time_zone_service.get_iana_time_zone('10.0', '-85.0')
+
+        assert session_mock.call_count == 0
+        assert result is None
@@ -0,0 +1,372 @@
+"""
+Tests for the upstream response caches.
+"""
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+from unittest import TestCase
+
+from ..deadline import DeadlineExceeded, deadline, get_remaining_time
+from ..cache import LRUCache, SQLiteCache, ResponseCache, SingleFlight, create_cache_backend, make_cache_key
+from ..transport import end_upstream_failure_record, get_upstream_failures, start_upstream_failure_record
+
+
+class FakeClock:
+    # pylint: disable=R0903
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMakeCacheKey(TestCase):
+
+    def test_order_does_not_matter(self):
+        self.assertEqual(make_cache_key('https://fake.gov/site', {'sites': '01', 'format': 'rdb'}),
+                         make_cache_key('https://fake.gov/site', {'format': 'rdb', 'sites': '01'}))
+
+    def test_values_are_normalized(self):
+        self.assertEqual(make_cache_key('https://fake.gov/site', {'seriesCatalogOutput': True}),
+                         make_cache_key('https://fake.gov/site', {'seriesCatalogOutput': 'True'}))
+
+    def test_different_params(self):
+        self.assertNotEqual(make_cache_key('https://fake.gov/site', {'sites': '01'}),
+                            make_cache_key('https://fake.gov/site', {'sites': '02'}))
+
+
+class TestLRUCache(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LRUCache(max_size=2, default_ttl=10, clock=self.clock)
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_expiry(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2, ttl=20)
+        self.clock.now += 15
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), 2)
+        self.assertEqual(self.cache.stats()['size'], 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_delete_and_clear(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('b'))
+
+
+class TestSQLiteCache(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'cache.sqlite')
+        self.clock = FakeClock()
+        self.cache = SQLiteCache(self.path, max_size=2, default_ttl=10, clock=self.clock, access_resolution=1,
+                                 eviction_interval=1)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', (200, 'OK', [{'site_no': '01630500'}]))
+        self.assertEqual(self.cache.get('a'), (200, 'OK', [{'site_no': '01630500'}]))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_expiry(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2, ttl=20)
+        self.clock.now += 15
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), 2)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.clock.now += 1
+        self.cache.set('b', 2)
+        self.clock.now += 1
+        self.cache.get('a')
+        self.clock.now += 1
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_access_time_resolution(self):
+        cache = SQLiteCache(self.path, max_size=2, default_ttl=60, clock=self.clock, access_resolution=10,
+                            eviction_interval=1)
+        cache.set('a', 1)
+        self.clock.now += 1
+        cache.set('b', 2)
+        self.clock.now += 1
+        cache.get('a')
+        self.clock.now += 1
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+
+    def test_eviction_interval(self):
+        cache = SQLiteCache(self.path, max_size=2, default_ttl=10, clock=self.clock, eviction_interval=3)
+        for key in ['a', 'b']:
+            cache.set(key, 1)
+        self.clock.now += 1
+        cache.set('c', 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        cache.set('d', 1)
+        self.assertEqual(cache.stats()['size'], 3)
+
+    def test_database_error(self):
+        path = os.path.join(self.temp_dir.name, 'broken.sqlite')
+        cache = SQLiteCache(path, clock=self.clock)
+        # A directory in place of the database file cannot be opened
+        os.remove(path)
+        os.mkdir(path)
+        cache.set('a', 1)
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['errors'], 4)
+        self.assertIsNone(stats['size'])
+
+    def test_private_files(self):
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.assertEqual(os.stat(f'{self.path}.key').st_mode & 0o777, 0o600)
+
+    def test_created_directory_is_private(self):
+        path = os.path.join(self.temp_dir.name, 'cache', 'cache.sqlite')
+        SQLiteCache(path)
+        self.assertEqual(os.stat(os.path.dirname(path)).st_mode & 0o777, 0o700)
+
+    def test_shared_directory_refused(self):
+        os.chmod(self.temp_dir.name, 0o777)
+        with self.assertRaises(ValueError):
+            SQLiteCache(os.path.join(self.temp_dir.name, 'other.sqlite'))
+
+    def test_readable_file_refused(self):
+        os.chmod(self.path, 0o644)
+        with self.assertRaises(ValueError):
+            SQLiteCache(self.path)
+
+    def test_bad_signature(self):
+        self.cache.set('a', 1)
+        connection = sqlite3.connect(self.path)
+        connection.execute('UPDATE cache SET value = ? WHERE key = ?', (b'0' * 32 + pickle.dumps(2), 'a'))
+        connection.commit()
+        connection.close()
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_shared_between_instances(self):
+        other_cache = SQLiteCache(self.path, max_size=2, default_ttl=10, clock=self.clock)
+        self.cache.set('a', 1)
+        self.assertEqual(other_cache.get('a'), 1)
+        other_cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.clear()
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+
+class TestCreateCacheBackend(TestCase):
+
+    def test_memory(self):
+        self.assertIsInstance(create_cache_backend('memory', 10), LRUCache)
+
+    def test_sqlite(self):
+        self.assertIsInstance(create_cache_backend('sqlite', 10, sqlite_path=':memory:'), SQLiteCache)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            create_cache_backend('redis', 10)
+
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        self.single_flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow_call(self):
+        self.calls += 1
+        self.release.wait(5)
+        return ['result']
+
+    def run_callers(self, count, func):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.single_flight.do('key', func)))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        while self.single_flight.coalesced < count - 1:
+            threading.Event().wait(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_calls_coalesced(self):
+        results = self.run_callers(5, self.slow_call)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_sequential_calls_not_coalesced(self):
+        self.release.set()
+        self.single_flight.do('key', self.slow_call)
+        self.single_flight.do('key', self.slow_call)
+        self.assertEqual(self.calls, 2)
+
+    def test_error_shared(self):
+        def failing_call():
+            raise ValueError('Bad call')
+
+        with self.assertRaises(ValueError):
+            self.single_flight.do('key', failing_call)
+
+    def test_waiting_caller_deadline(self):
+        leader = threading.Thread(target=self.single_flight.do, args=('key', self.slow_call))
+        leader.start()
+        while self.calls == 0:
+            threading.Event().wait(0.01)
+
+        with deadline(0.05):
+            with self.assertRaises(DeadlineExceeded):
+                self.single_flight.do('key', self.slow_call)
+        self.release.set()
+        leader.join(5)
+        self.assertEqual(self.calls, 1)
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.background_tasks = []
+        self.cache = ResponseCache(LRUCache(clock=self.clock),
+                                   stale_while_revalidate=60,
+                                   stale_if_error=600,
+                                   clock=self.clock,
+                                   run_in_background=self.background_tasks.append)
+        self.calls = 0
+
+    def good_loader(self):
+        self.calls += 1
+        return f'response {self.calls}', True
+
+    def bad_loader(self):
+        self.calls += 1
+        return 'error', False
+
+    def test_fresh_response_is_cached(self):
+        self.assertEqual(self.cache.fetch('key', self.good_loader, 10), 'response 1')
+        self.clock.now += 5
+        self.assertEqual(self.cache.fetch('key', self.good_loader, 10), 'response 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_while_revalidate(self):
+        self.cache.fetch('key', self.good_loader, 10)
+        self.clock.now += 30
+        self.assertEqual(self.cache.fetch('key', self.good_loader, 10), 'response 1')
+        self.assertEqual(self.cache.fetch('key', self.good_loader, 10), 'response 1')
+        self.assertEqual(len(self.background_tasks), 1)
+
+        self.background_tasks[0]()
+        self.assertEqual(self.cache.fetch('key', self.good_loader, 10), 'response 2')
+        self.assertEqual(self.cache.stats()['stale_hits'], 2)
+
+    def test_stale_if_error(self):
+        self.cache.fetch('key', self.good_loader, 10)
+        self.clock.now += 300
+        self.assertEqual(self.cache.fetch('key', self.bad_loader, 10), 'response 1')
+        self.assertEqual(self.calls, 2)
+
+    def test_too_stale_if_error(self):
+        self.cache.fetch('key', self.good_loader, 10)
+        self.clock.now += 1000
+        self.assertEqual(self.cache.fetch('key', self.bad_loader, 10), 'error')
+
+    def test_bad_response_not_cached(self):
+        self.assertEqual(self.cache.fetch('key', self.bad_loader, 10), 'error')
+        self.assertEqual(self.cache.fetch('key', self.good_loader, 10), 'response 2')
+
+    def test_stale_served_after_deadline(self):
+        self.cache.fetch('key', self.good_loader, 10)
+        self.clock.now += 300
+        token = start_upstream_failure_record()
+        try:
+            with deadline(0):
+                self.assertEqual(self.cache.fetch('key', self.good_loader, 10), 'response 1')
+            self.assertEqual(len(get_upstream_failures()), 1)
+        finally:
+            end_upstream_failure_record(token)
+        self.assertEqual(self.calls, 1)
+
+    def wait_for_slow_load(self, key):
+        """
+        Start a call which loads key until self.release is set.
+        :rtype: threading.Thread
+        """
+        self.release = threading.Event()
+        started = threading.Event()
+
+        def slow_loader():
+            started.set()
+            self.release.wait(5)
+            return self.good_loader()
+
+        thread = threading.Thread(target=self.cache.fetch, args=(key, slow_loader, 10))
+        thread.start()
+        started.wait(5)
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(self.release.set)
+        return thread
+
+    def deadline_loader(self):
+        self.calls += 1
+        return ('error', False) if get_remaining_time() == 0 else ('loaded', True)
+
+    def test_stale_served_when_deadline_passes_while_waiting(self):
+        self.cache.fetch('key', self.good_loader, 10)
+        self.clock.now += 300
+        self.wait_for_slow_load('key')
+
+        with deadline(0.05):
+            self.assertEqual(self.cache.fetch('key', self.good_loader, 10), 'response 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_loader_error_when_deadline_passes_while_waiting(self):
+        self.wait_for_slow_load('key')
+
+        with deadline(0.05):
+            self.assertEqual(self.cache.fetch('key', self.deadline_loader, 10), 'error')
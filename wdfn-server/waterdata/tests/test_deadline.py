@@ -0,0 +1,39 @@
+"""
+Tests for the request deadline.
+"""
+from unittest import TestCase
+
+from ..deadline import call_within_deadline, deadline, get_remaining_time, reset_deadline, set_deadline
+from ..utils import execute_concurrently
+
+
+class TestDeadline(TestCase):
+
+    def test_no_deadline(self):
+        self.assertIsNone(get_remaining_time())
+
+    def test_set_and_reset(self):
+        token = set_deadline(10)
+        self.assertTrue(9 < get_remaining_time() <= 10)
+        reset_deadline(token)
+        self.assertIsNone(get_remaining_time())
+
+    def test_earlier_deadline_kept(self):
+        with deadline(5):
+            with deadline(60):
+                self.assertTrue(get_remaining_time() <= 5)
+            with deadline(1):
+                self.assertTrue(get_remaining_time() <= 1)
+
+    def test_expired_deadline(self):
+        with deadline(0):
+            self.assertEqual(get_remaining_time(), 0)
+
+    def test_call_within_deadline(self):
+        self.assertTrue(call_within_deadline(2, get_remaining_time) <= 2)
+        self.assertIsNone(call_within_deadline(None, get_remaining_time))
+
+    def test_deadline_propagated_to_concurrent_calls(self):
+        with deadline(5):
+            result = execute_concurrently({'remaining': (get_remaining_time, (), None)})
+        self.assertTrue(0 < result['remaining'] <= 5)
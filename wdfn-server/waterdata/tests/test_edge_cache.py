@@ -0,0 +1,208 @@
+"""
+Tests for the headers which make responses cacheable by shared caches.
+"""
+from unittest import TestCase, mock
+
+from flask import Response
+from requests.exceptions import Timeout
+from requests_mock import Mocker
+
+from .. import app
+from ..edge_cache import EdgePurger, add_cache_headers, add_surrogate_keys, get_site_surrogate_keys, \
+    get_surrogate_key, get_surrogate_keys, hide_banner_notices, is_internet_explorer
+from ..transport import record_upstream_failure
+from ..views import monitoring_location_page_cache
+from ..utils import parse_rdb
+from .mock_test_data import SITE_RDB, PARAMETER_RDB
+
+IE_USER_AGENT = 'Mozilla/5.0 (Windows NT 6.1; WOW64; Trident/7.0; rv:11.0) like Gecko'
+
+
+class TestGetSurrogateKeys(TestCase):
+
+    def test_get_surrogate_key(self):
+        self.assertEqual(get_surrogate_key('county', '55', '025'), 'county/55/025')
+
+    def test_route_arguments(self):
+        self.assertEqual(get_surrogate_keys('monitoring_location', {'site_no': '01630500'}),
+                         ['monitoring_location', 'site/01630500'])
+        self.assertEqual(get_surrogate_keys('hydrological_unit', {'huc_cd': '07', 'show_locations': True}),
+                         ['hydrological_unit', 'huc/07'])
+        self.assertEqual(get_surrogate_keys('networks', {'network_cd': 'RTS'}), ['networks', 'network/RTS'])
+
+    def test_county(self):
+        self.assertEqual(get_surrogate_keys('states_counties', {'state_cd': '55', 'county_cd': '025'}),
+                         ['states_counties', 'state/55', 'county/55/025'])
+
+    def test_empty_arguments(self):
+        self.assertEqual(get_surrogate_keys('states_counties', {'state_cd': None, 'county_cd': None}),
+                         ['states_counties'])
+        self.assertEqual(get_surrogate_keys('networks', {'network_cd': ''}), ['networks'])
+
+    def test_site_keys(self):
+        self.assertEqual(get_site_surrogate_keys({'state_cd': '55', 'county_cd': '025', 'huc_cd': '07090002'}),
+                         ['county/55/025', 'huc/07090002'])
+        self.assertEqual(get_site_surrogate_keys({'state_cd': '55', 'county_cd': '', 'huc_cd': ''}), [])
+
+
+class TestAddCacheHeaders(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(app.config, {
+            'CDN_CACHEABLE_RESPONSES': True,
+            'CACHE_CONTROL': {'monitoring_location': 'public, max-age=60'},
+            'CACHE_VARY': {'monitoring_location': ['Accept']},
+            'DEGRADED_CACHE_CONTROL': 'public, s-maxage=5'
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_headers(self):
+        with app.test_request_context('/monitoring-location/01630500/'):
+            add_surrogate_keys('county/55/025', 'site/01630500')
+            response = add_cache_headers(Response())
+
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(response.headers['Vary'], 'Accept')
+        self.assertEqual(response.headers['Surrogate-Key'], 'monitoring_location site/01630500 county/55/025')
+
+    def test_upstream_failure(self):
+        with app.test_request_context('/monitoring-location/01630500/'):
+            app.preprocess_request()
+            record_upstream_failure('GET https://fake.gov/: 500')
+            response = add_cache_headers(Response())
+
+        self.assertEqual(response.headers['Cache-Control'], 'public, s-maxage=5')
+        self.assertEqual(response.headers['Surrogate-Key'], 'monitoring_location site/01630500')
+
+    def test_error_response(self):
+        with app.test_request_context('/monitoring-location/01630500/'):
+            response = add_cache_headers(Response(status=503))
+
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+        self.assertNotIn('Surrogate-Key', response.headers)
+
+    def test_route_without_settings(self):
+        with app.test_request_context('/states/55/'):
+            response = add_cache_headers(Response())
+
+        self.assertNotIn('Cache-Control', response.headers)
+        self.assertNotIn('Vary', response.headers)
+        self.assertEqual(response.headers['Surrogate-Key'], 'states_counties state/55')
+
+    def test_not_cdn_cacheable(self):
+        app.config['CDN_CACHEABLE_RESPONSES'] = False
+        with app.test_request_context('/monitoring-location/01630500/'):
+            response = add_cache_headers(Response())
+
+        self.assertNotIn('Cache-Control', response.headers)
+        self.assertNotIn('Surrogate-Key', response.headers)
+
+
+class TestPageVariant(TestCase):
+
+    def test_not_cdn_cacheable(self):
+        with mock.patch.dict(app.config, {'CDN_CACHEABLE_RESPONSES': False}):
+            with app.test_request_context('/', headers={'User-Agent': IE_USER_AGENT,
+                                                        'Cookie': 'no-show-banner-message=no-show'}):
+                self.assertTrue(is_internet_explorer())
+                self.assertTrue(hide_banner_notices())
+
+    def test_cdn_cacheable(self):
+        with mock.patch.dict(app.config, {'CDN_CACHEABLE_RESPONSES': True}):
+            with app.test_request_context('/', headers={'User-Agent': IE_USER_AGENT,
+                                                        'Cookie': 'no-show-banner-message=no-show'}):
+                self.assertFalse(is_internet_explorer())
+                self.assertFalse(hide_banner_notices())
+
+
+class TestCdnCacheableMonitoringLocation(TestCase):
+
+    def setUp(self):
+        self.app_client = app.test_client()
+        monitoring_location_page_cache.clear()
+        config_patcher = mock.patch.dict(app.config, {
+            'CDN_CACHEABLE_RESPONSES': True,
+            'SET_COOKIE_TO_HIDE_BANNER_NOTICES': True,
+            'BANNER_NOTICES': ['A notice']
+        })
+        config_patcher.start()
+        self.addCleanup(config_patcher.stop)
+        for target, value in [
+                ('waterdata.views.SiteService.get_site_data', (200, '', list(parse_rdb(iter(SITE_RDB.split('\n')))))),
+                ('waterdata.views.SiteService.get_period_of_record',
+                 (200, '', list(parse_rdb(iter(PARAMETER_RDB.split('\n')))))),
+                ('waterdata.views.SiftaService.get_cooperators', []),
+                ('waterdata.views.TimeZoneService.get_iana_time_zone', 'America/New_York'),
+                ('waterdata.views.get_monitoring_location_camera_details', [])]:
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_headers(self):
+        response = self.app_client.get('/monitoring-location/01630500/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.getlist('Set-Cookie'), [])
+        self.assertEqual(response.headers['Cache-Control'], app.config['CACHE_CONTROL']['monitoring_location'])
+        self.assertEqual(response.headers['Vary'], 'Accept')
+        self.assertEqual(response.headers['Surrogate-Key'].split(),
+                         ['monitoring_location', 'site/01630500', 'county/48/061', 'huc/02070010'])
+
+    def test_same_page_for_every_visitor(self):
+        first_response = self.app_client.get('/monitoring-location/01630500/')
+        second_response = self.app_client.get('/monitoring-location/01630500/', headers={
+            'User-Agent': IE_USER_AGENT,
+            'Cookie': 'no-show-banner-message=no-show'
+        })
+
+        self.assertEqual(first_response.data, second_response.data)
+        self.assertEqual(first_response.get_etag(), second_response.get_etag())
+        self.assertIn('A notice', second_response.data.decode('utf-8'))
+        self.assertIn('no-show-banner-message=no-show', second_response.data.decode('utf-8'))
+
+    def test_upstream_failure(self):
+        with mock.patch('waterdata.views.SiftaService.get_cooperators', side_effect=Timeout):
+            response = self.app_client.get('/monitoring-location/01630500/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], app.config['DEGRADED_CACHE_CONTROL'])
+
+        response = self.app_client.get('/monitoring-location/01630500/')
+        self.assertEqual(response.headers['Cache-Control'], app.config['CACHE_CONTROL']['monitoring_location'])
+
+    def test_not_modified(self):
+        etag, _ = self.app_client.get('/monitoring-location/01630500/').get_etag()
+        response = self.app_client.get('/monitoring-location/01630500/',
+                                       headers={'If-None-Match': '"{}"'.format(etag)})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['Cache-Control'], app.config['CACHE_CONTROL']['monitoring_location'])
+        self.assertIn('county/48/061', response.headers['Surrogate-Key'].split())
+
+
+class TestEdgePurger(TestCase):
+
+    def setUp(self):
+        self.endpoint = 'https://api.fakecdn.com/service/1/purge'
+        self.purger = EdgePurger(self.endpoint, headers={'Fastly-Key': 'secret'})
+
+    def test_purge(self):
+        with Mocker(session=self.purger.session) as session_mock:
+            session_mock.post(self.endpoint, json={'status': 'ok'})
+            self.assertTrue(self.purger.purge(['site/01630500', 'county/55/025']))
+
+            request = session_mock.request_history[0]
+            self.assertEqual(request.json(), {'surrogate_keys': ['site/01630500', 'county/55/025']})
+            self.assertEqual(request.headers['Fastly-Key'], 'secret')
+
+    def test_failed_purge(self):
+        with Mocker(session=self.purger.session) as session_mock:
+            session_mock.post(self.endpoint, status_code=403)
+            self.assertFalse(self.purger.purge(['site/01630500']))
+
+    def test_no_endpoint(self):
+        purger = EdgePurger(None)
+        with Mocker(session=purger.session) as session_mock:
+            self.assertFalse(purger.purge(['site/01630500']))
+            self.assertEqual(session_mock.call_count, 0)
@@ -0,0 +1,72 @@
+"""
+Tests for the cache tag for template fragments.
+"""
+from unittest import TestCase
+
+from jinja2 import Environment, TemplateSyntaxError
+
+from ..cache import LRUCache
+from ..fragment_cache import FragmentCacheExtension
+
+
+class TestFragmentCacheExtension(TestCase):
+
+    def setUp(self):
+        self.now = 1000
+        self.environment = Environment(extensions=[FragmentCacheExtension], autoescape=True)
+        self.environment.fragment_cache = LRUCache(max_size=10, default_ttl=60, clock=lambda: self.now)
+        self.renders = []
+        self.environment.globals['render'] = lambda value: self.renders.append(value) or value
+
+    def test_cached(self):
+        template = self.environment.from_string("{% cache 'name', site_no %}{{ render(text) }}{% endcache %}")
+
+        self.assertEqual(template.render(site_no='01', text='<first>'), '&lt;first&gt;')
+        self.assertEqual(template.render(site_no='01', text='second'), '&lt;first&gt;')
+        self.assertEqual(self.renders, ['<first>'])
+
+    def test_key_arguments(self):
+        template = self.environment.from_string("{% cache 'name', site_no %}{{ render(text) }}{% endcache %}")
+        other_template = self.environment.from_string("{% cache 'other', site_no %}{{ render(text) }}{% endcache %}")
+
+        template.render(site_no='01', text='first')
+
+        self.assertEqual(template.render(site_no='02', text='second'), 'second')
+        self.assertEqual(other_template.render(site_no='01', text='third'), 'third')
+        self.assertEqual(self.renders, ['first', 'second', 'third'])
+
+    def test_ttl(self):
+        template = self.environment.from_string("{% cache 'name', ttl=10 %}{{ render(text) }}{% endcache %}")
+
+        template.render(text='first')
+        self.now += 5
+        self.assertEqual(template.render(text='second'), 'first')
+        self.now += 10
+        self.assertEqual(template.render(text='third'), 'third')
+
+    def test_default_ttl(self):
+        template = self.environment.from_string("{% cache 'name' %}{{ render(text) }}{% endcache %}")
+
+        template.render(text='first')
+        self.now += 61
+        self.assertEqual(template.render(text='second'), 'second')
+
+    def test_undefined_key_argument(self):
+        template = self.environment.from_string("{% cache 'name', site_no %}{{ render(text) }}{% endcache %}")
+
+        template.render(text='first')
+
+        self.assertEqual(template.render(text='second'), 'second')
+        self.assertEqual(self.environment.fragment_cache.stats()['size'], 0)
+
+    def test_no_cache(self):
+        self.environment.fragment_cache = None
+        template = self.environment.from_string("{% cache 'name' %}{{ render(text) }}{% endcache %}")
+
+        template.render(text='first')
+
+        self.assertEqual(template.render(text='second'), 'second')
+
+    def test_missing_key(self):
+        with self.assertRaises(TemplateSyntaxError):
+            self.environment.from_string('{% cache ttl=10 %}text{% endcache %}')
@@ -4,12 +4,13 @@ Unit tests for waterdata.waterservices classes and functions.
 """
 from unittest import TestCase
 
-from pendulum import datetime
+from pendulum import datetime, parse
 
 from .. import app
+from ..lookups import LookupIndex
 from ..location_utils import (
-    build_linked_data, get_disambiguated_values, get_state_abbreviation, rollup_dataseries,
-    get_period_of_record_by_parm_cd, get_default_parameter_code
+    build_linked_data, get_disambiguated_series, get_disambiguated_values, get_state_abbreviation, rollup_dataseries,
+    get_period_of_record_by_parm_cd, get_period_of_record_by_data_type, get_default_parameter_code, _parse_series_date
 )
 
 
@@ -119,9 +120,11 @@ class GetDisambiguatedValuesTestCase(TestCase):
             }
         }
 
+        self.lookup_index = LookupIndex(self.test_code_lookups, self.test_country_state_county_lookup, {})
+
     def test_empty_location(self):
         self.assertEqual(
-            get_disambiguated_values({}, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values({}, self.lookup_index),
             {}
         )
 
@@ -135,7 +138,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'site_no': {'name': '12345678', 'code': '12345678'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -151,7 +154,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'nat_aqfr_cd': {'name': 'Basin and Range basin-fill aquifers', 'code': 'N100BSNRGB'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location)
 
     def test_location_with_key_values_not_in_code_lookups(self):
@@ -166,7 +169,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'nat_aqfr_cd': {'code': 'N100BSNRGB', 'name': 'Basin and Range basin-fill aquifers'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -186,7 +189,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'county_cd': {'name': 'Baldwin County', 'code': '002'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -204,7 +207,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'county_cd': {'name': '004', 'code': '004'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location)
 
     def test_state_with_no_counties_in_lookup(self):
@@ -221,7 +224,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'county_cd': {'name': '004', 'code': '004'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -241,10 +244,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'county_cd': {'name': '004', 'code': '004'}
         }
         self.assertEqual(
-            get_disambiguated_values(
-                test_location, self.test_code_lookups,
-                self.test_country_state_county_lookup, {}
-            ),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -262,7 +262,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'county_cd': {'name': '004', 'code': '004'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -278,7 +278,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'county_cd': {'name': '004', 'code': '004'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -294,7 +294,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'county_cd': {'name': '001', 'code': '001'}
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -310,7 +310,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
             'state_cd': {'name': 'Alabama', 'abbreviation': 'AL', 'code': '01'},
         }
         self.assertEqual(
-            get_disambiguated_values(test_location, self.test_code_lookups, self.test_country_state_county_lookup, {}),
+            get_disambiguated_values(test_location, self.lookup_index),
             expected_location
         )
 
@@ -323,7 +323,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
                 'huc_cd': {'name': 'New England Region', 'code': '01', 'url': '/hydrological-unit/01/'}
             }
             self.assertEqual(
-                get_disambiguated_values(test_location, {}, {}, self.test_huc_lookup),
+                get_disambiguated_values(test_location, LookupIndex({}, {}, self.test_huc_lookup)),
                 expected_location
             )
 
@@ -336,7 +336,7 @@ class GetDisambiguatedValuesTestCase(TestCase):
                 'huc_cd': {'name': 'Upper St. John', 'code': '01010001', 'url': '/hydrological-unit/01010001/'}
             }
             self.assertEqual(
-                get_disambiguated_values(test_location, {}, {}, self.test_huc_lookup),
+                get_disambiguated_values(test_location, LookupIndex({}, {}, self.test_huc_lookup)),
                 expected_location
             )
 
@@ -349,11 +349,61 @@ class GetDisambiguatedValuesTestCase(TestCase):
                 'huc_cd': {'name': None, 'code': '01010002', 'url': '/hydrological-unit/01010002/'}
             }
             self.assertEqual(
-                get_disambiguated_values(test_location, {}, {}, self.test_huc_lookup),
+                get_disambiguated_values(test_location, LookupIndex({}, {}, self.test_huc_lookup)),
                 expected_location
             )
 
 
+class TestGetDisambiguatedSeries(TestCase):
+
+    def setUp(self):
+        self.lookup_index = LookupIndex(
+            {
+                'agency_cd': {'USGS': {'name': 'U.S. Geological Survey'}},
+                'parm_cd': {
+                    '00010': {'name': 'Temperature, water', 'group': 'Physical'},
+                    '00618': {'name': 'Nitrate', 'group': 'Nutrient'}
+                },
+                'parm_grp_cd': {'NUT': {'name': 'Nutrient'}}
+            },
+            {},
+            {'hucs': {'01010001': {'huc_nm': 'Upper St. John'}}}
+        )
+        self.test_series = [
+            {'agency_cd': 'USGS', 'parm_cd': '00010', 'parm_grp_cd': '', 'huc_cd': '01010001', 'ts_id': '1'},
+            {'agency_cd': 'USGS', 'parm_cd': '00618', 'parm_grp_cd': '', 'huc_cd': '01010001', 'ts_id': '2'},
+            {'agency_cd': 'USGS', 'parm_cd': '00618', 'parm_grp_cd': 'NUT', 'huc_cd': '01010001', 'ts_id': '3'},
+            {'agency_cd': 'USGS', 'parm_cd': '00010', 'parm_grp_cd': '', 'huc_cd': '01010001', 'ts_id': '4'}
+        ]
+
+    def test_same_as_get_disambiguated_values(self):
+        with app.test_request_context():
+            result = get_disambiguated_series(self.test_series, self.lookup_index)
+            expected = [get_disambiguated_values(series, self.lookup_index) for series in self.test_series]
+        self.assertEqual(len(result), len(expected))
+        for series, expected_series in zip(result, expected):
+            self.assertEqual({key: dict(value) for key, value in series.items()}, expected_series)
+
+    def test_parameter_group_depends_on_parameter_code(self):
+        with app.test_request_context():
+            result = get_disambiguated_series(self.test_series, self.lookup_index)
+        self.assertEqual(result[0]['parm_grp_cd']['name'], 'Physical')
+        self.assertEqual(result[1]['parm_grp_cd']['name'], 'Nutrient')
+        self.assertIs(result[0]['parm_grp_cd'], result[3]['parm_grp_cd'])
+
+    def test_values_shared_and_read_only(self):
+        with app.test_request_context():
+            result = get_disambiguated_series(self.test_series, self.lookup_index)
+        self.assertIs(result[0]['agency_cd'], result[2]['agency_cd'])
+        self.assertIs(result[0]['huc_cd'], result[3]['huc_cd'])
+        self.assertIsNot(result[0]['ts_id'], result[1]['ts_id'])
+        with self.assertRaises(TypeError):
+            result[0]['agency_cd']['name'] = 'Changed'
+
+    def test_empty_series(self):
+        self.assertEqual(get_disambiguated_series([], self.lookup_index), [])
+
+
 class TestBuildLinkedData(TestCase):
 
     def setUp(self):
@@ -533,6 +583,29 @@ class TestRollupDataseries(TestCase):
             {'start_date', 'end_date', 'parameter_name', 'data_types', 'parameter_code'}
         )
 
+    def test_groups_sorted_by_name(self):
+        result = rollup_dataseries(list(reversed(self.test_data)))
+        self.assertEqual([series_grp['name'] for series_grp in result], ['Nutrient', 'Physical', None, None, None])
+        self.assertEqual(result[2]['data_types'], 'Peak Measurements')
+        self.assertEqual(result[4]['data_types'], 'USGS Annual Water Data Reports Site')
+        self.assertEqual([parameter['parameter_code'] for parameter in result[1]['parameters']], ['00010', '00060'])
+        self.assertEqual(result[1]['parameters'][0]['data_types'], ['Daily Values', 'Unit Values'])
+
+    def test_mixed_date_formats(self):
+        test_data = self.test_data[:2]
+        test_data[1] = dict(test_data[1], begin_date={'name': '1979-07', 'code': '1979-07'})
+        result = rollup_dataseries(test_data)
+        self.assertEqual(result[0]['start_date'], datetime(1979, 7, 1))
+        self.assertEqual(result[0]['end_date'], datetime(2016, 1, 1))
+
+
+class TestParseSeriesDate(TestCase):
+
+    def test_same_as_pendulum_parse(self):
+        for date_string in ['1980', '1980-05', '1980-05-06', '1980-05-06T12:30:00']:
+            self.assertEqual(_parse_series_date(date_string), parse(date_string))
+            self.assertEqual(_parse_series_date(date_string).tzinfo, parse(date_string).tzinfo)
+
 
 class TestGetPeriodOfRecordByParmCd(TestCase):
 
@@ -606,6 +679,30 @@ class TestGetPeriodOfRecordByParmCd(TestCase):
         })
 
 
+class TestGetPeriodOfRecordByDataType(TestCase):
+
+    def setUp(self):
+        TestGetPeriodOfRecordByParmCd.setUp(self)
+
+    def test_empty_site_records(self):
+        self.assertEqual(get_period_of_record_by_data_type([]), {})
+
+    def test_all_data_types(self):
+        self.assertEqual(get_period_of_record_by_data_type(self.test_data), {
+            'uv': get_period_of_record_by_parm_cd(self.test_data, 'uv'),
+            'dv': get_period_of_record_by_parm_cd(self.test_data, 'dv')
+        })
+        self.assertEqual(get_period_of_record_by_data_type(self.test_data)['uv']['00065'], {
+            'begin_date': '2000-01-04',
+            'end_date': '2019-03-01'
+        })
+
+    def test_records_not_modified(self):
+        get_period_of_record_by_data_type(self.test_data)
+        self.assertEqual(self.test_data[1]['begin_date'], '2001-01-04')
+        self.assertEqual(self.test_data[1]['end_date'], '2018-03-01')
+
+
 class TestGetDefaultParameterCode(TestCase):
 
     def test_both_iv_and_gw(self):
@@ -0,0 +1,306 @@
+"""
+Tests for the lookup index.
+"""
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from .. import app
+from ..lookups import LazyLookupTables, LookupIndex, SQLiteLookupIndex, compile_lookup_store, index_json_file, \
+    index_json_object, index_state_abbreviations, is_lookup_store_current, load_lookup_json, write_json_file_offsets
+from ..utils import RdbRecord
+
+
+class TestIndexStateAbbreviations(TestCase):
+
+    def test_first_abbreviation_used(self):
+        self.assertEqual(index_state_abbreviations([
+            {'name': 'Wisconsin', 'abbreviation': 'WI'},
+            {'name': 'Wisconsin', 'abbreviation': 'XX'},
+            {'name': 'Iowa', 'abbreviation': 'IA'}
+        ]), {'Wisconsin': 'WI', 'Iowa': 'IA'})
+
+
+class TestLoadLookupJson(TestCase):
+
+    def setUp(self):
+        self.text = json.dumps({
+            'hucs': {
+                '0101': {'kind': 'HUC4', 'huc_nm': 'St. John', 'children': ['010100']},
+                '0102': {'kind': 'HUC4', 'huc_nm': 'Penobscot', 'children': []}
+            },
+            'county_cd': {
+                '001': {'name': 'Adams County'},
+                '003': {'name': 'Adams County'}
+            }
+        })
+
+    def test_same_as_json_loads(self):
+        self.assertEqual(load_lookup_json(self.text), json.loads(self.text))
+        self.assertEqual(load_lookup_json(self.text, compact_records=True), json.loads(self.text))
+
+    def test_strings_and_objects_shared(self):
+        lookups = load_lookup_json(self.text)
+        self.assertIs(lookups['hucs']['0101']['kind'], lookups['hucs']['0102']['kind'])
+        self.assertIs(lookups['county_cd']['001'], lookups['county_cd']['003'])
+        self.assertIsInstance(lookups['hucs']['0101'], dict)
+
+    def test_compact_records(self):
+        lookups = load_lookup_json(self.text, compact_records=True)
+        self.assertIsInstance(lookups['hucs'], dict)
+        self.assertIsInstance(lookups['hucs']['0101'], RdbRecord)
+        self.assertEqual(lookups['hucs']['0101']['children'], ['010100'])
+        self.assertIs(lookups['hucs']['0101']._index, lookups['hucs']['0102']._index)  # pylint: disable=W0212
+        self.assertIs(lookups['county_cd']['001'], lookups['county_cd']['003'])
+        self.assertEqual(lookups['county_cd']['001'].get('name'), 'Adams County')
+
+
+class TestIndexJsonObject(TestCase):
+
+    def test_spans(self):
+        text = ' { "a" : {"b": [1, {"c": "}"}]}, "d":"e" ,"f": 2 } '
+        spans = index_json_object(text)
+        self.assertEqual(list(spans), ['a', 'd', 'f'])
+        self.assertEqual({key: json.loads(text[start:end]) for key, (start, end) in spans.items()},
+                         json.loads(text))
+
+    def test_empty_object(self):
+        self.assertEqual(index_json_object('{ }'), {})
+
+    def test_not_an_object(self):
+        for text in ['[1, 2]', '{"a": 1', '{"a" 1}', '{"a": 1; "b": 2}']:
+            with self.assertRaises(ValueError):
+                index_json_object(text)
+
+
+class TestIndexJsonFile(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'lookup.json')
+        self.lookups = {'a': {'name': 'Caf\u00e9'}, 'b': ['\u00c9t\u00e9'], 'c': 1}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.lookups, f, ensure_ascii=False)
+
+    def assert_offsets(self, offsets):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.assertEqual({key: json.loads(data[start:end].decode('utf-8')) for key, (start, end) in offsets.items()},
+                         self.lookups)
+
+    def test_scanned(self):
+        offsets = index_json_file(self.path)
+        self.assertEqual(list(offsets), ['a', 'b', 'c'])
+        self.assert_offsets(offsets)
+
+    def test_recorded_offsets(self):
+        self.assertEqual(write_json_file_offsets(self.path), 3)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'lookup.offsets.json')))
+
+        with mock.patch('waterdata.lookups.index_json_object') as index_mock:
+            offsets = index_json_file(self.path)
+        index_mock.assert_not_called()
+        self.assert_offsets(offsets)
+
+    def test_recorded_offsets_out_of_date(self):
+        write_json_file_offsets(self.path)
+        self.lookups['d'] = 'new'
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.lookups, f, ensure_ascii=False)
+
+        offsets = index_json_file(self.path)
+        self.assertEqual(list(offsets), ['a', 'b', 'c', 'd'])
+        self.assert_offsets(offsets)
+
+    def test_shipped_offsets_current(self):
+        path = os.path.join(app.config['DATA_DIR'], app.config['NWIS_CODE_LOOKUP_FILENAME'])
+        with mock.patch('waterdata.lookups.index_json_object') as index_mock:
+            index_json_file(path)
+        index_mock.assert_not_called()
+
+
+class TestLazyLookupTables(TestCase):
+
+    def setUp(self):
+        self.loads = []
+
+        def load_table(table):
+            self.loads.append(table)
+            return {'code': table}
+
+        self.tables = LazyLookupTables(lambda: ['site_tp_cd', 'parm_cd'], load_table)
+
+    def test_loaded_on_first_access(self):
+        self.assertIn('parm_cd', self.tables)
+        self.assertNotIn('stat_cd', self.tables)
+        self.assertEqual(list(self.tables), ['site_tp_cd', 'parm_cd'])
+        self.assertEqual(len(self.tables), 2)
+        self.assertEqual(self.loads, [])
+
+        self.assertEqual(self.tables['parm_cd']['code'], 'parm_cd')
+        self.assertEqual(self.tables.get('parm_cd'), {'code': 'parm_cd'})
+        self.assertEqual(self.loads, ['parm_cd'])
+        self.assertEqual(self.tables.loaded_tables, ['parm_cd'])
+
+    def test_missing_table(self):
+        with self.assertRaises(KeyError):
+            self.tables['stat_cd']  # pylint: disable=W0104
+        self.assertEqual(self.tables.get('stat_cd', {}), {})
+        self.assertEqual(self.loads, [])
+
+    def test_load_all(self):
+        self.tables.load_all()
+        self.assertEqual(self.tables.loaded_tables, ['site_tp_cd', 'parm_cd'])
+
+    def test_from_json_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(TEST_CODE_LOOKUPS, f)
+        try:
+            tables = LazyLookupTables.from_json_file(f.name)
+            self.assertEqual(tables['site_tp_cd'], TEST_CODE_LOOKUPS['site_tp_cd'])
+            self.assertEqual(tables.loaded_tables, ['site_tp_cd'])
+            self.assertEqual(dict(tables), TEST_CODE_LOOKUPS)
+        finally:
+            os.remove(f.name)
+
+    def test_from_json_file_parses_used_tables(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(TEST_CODE_LOOKUPS, f, indent=2)
+        try:
+            tables = LazyLookupTables.from_json_file(f.name)
+            with mock.patch('waterdata.lookups.load_lookup_json', wraps=load_lookup_json) as load_mock:
+                self.assertIn('parm_cd', tables)
+                load_mock.assert_not_called()
+                self.assertEqual(tables['site_tp_cd'], TEST_CODE_LOOKUPS['site_tp_cd'])
+            load_mock.assert_called_once()
+            self.assertEqual(json.loads(load_mock.call_args[0][0]), TEST_CODE_LOOKUPS['site_tp_cd'])
+        finally:
+            os.remove(f.name)
+
+
+TEST_CODE_LOOKUPS = {
+    'site_tp_cd': {'ST': {'name': 'Stream'}},
+    'parm_cd': {'00060': {'name': 'Discharge', 'group': 'Physical'}}
+}
+TEST_COUNTRY_STATE_COUNTY_LOOKUPS = {
+    'US': {'state_cd': {
+        '55': {'name': 'Wisconsin', 'county_cd': {'003': {'name': 'Ashland County'}}}
+    }}
+}
+TEST_HUC_LOOKUPS = {
+    'hucs': {'07': {'huc_nm': 'Upper Mississippi Region', 'kind': 'HUC2'}},
+    'classes': {'HUC2': ['07']}
+}
+
+
+class TestLookupIndex(TestCase):
+
+    def setUp(self):
+        self.lookup_index = LookupIndex(
+            TEST_CODE_LOOKUPS,
+            TEST_COUNTRY_STATE_COUNTY_LOOKUPS,
+            TEST_HUC_LOOKUPS,
+            states=[{'name': 'Wisconsin', 'abbreviation': 'WI'}]
+        )
+
+    def test_states(self):
+        self.assertEqual(self.lookup_index.get_state_abbreviation('Wisconsin'), 'WI')
+        self.assertIsNone(self.lookup_index.get_state_abbreviation(None))
+        self.assertEqual(list(self.lookup_index.get_states('US')), ['55'])
+        self.assertEqual(self.lookup_index.get_states('MX'), {})
+        self.assertEqual(self.lookup_index.get_state('US', '55')['name'], 'Wisconsin')
+        self.assertEqual(self.lookup_index.get_state_name('US', '55'), 'Wisconsin')
+        self.assertIsNone(self.lookup_index.get_state_name('US', '56'))
+        self.assertIsNone(self.lookup_index.get_state_name('CA', '55'))
+
+    def test_counties(self):
+        self.assertEqual(self.lookup_index.get_county('US', '55', '003'), {'name': 'Ashland County'})
+        self.assertEqual(self.lookup_index.get_county_name('US', '55', '003'), 'Ashland County')
+        self.assertIsNone(self.lookup_index.get_county('US', '56', '003'))
+        self.assertIsNone(self.lookup_index.get_county_name('US', '55', '005'))
+
+    def test_hucs(self):
+        self.assertEqual(self.lookup_index.get_huc('07')['kind'], 'HUC2')
+        self.assertEqual(self.lookup_index.get_huc_name('07'), 'Upper Mississippi Region')
+        self.assertIsNone(self.lookup_index.get_huc_name('08'))
+        self.assertEqual(self.lookup_index.get_huc_class('HUC2'), ['07'])
+        self.assertEqual(self.lookup_index.get_huc_class('HUC4'), [])
+        with app.test_request_context():
+            self.assertEqual(self.lookup_index.get_huc_url('07'), '/hydrological-unit/07/')
+
+    def test_codes(self):
+        self.assertTrue(self.lookup_index.has_code_table('site_tp_cd'))
+        self.assertFalse(self.lookup_index.has_code_table('stat_cd'))
+        self.assertEqual(self.lookup_index.get_code_table('site_tp_cd'), {'ST': {'name': 'Stream'}})
+        self.assertEqual(self.lookup_index.get_code('parm_cd', '00060')['group'], 'Physical')
+        self.assertIsNone(self.lookup_index.get_code('parm_cd', '00065'))
+        self.assertEqual(self.lookup_index.get_code_name('site_tp_cd', 'ST'), 'Stream')
+        self.assertIsNone(self.lookup_index.get_code_name('site_tp_cd', 'GW'))
+        self.assertIsNone(self.lookup_index.get_code_name('stat_cd', '00003'))
+
+    def test_empty_lookups(self):
+        lookup_index = LookupIndex({}, {}, {})
+        self.assertIsNone(lookup_index.get_state_name('US', '55'))
+        self.assertIsNone(lookup_index.get_huc('07'))
+
+
+class TestSQLiteLookupIndex(TestLookupIndex):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.source_paths = []
+        for name, lookups in [('codes.json', TEST_CODE_LOOKUPS),
+                              ('regions.json', TEST_COUNTRY_STATE_COUNTY_LOOKUPS),
+                              ('hucs.json', TEST_HUC_LOOKUPS)]:
+            path = os.path.join(self.data_dir, name)
+            with open(path, 'w') as f:
+                json.dump(lookups, f)
+            self.source_paths.append(path)
+        self.store_path = os.path.join(self.data_dir, 'lookups.db')
+        self.count = compile_lookup_store(self.store_path, *self.source_paths)
+        self.lookup_index = SQLiteLookupIndex(self.store_path, cache_size=10,
+                                              states=[{'name': 'Wisconsin', 'abbreviation': 'WI'}])
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_empty_lookups(self):
+        for path in self.source_paths:
+            with open(path, 'w') as f:
+                json.dump({}, f)
+        store_path = os.path.join(self.data_dir, 'empty.db')
+        self.assertEqual(compile_lookup_store(store_path, *self.source_paths), 0)
+        lookup_index = SQLiteLookupIndex(store_path)
+        self.assertIsNone(lookup_index.get_state_name('US', '55'))
+        self.assertIsNone(lookup_index.get_huc('07'))
+        self.assertFalse(lookup_index.has_code_table('site_tp_cd'))
+
+    def test_entries_written(self):
+        # two code tables, two codes, a state, a county, a huc and a huc class
+        self.assertEqual(self.count, 8)
+
+    def test_entries_cached(self):
+        self.lookup_index.get_huc('07')
+        self.lookup_index.get_huc('07')
+        self.lookup_index.get_huc('08')
+        self.lookup_index.get_huc('08')
+        self.assertEqual(self.lookup_index.stats()['hits'], 2)
+
+    def test_store_current(self):
+        self.assertTrue(is_lookup_store_current(self.store_path, *self.source_paths))
+        self.assertFalse(is_lookup_store_current(os.path.join(self.data_dir, 'missing.db'), *self.source_paths))
+        with open(self.source_paths[2], 'w') as f:
+            json.dump({'hucs': {}, 'classes': {}}, f)
+        self.assertFalse(is_lookup_store_current(self.store_path, *self.source_paths))
+
+    def test_lazy_code_tables(self):
+        self.assertEqual(self.lookup_index.get_code_table_names(), ['site_tp_cd', 'parm_cd'])
+        tables = LazyLookupTables(self.lookup_index.get_code_table_names, self.lookup_index.get_code_table)
+        self.assertEqual(tables['parm_cd']['00060']['name'], 'Discharge')
+        self.assertEqual(tables.loaded_tables, ['parm_cd'])
+
+    def test_not_a_store(self):
+        self.assertFalse(is_lookup_store_current(self.source_paths[0], *self.source_paths))
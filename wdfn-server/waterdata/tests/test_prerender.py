@@ -0,0 +1,128 @@
+"""
+Tests for the pre-rendering of the state, county and hydrologic unit pages.
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from whitenoise import WhiteNoise
+
+from .. import app, lookup_paths
+from ..prerender import add_prerendered_page_headers, get_prerender_fingerprint, get_prerender_paths, \
+    prerender_pages
+
+TEST_PATHS = ['/states/', '/states/55/', '/states/55/counties/025/', '/hydrological-unit/07/']
+
+
+class TestGetPrerenderPaths(TestCase):
+
+    def test_paths(self):
+        paths = get_prerender_paths(app.config['LOOKUP_INDEX'])
+
+        for path in ['/states/', '/states/55/', '/states/55/counties/025/', '/hydrological-unit/',
+                     '/hydrological-unit/07/', '/hydrological-unit/07070005/']:
+            self.assertIn(path, paths)
+        self.assertEqual(len(paths), len(set(paths)))
+
+    def test_disabled_pages(self):
+        with mock.patch.dict(app.config, {'STATE_COUNTY_PAGES_ENABLED': False}):
+            paths = get_prerender_paths(app.config['LOOKUP_INDEX'])
+
+        self.assertNotIn('/states/', paths)
+        self.assertIn('/hydrological-unit/', paths)
+
+
+class TestPrerenderPages(TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        patcher = mock.patch('waterdata.prerender.get_prerender_paths', return_value=list(TEST_PATHS))
+        self.paths_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_page(self, *parts):
+        with open(os.path.join(self.output_dir, *parts, 'index.html'), 'r') as f:
+            return f.read()
+
+    def test_pages_written(self):
+        counts = prerender_pages(self.output_dir, lookup_paths)
+
+        self.assertEqual(counts, {'rendered': 4, 'written': 4, 'removed': 0})
+        self.assertIn('Wisconsin', self.read_page('states', '55'))
+        self.assertIn('Dane County', self.read_page('states', '55', 'counties', '025'))
+        self.assertIn('Upper Mississippi', self.read_page('hydrological-unit', '07'))
+        self.assertFalse(app.config['CDN_CACHEABLE_RESPONSES'])
+
+    def test_up_to_date(self):
+        prerender_pages(self.output_dir, lookup_paths)
+
+        self.assertIsNone(prerender_pages(self.output_dir, lookup_paths))
+        self.assertEqual(prerender_pages(self.output_dir, lookup_paths, force=True),
+                         {'rendered': 4, 'written': 0, 'removed': 0})
+
+    def test_missing_page_rendered(self):
+        prerender_pages(self.output_dir, lookup_paths)
+        os.remove(os.path.join(self.output_dir, 'states', '55', 'index.html'))
+
+        self.assertEqual(prerender_pages(self.output_dir, lookup_paths), {'rendered': 4, 'written': 1, 'removed': 0})
+
+    def test_changed_fingerprint(self):
+        prerender_pages(self.output_dir, lookup_paths)
+        self.paths_mock.return_value = TEST_PATHS[:2] + ['/states/99/']
+
+        with mock.patch.dict(app.config, {'BANNER_NOTICES': ['A new notice']}):
+            counts = prerender_pages(self.output_dir, lookup_paths)
+
+        self.assertEqual(counts, {'rendered': 2, 'written': 2, 'removed': 2})
+        self.assertIn('A new notice', self.read_page('states'))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, 'hydrological-unit', '07', 'index.html')))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, 'states', '99')))
+
+    def test_served_pages_rendered_again(self):
+        prerender_pages(self.output_dir, lookup_paths)
+        served_app = WhiteNoise(app.wsgi_app, root=self.output_dir, index_file=True)
+
+        with mock.patch.object(app, 'wsgi_app', served_app), \
+                mock.patch.dict(app.config, {'BANNER_NOTICES': ['A new notice']}):
+            counts = prerender_pages(self.output_dir, lookup_paths, force=True)
+
+        self.assertEqual(counts, {'rendered': 4, 'written': 4, 'removed': 0})
+        self.assertIn('A new notice', self.read_page('states', '55'))
+
+
+class TestGetPrerenderFingerprint(TestCase):
+
+    def test_settings_read_by_templates(self):
+        fingerprint = get_prerender_fingerprint(lookup_paths)
+
+        self.assertEqual(get_prerender_fingerprint(lookup_paths), fingerprint)
+        with mock.patch.dict(app.config, {'GA_TRACKING_CODE': 'UA-1'}):
+            self.assertNotEqual(get_prerender_fingerprint(lookup_paths), fingerprint)
+        with mock.patch.dict(app.config, {'SITE_DATA_ENDPOINT': 'https://example.com'}):
+            self.assertEqual(get_prerender_fingerprint(lookup_paths), fingerprint)
+
+
+class TestAddPrerenderedPageHeaders(TestCase):
+
+    def test_cdn_cacheable(self):
+        headers = {'Cache-Control': 'max-age=60, public'}
+        with mock.patch.dict(app.config, {'CDN_CACHEABLE_RESPONSES': True}):
+            add_prerendered_page_headers(headers, '/pages/states/55/index.html', '/states/55/')
+
+        self.assertEqual(headers['Cache-Control'], app.config['CACHE_CONTROL']['states_counties'])
+        self.assertEqual(headers['Surrogate-Key'], 'states_counties state/55')
+
+    def test_not_cdn_cacheable(self):
+        headers = {'Cache-Control': 'max-age=60, public'}
+        add_prerendered_page_headers(headers, '/pages/states/55/index.html', '/states/55/')
+
+        self.assertEqual(headers, {'Cache-Control': 'max-age=60, public'})
+
+    def test_other_files(self):
+        headers = {}
+        with mock.patch.dict(app.config, {'CDN_CACHEABLE_RESPONSES': True}):
+            add_prerendered_page_headers(headers, '/pages/prerender-manifest.json', '/prerender-manifest.json')
+
+        self.assertEqual(headers, {})
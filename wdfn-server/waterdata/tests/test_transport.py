@@ -0,0 +1,269 @@
+"""
+Tests for the HTTP transport.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+from unittest import TestCase, mock
+
+from requests.exceptions import ConnectionError as RequestsConnectionError, ReadTimeout
+from requests_mock import Mocker
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+from .. import app
+from ..deadline import DeadlineExceeded, deadline
+from ..transport import CircuitBreaker, CircuitOpenError, DeadlineRetry, create_session, end_upstream_failure_record, \
+    get_circuit_breaker_status, get_transport_settings, get_upstream_failures, start_upstream_failure_record
+
+
+class FlakyServer:
+    """
+    Local HTTP server which answers the first request with a 503 and later requests with a 200.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):  # pylint: disable=C0103
+                server.requests += 1
+                self.send_response(503 if server.requests == 1 else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):  # pylint: disable=W0221
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestGetTransportSettings(TestCase):
+
+    def test_default(self):
+        self.assertEqual(get_transport_settings('unknown'), app.config['UPSTREAM_TRANSPORT']['default'])
+
+    def test_upstream_override(self):
+        with mock.patch.dict(app.config, {'UPSTREAM_TRANSPORT': {
+                'default': {'connect_timeout': 1, 'read_timeout': 2},
+                'slow': {'read_timeout': 30}
+        }}):
+            self.assertEqual(get_transport_settings('slow'), {'connect_timeout': 1, 'read_timeout': 30})
+
+
+class TestCreateSession(TestCase):
+
+    def setUp(self):
+        self.settings = dict(app.config['UPSTREAM_TRANSPORT']['default'], connect_timeout=2, read_timeout=7)
+
+    def test_default_timeout(self):
+        with mock.patch('waterdata.transport.get_transport_settings', return_value=self.settings):
+            session = create_session('test')
+        with Mocker(session=session) as session_mock:
+            session_mock.get('https://fake.gov/', text='OK')
+            session.get('https://fake.gov/')
+            self.assertEqual(session_mock.request_history[0].timeout, (2, 7))
+
+            session.get('https://fake.gov/', timeout=1)
+            self.assertEqual(session_mock.request_history[1].timeout, 1)
+
+    def test_timeout_bounded_by_deadline(self):
+        with mock.patch('waterdata.transport.get_transport_settings', return_value=self.settings):
+            session = create_session('test')
+        with Mocker(session=session) as session_mock:
+            session_mock.get('https://fake.gov/', text='OK')
+            with deadline(5):
+                session.get('https://fake.gov/')
+            connect_timeout, read_timeout = session_mock.request_history[0].timeout
+            self.assertEqual(connect_timeout, 2)
+            self.assertTrue(read_timeout <= 5)
+
+            with deadline(0):
+                with self.assertRaises(DeadlineExceeded):
+                    session.get('https://fake.gov/')
+            self.assertEqual(session_mock.call_count, 1)
+
+    def test_adapter(self):
+        with mock.patch('waterdata.transport.get_transport_settings', return_value=self.settings):
+            session = create_session('test')
+        adapter = session.get_adapter('https://fake.gov/')
+        self.assertEqual(adapter.max_retries.total, self.settings['retries'])
+        self.assertEqual(adapter.max_retries.read, 0)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+        self.assertEqual(adapter._pool_maxsize, self.settings['pool_maxsize'])  # pylint: disable=W0212
+
+    def test_retry_within_deadline(self):
+        settings = dict(self.settings, connect_timeout=1, backoff_factor=0)
+        with mock.patch('waterdata.transport.get_transport_settings', return_value=settings):
+            session = create_session('test')
+        with FlakyServer() as server:
+            with deadline(5):
+                response = session.get(server.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(server.requests, 2)
+
+    def test_no_retry_without_time_to_connect(self):
+        settings = dict(self.settings, connect_timeout=1, backoff_factor=0)
+        with mock.patch('waterdata.transport.get_transport_settings', return_value=settings):
+            session = create_session('test')
+        with FlakyServer() as server:
+            with deadline(0.5):
+                response = session.get(server.url)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(server.requests, 1)
+
+    def test_timeout_cut_short_by_deadline(self):
+        settings = dict(self.settings, failure_threshold=1)
+        with mock.patch('waterdata.transport.get_transport_settings', return_value=settings):
+            session = create_session('test')
+        with Mocker(session=session) as session_mock:
+            session_mock.get('https://fake.gov/', exc=ReadTimeout)
+            with deadline(5):
+                with self.assertRaises(ReadTimeout):
+                    session.get('https://fake.gov/')
+            self.assertEqual(session.circuit_breaker.status()['failures'], 0)
+
+            with self.assertRaises(ReadTimeout):
+                session.get('https://fake.gov/')
+            self.assertEqual(session.circuit_breaker.state, CircuitBreaker.OPEN)
+
+    def test_circuit_breaker_registered(self):
+        session = create_session('test-upstream')
+        self.assertIs(session.circuit_breaker.status()['state'], CircuitBreaker.CLOSED)
+        self.assertIn('test-upstream', get_circuit_breaker_status())
+
+    def test_circuit_breaker_opens(self):
+        settings = dict(self.settings, failure_threshold=2, retries=0)
+        with mock.patch('waterdata.transport.get_transport_settings', return_value=settings):
+            session = create_session('test')
+        with Mocker(session=session) as session_mock:
+            session_mock.get('https://fake.gov/', status_code=500)
+            session.get('https://fake.gov/')
+            session.get('https://fake.gov/')
+            with self.assertRaises(CircuitOpenError):
+                session.get('https://fake.gov/')
+            self.assertEqual(session_mock.call_count, 2)
+
+
+class TestUpstreamFailureRecord(TestCase):
+
+    def setUp(self):
+        settings = dict(app.config['UPSTREAM_TRANSPORT']['default'], retries=0)
+        with mock.patch('waterdata.transport.get_transport_settings', return_value=settings):
+            self.session = create_session('test')
+
+    def test_failures_recorded(self):
+        token = start_upstream_failure_record()
+        try:
+            with Mocker(session=self.session) as session_mock:
+                session_mock.get('https://fake.gov/ok', text='OK')
+                session_mock.get('https://fake.gov/missing', status_code=404)
+                session_mock.get('https://fake.gov/error', status_code=500)
+                session_mock.get('https://fake.gov/down', exc=RequestsConnectionError)
+                self.session.get('https://fake.gov/ok')
+                self.session.get('https://fake.gov/missing')
+                self.assertEqual(get_upstream_failures(), [])
+
+                self.session.get('https://fake.gov/error')
+                with self.assertRaises(RequestsConnectionError):
+                    self.session.get('https://fake.gov/down')
+                with deadline(0):
+                    with self.assertRaises(DeadlineExceeded):
+                        self.session.get('https://fake.gov/ok')
+            failures = get_upstream_failures()
+        finally:
+            end_upstream_failure_record(token)
+
+        self.assertEqual(len(failures), 3)
+        self.assertTrue(failures[0].startswith('GET https://fake.gov/error: 500'))
+        self.assertTrue(failures[1].startswith('GET https://fake.gov/down'))
+        self.assertIn('DeadlineExceeded', failures[2])
+
+    def test_not_recorded_outside_record(self):
+        with Mocker(session=self.session) as session_mock:
+            session_mock.get('https://fake.gov/error', status_code=500)
+            self.session.get('https://fake.gov/error')
+
+        self.assertEqual(get_upstream_failures(), [])
+
+
+class TestDeadlineRetry(TestCase):
+
+    def setUp(self):
+        self.retry = DeadlineRetry(total=3, backoff_factor=1, min_attempt_time=2)
+
+    def test_without_deadline(self):
+        retry = self.retry.increment(error=ConnectTimeoutError()).increment(error=ConnectTimeoutError())
+        self.assertEqual(retry.total, 1)
+        self.assertEqual(retry.min_attempt_time, 2)
+
+    def test_time_left(self):
+        with deadline(10):
+            retry = self.retry.increment(error=ConnectTimeoutError())
+        self.assertEqual(retry.total, 2)
+
+    def test_backoff_past_deadline(self):
+        retry = self.retry.increment(error=ConnectTimeoutError())
+        with deadline(3):
+            # The second retry backs off for 2 seconds
+            with self.assertRaises(MaxRetryError):
+                retry.increment(error=ConnectTimeoutError())
+
+
+class TestCircuitBreaker(TestCase):
+
+    def setUp(self):
+        self.clock = mock.Mock(return_value=1000)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=self.clock)
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        self.assertEqual(self.breaker.status()['short_circuited'], 1)
+
+    def test_half_open_probe_success(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.return_value = 1030
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_half_open_probe_failure(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.return_value = 1030
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_half_open_probe_inconclusive(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.return_value = 1030
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_inconclusive()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
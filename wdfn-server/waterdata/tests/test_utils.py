@@ -2,6 +2,9 @@
 Unit tests for the main WDFN views.
 """
 
+import io
+import pickle
+import threading
 from unittest import TestCase, mock
 
 from flask import Response
@@ -9,9 +12,10 @@ from flask import Response
 import requests as r
 
 from .. import app
+from ..transport import end_upstream_failure_record, get_upstream_failures, start_upstream_failure_record
 
 from ..utils import construct_url, defined_when, execute_get_request, parse_rdb, set_cookie_for_banner_message,\
-    create_message
+    create_message, execute_concurrently, iter_rdb_lines, parse_rdb_records, parse_rdb_table, RdbRecord, RdbTable
 
 
 class TestConstructUrl(TestCase):
@@ -79,6 +83,13 @@ class TestCookieSetting(TestCase):
             set_cookie_for_banner_message(self.response)
             self.assertEqual([], self.response.headers.getlist('Set-Cookie'))
 
+    def test_set_cookie_for_banner_message_cdn_cacheable(self):
+        app.config['SET_COOKIE_TO_HIDE_BANNER_NOTICES'] = True
+        with mock.patch.dict(app.config, {'CDN_CACHEABLE_RESPONSES': True}):
+            with app.test_request_context('/'):
+                set_cookie_for_banner_message(self.response)
+                self.assertEqual([], self.response.headers.getlist('Set-Cookie'))
+
 
 class TestGetWaterServicesData(TestCase):
 
@@ -107,14 +118,14 @@ class TestGetWaterServicesData(TestCase):
                               'NAD83\t 151.20\t .1\tNAVD88\t02070010\n')
         self.test_bad_resp = 'Garbage Text'
 
-    @mock.patch('waterdata.utils.r.get')
-    def test_success(self, r_mock):
+    @mock.patch('waterdata.utils._get_session')
+    def test_success(self, session_mock):
+        r_mock = session_mock.return_value.get
         m_resp = mock.Mock(r.Response)
         m_resp.text = self.test_rdb_text
         m_resp.reason = 'OK'
         r_mock.return_value = m_resp
 
-        r_mock.get(self.test_url, status_code=200, text=self.test_rdb_text, reason='OK')
         result = execute_get_request(self.test_service_root,
                                      path='/nwis/site/',
                                      params={'site': self.test_site_number}
@@ -123,8 +134,9 @@ class TestGetWaterServicesData(TestCase):
         self.assertEqual(self.test_rdb_text, result.text)
         self.assertEqual('OK', result.reason)
 
-    @mock.patch('waterdata.utils.r.get')
-    def test_bad_request(self, r_mock):
+    @mock.patch('waterdata.utils._get_session')
+    def test_bad_request(self, session_mock):
+        r_mock = session_mock.return_value.get
         m_resp = mock.Mock(spec=r.Response)
         m_resp.status_code = 400
         m_resp.text = self.test_bad_resp
@@ -139,8 +151,9 @@ class TestGetWaterServicesData(TestCase):
         self.assertEqual(self.test_bad_resp, result.text)
         self.assertEqual('Some Reason', result.reason)
 
-    @mock.patch('waterdata.utils.r.get')
-    def test_no_opt_args(self, r_mock):
+    @mock.patch('waterdata.utils._get_session')
+    def test_no_opt_args(self, session_mock):
+        r_mock = session_mock.return_value.get
         m_resp = mock.Mock(spec=r.Response)
         m_resp.status_code = 200
         r_mock.return_value = m_resp
@@ -149,8 +162,9 @@ class TestGetWaterServicesData(TestCase):
         r_mock.assert_called_with('http://blah.usgs.fake', params=None)
         self.assertEqual(result.status_code, 200)
 
-    @mock.patch('waterdata.utils.r.get')
-    def test_service_timeout(self, r_mock):
+    @mock.patch('waterdata.utils._get_session')
+    def test_service_timeout(self, session_mock):
+        r_mock = session_mock.return_value.get
         r_mock.side_effect = r.exceptions.Timeout
         result = execute_get_request(self.test_url,
                                      path='/nwis/site/',
@@ -161,8 +175,9 @@ class TestGetWaterServicesData(TestCase):
         self.assertIsNone(result.content)
         self.assertEqual(result.text, '')
 
-    @mock.patch('waterdata.utils.r.get')
-    def test_connection_error(self, r_mock):
+    @mock.patch('waterdata.utils._get_session')
+    def test_connection_error(self, session_mock):
+        r_mock = session_mock.return_value.get
         r_mock.side_effect = r.exceptions.ConnectionError
         result = execute_get_request(self.test_url,
                                      path='/nwis/site/',
@@ -173,6 +188,49 @@ class TestGetWaterServicesData(TestCase):
         self.assertIsNone(result.content)
         self.assertEqual(result.text, '')
 
+    @mock.patch('waterdata.utils._get_session')
+    def test_upstream_session(self, session_mock):
+        execute_get_request(self.test_service_root, upstream='camera')
+        session_mock.assert_called_with('camera')
+
+
+class TestExecuteConcurrently(TestCase):
+
+    def test_results_by_name(self):
+        result = execute_concurrently({
+            'sum': (lambda a, b: a + b, (1, 2), None),
+            'upper': (str.upper, ('abc',), '')
+        })
+        self.assertEqual(result, {'sum': 3, 'upper': 'ABC'})
+
+    def test_error_uses_fallback(self):
+        def failing_call():
+            raise ValueError('Bad call')
+
+        result = execute_concurrently({
+            'bad': (failing_call, (), []),
+            'good': (len, ('abc',), 0)
+        })
+        self.assertEqual(result, {'bad': [], 'good': 3})
+
+    def test_fallback_recorded(self):
+        def failing_call():
+            raise ValueError('Bad call')
+
+        token = start_upstream_failure_record()
+        try:
+            execute_concurrently({'bad': (failing_call, (), []), 'good': (len, ('abc',), 0)})
+            self.assertEqual(get_upstream_failures(), ["bad: ValueError('Bad call')"])
+        finally:
+            end_upstream_failure_record(token)
+
+    def test_calls_run_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+        result = execute_concurrently({
+            name: (barrier.wait, (), None) for name in ('one', 'two', 'three')
+        })
+        self.assertEqual(sorted(result.values()), [0, 1, 2])
+
 
 class TestDefinedWhen(TestCase):
     def setUp(self):
@@ -290,3 +348,126 @@ class TestParseRdb(TestCase):
         result = parse_rdb(iter(self.test_rdb_lines + ['\n', '\n']))
         result_list = list(result)
         self.assertEqual(len(result_list), 2)
+
+
+class TestParseRdbRecords(TestCase):
+
+    def setUp(self):
+        TestParseRdb.setUp(self)
+
+    def test_same_as_parse_rdb(self):
+        records = list(parse_rdb_records(iter(self.test_rdb_lines)))
+        self.assertEqual(records, list(parse_rdb(iter(self.test_rdb_lines))))
+        self.assertEqual(records[0]['site_no'], '345670')
+        self.assertEqual(records[1].get('station_nm'), 'Some Random Site 1')
+        self.assertIsNone(records[1].get('not_a_column'))
+
+    def test_column_projection(self):
+        records = list(parse_rdb_records(iter(self.test_rdb_lines), columns=['site_no', 'huc_cd', 'not_a_column']))
+        self.assertEqual(records[0], {'site_no': '345670', 'huc_cd': '02070010'})
+        self.assertNotIn('station_nm', records[0])
+
+    def test_no_data(self):
+        with self.assertRaises(Exception):
+            list(parse_rdb_records(iter([])))
+
+    def test_no_records(self):
+        self.assertFalse(list(parse_rdb_records(iter(self.test_rdb_lines[:-2]))))
+
+    def test_ignore_empty_lines(self):
+        self.assertEqual(len(list(parse_rdb_records(iter(self.test_rdb_lines + ['', '  '])))), 2)
+
+    def test_short_record(self):
+        records = list(parse_rdb_records(iter(self.test_rdb_lines[:-2] + ['USGS\t345670'])))
+        self.assertEqual(records[0], {'agency_cd': 'USGS', 'site_no': '345670'})
+        with self.assertRaises(KeyError):
+            records[0]['huc_cd']  # pylint: disable=W0104
+
+    def test_records_share_index_and_pickle(self):
+        records = list(parse_rdb_records(iter(self.test_rdb_lines)))
+        self.assertIsInstance(records[0], RdbRecord)
+        self.assertIs(records[0]._index, records[1]._index)  # pylint: disable=W0212
+        self.assertEqual(pickle.loads(pickle.dumps(records)), records)
+
+
+class TestParseRdbTable(TestCase):
+
+    def setUp(self):
+        TestParseRdb.setUp(self)
+        self.test_rdb_lines = self.test_rdb_lines + [
+            ('USGS	345669	A Random Well	GW	201.94977778	-101.12763889	S	NAD83	 '
+             '151.20	 .1	NAVD88	02070010')
+        ]
+
+    def test_same_as_parse_rdb(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines))
+        self.assertIsInstance(table, RdbTable)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(list(table), list(parse_rdb(iter(self.test_rdb_lines))))
+        self.assertEqual(table[1]['station_nm'], 'Some Random Site 1')
+
+    def test_column_projection(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines), columns=['site_no', 'site_tp_cd', 'not_a_column'])
+        self.assertEqual(set(table.columns), {'site_no', 'site_tp_cd'})
+        self.assertEqual(table[0], {'site_no': '345670', 'site_tp_cd': 'ST'})
+
+    def test_repeated_values_shared(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines))
+        self.assertIs(table[0]['huc_cd'], table[2]['huc_cd'])
+
+    def test_no_records(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines[:-3]))
+        self.assertEqual(len(table), 0)
+        self.assertFalse(table)
+        self.assertEqual(table.column('site_no'), [])
+        self.assertEqual(list(table.sorted_by('site_tp_cd', 'site_no')), [])
+        self.assertEqual(len(table.filter_by('site_tp_cd', ['ST'])), 0)
+
+    def test_no_records_column_projection(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines[:-3]), columns=['site_no', 'not_a_column'])
+        self.assertEqual(table.columns, {'site_no': []})
+        self.assertEqual(table.sorted_by('site_no').column('site_no'), [])
+
+    def test_short_record(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines[:-3] + ['USGS\t345670']))
+        self.assertEqual(table[0]['site_no'], '345670')
+        self.assertEqual(table[0]['huc_cd'], '')
+
+    def test_sorted_by(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines))
+        self.assertEqual(table.sorted_by('site_no').column('site_no'), ['345669', '345670', '345671'])
+        self.assertEqual(table.sorted_by('site_tp_cd', 'site_no', reverse=True).column('site_no'),
+                         ['345671', '345670', '345669'])
+        self.assertEqual(table.column('site_no'), ['345670', '345671', '345669'])
+
+    def test_filter_by(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines))
+        self.assertEqual(table.filter_by('site_tp_cd', ['ST']).column('site_no'), ['345670', '345671'])
+        self.assertEqual(table.filter_by('site_tp_cd', ['GW'])[0]['station_nm'], 'A Random Well')
+        self.assertEqual(len(table.filter_by('site_tp_cd', ['LK'])), 0)
+
+    def test_slice_and_pickle(self):
+        table = parse_rdb_table(iter(self.test_rdb_lines))
+        self.assertEqual(table[1:].column('site_no'), ['345671', '345669'])
+        self.assertEqual(pickle.loads(pickle.dumps(table)), table)
+
+
+class TestIterRdbLines(TestCase):
+
+    def make_response(self, body, encoding='utf-8'):
+        response = r.Response()
+        response.raw = io.BytesIO(body)
+        response.encoding = encoding
+        return response
+
+    def test_lines_split_across_chunks(self):
+        response = self.make_response('first line\nsecond line\nlast'.encode('utf-8'))
+        self.assertEqual(list(iter_rdb_lines(response, chunk_size=4)), ['first line', 'second line', 'last'])
+
+    def test_multibyte_characters_split_across_chunks(self):
+        response = self.make_response('Río Grande\nCañon\n'.encode('utf-8'))
+        self.assertEqual(list(iter_rdb_lines(response, chunk_size=1)), ['Río Grande', 'Cañon'])
+
+    def test_no_encoding(self):
+        response = self.make_response(b'a\tb\n', encoding=None)
+        self.assertEqual(list(iter_rdb_lines(response)), ['a\tb'])
@@ -6,11 +6,13 @@ import json
 import re
 from unittest import TestCase, mock
 
+from flask import render_template
+
 import pytest
 import requests_mock
 
 from .. import app
-from ..views import __version__, has_feedback_link
+from ..views import __version__, has_feedback_link, monitoring_location_page_cache
 from ..utils import parse_rdb
 from .mock_test_data import SITE_RDB, PARAMETER_RDB, MOCK_NETWORKS_RESPONSE, MOCK_NETWORK_RESPONSE
 
@@ -130,6 +132,19 @@ class TestMonitoringLocationView(TestCase):
         self.assertEqual(json_ld_response.status_code, 200)
         self.assertIsInstance(json.loads(json_ld_response.data), dict)
 
+    @mock.patch('waterdata.views.SiftaService.get_cooperators')
+    @mock.patch('waterdata.views.SiteService.get_period_of_record')
+    @mock.patch('waterdata.views.SiteService.get_site_data')
+    def test_failed_upstream_call_is_isolated(self, site_mock, param_mock, cooperator_mock):
+        site_mock.return_value = (200, '', [datum for datum in parse_rdb(iter(SITE_RDB.split('\n')))])
+        param_mock.return_value = (200, '', [datum for datum in parse_rdb(iter(PARAMETER_RDB.split('\n')))])
+        cooperator_mock.side_effect = ValueError
+
+        response = self.app_client.get('/monitoring-location/{}/?agency_cd=USGS'.format(self.test_site_number))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Some Random Site', response.data.decode('utf-8'))
+        cooperator_mock.assert_called_with(self.test_site_number)
+
     @mock.patch('waterdata.views.SiteService.get_site_data')
     def test_4xx_from_water_services(self, site_mock):
         site_mock.return_value = (400, 'Site number is invalid.', [])
@@ -169,6 +184,154 @@ class TestMonitoringLocationView(TestCase):
         self.assertEqual(response.status_code, 503)
 
 
+class TestMonitoringLocationPageCache(TestCase):
+
+    def setUp(self):
+        # The banner cookie set by the first response would change the page variant of later requests
+        self.app_client = app.test_client(use_cookies=False)
+        self.test_site_number = '01630500'
+        self.url = '/monitoring-location/{}/?agency_cd=USGS'.format(self.test_site_number)
+        monitoring_location_page_cache.clear()
+
+        site_patcher = mock.patch('waterdata.views.SiteService.get_site_data')
+        self.site_mock = site_patcher.start()
+        self.addCleanup(site_patcher.stop)
+        self.site_mock.return_value = (200, '', list(parse_rdb(iter(SITE_RDB.split('\n')))))
+
+        period_patcher = mock.patch('waterdata.views.SiteService.get_period_of_record')
+        self.period_mock = period_patcher.start()
+        self.addCleanup(period_patcher.stop)
+        self.period_mock.return_value = (200, '', list(parse_rdb(iter(PARAMETER_RDB.split('\n')))))
+
+        for target, value in [('waterdata.views.SiftaService.get_cooperators', []),
+                              ('waterdata.views.TimeZoneService.get_iana_time_zone', 'America/New_York'),
+                              ('waterdata.views.get_monitoring_location_camera_details', [])]:
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        render_patcher = mock.patch('waterdata.views.render_template', wraps=render_template)
+        self.render_mock = render_patcher.start()
+        self.addCleanup(render_patcher.stop)
+
+    def test_etag(self):
+        response = self.app_client.get(self.url)
+        etag, is_weak = response.get_etag()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(etag)
+        self.assertFalse(is_weak)
+        self.assertEqual(self.app_client.get(self.url).get_etag(), (etag, False))
+
+    def test_not_modified(self):
+        etag, _ = self.app_client.get(self.url).get_etag()
+        self.render_mock.reset_mock()
+
+        response = self.app_client.get(self.url, headers={'If-None-Match': '"{}"'.format(etag)})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.get_etag(), (etag, False))
+        self.render_mock.assert_not_called()
+
+    def test_rendered_page_is_reused(self):
+        first_response = self.app_client.get(self.url)
+        second_response = self.app_client.get(self.url)
+
+        self.assertEqual(first_response.data, second_response.data)
+        self.assertEqual(self.render_mock.call_count, 1)
+
+    def test_changed_upstream_payload(self):
+        etag, _ = self.app_client.get(self.url).get_etag()
+        self.period_mock.return_value = (200, '', [])
+
+        response = self.app_client.get(self.url, headers={'If-None-Match': '"{}"'.format(etag)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.get_etag()[0], etag)
+        self.assertEqual(self.render_mock.call_count, 2)
+
+    def test_variants(self):
+        html_etag, _ = self.app_client.get(self.url).get_etag()
+        json_ld_response = self.app_client.get(self.url, headers={'Accept': 'application/ld+json'})
+        other_agency_etag, _ = self.app_client.get(
+            '/monitoring-location/{}/'.format(self.test_site_number)).get_etag()
+
+        self.assertEqual(json_ld_response.mimetype, 'application/ld+json')
+        self.assertIsInstance(json.loads(json_ld_response.data), dict)
+        self.assertEqual(len({html_etag, json_ld_response.get_etag()[0], other_agency_etag}), 3)
+
+    def test_feature_flag_changes_etag(self):
+        etag, _ = self.app_client.get(self.url).get_etag()
+        with mock.patch.dict(app.config, {'DAILY_VALUE_HYDROGRAPH_ENABLED': False}):
+            response = self.app_client.get(self.url, headers={'If-None-Match': '"{}"'.format(etag)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.get_etag()[0], etag)
+
+    def test_5xx_is_not_tagged(self):
+        self.site_mock.return_value = (500, '', None)
+        response = self.app_client.get(self.url)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_etag(), (None, None))
+
+
+class TestPurgeView(TestCase):
+
+    def setUp(self):
+        self.app_client = app.test_client()
+        self.headers = {'Authorization': 'Bearer secret'}
+        config_patcher = mock.patch.dict(app.config, {'PURGE_API_TOKEN': 'secret', 'UPSTREAM_CACHE_BACKEND': 'sqlite'})
+        config_patcher.start()
+        self.addCleanup(config_patcher.stop)
+        purge_patcher = mock.patch('waterdata.views.edge_purger.purge', return_value=True)
+        self.purge_mock = purge_patcher.start()
+        self.addCleanup(purge_patcher.stop)
+
+    def test_disabled(self):
+        app.config['PURGE_API_TOKEN'] = None
+        response = self.app_client.post('/purge/', json={'keys': ['network/RTS']}, headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_unauthorized(self):
+        response = self.app_client.post('/purge/', json={'keys': ['network/RTS']},
+                                        headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 401)
+        self.purge_mock.assert_not_called()
+
+    def test_bad_request(self):
+        for body in [{}, {'keys': []}, {'keys': 'network/RTS'}, {'keys': [1]}]:
+            response = self.app_client.post('/purge/', json=body, headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+
+    def test_cache_not_shared(self):
+        app.config['UPSTREAM_CACHE_BACKEND'] = 'memory'
+        response = self.app_client.post('/purge/', json={'keys': ['network/RTS']}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('error', response.json)
+        self.purge_mock.assert_not_called()
+
+    @mock.patch('waterdata.views.SiteService.invalidate_huc_sites')
+    @mock.patch('waterdata.views.SiteService.invalidate_county_sites')
+    @mock.patch('waterdata.views.SiteService.invalidate_site')
+    @mock.patch('waterdata.views.SiteService.get_site_data')
+    def test_site_purges_county_and_huc(self, site_mock, invalidate_site_mock, county_mock, huc_mock):
+        site_mock.return_value = (200, '', list(parse_rdb(iter(SITE_RDB.split('\n')))))
+
+        response = self.app_client.post('/purge/', json={'keys': ['site/01630500']}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        keys = ['site/01630500', 'county/48/061', 'huc/02070010']
+        self.assertEqual(response.json, {'keys': keys, 'edge_purged': True})
+        invalidate_site_mock.assert_any_call('01630500')
+        invalidate_site_mock.assert_any_call('01630500', 'USGS')
+        county_mock.assert_called_once_with('48061')
+        huc_mock.assert_called_once_with('02070010')
+        self.purge_mock.assert_called_once_with(keys)
+
+
 class TestHydrologicalUnitView:
     # pylint: disable=R0201
 
@@ -259,6 +422,18 @@ class TestCountryStateCountyView:
         response = client.get('/states/01/counties/1/')
         assert response.status_code == 404
 
+    def test_404s_incorrect_state_code_with_county(self, client):
+        response = client.get('/states/1/counties/001/')
+        assert response.status_code == 404
+
+    def test_names_in_listing(self, client):
+        text = client.get('/states/').data.decode('utf-8')
+        assert 'Alabama' in text
+        text = client.get('/states/01/').data.decode('utf-8')
+        assert 'Autauga County' in text
+        text = client.get('/states/23/counties/003/monitoring-locations/').data.decode('utf-8')
+        assert 'Stream' in text
+
     def test_locations_list(self, client):
         response = client.get('/states/23/counties/003/monitoring-locations/')
         assert response.status_code == 200
@@ -274,3 +449,23 @@ class TestTimeSeriesComponentView:
         assert response.status_code == 200
         text = response.data.decode('utf-8')
         assert text.count('class="wdfn-component" data-component="hydrograph"') == 1, 'Component expected'
+
+
+class TestUpstreamStatusView:
+    # pylint: disable=R0201,R0903
+
+    def test_get(self, client):
+        response = client.get('/status/upstreams/')
+        assert response.status_code == 200
+        assert 'nwis_site' in response.json['circuit_breakers']
+        assert 'hits' in response.json['cache']
+
+
+class TestLookupStatusView:
+    # pylint: disable=R0201,R0903
+
+    def test_get(self, client):
+        response = client.get('/status/lookups/')
+        assert response.status_code == 200
+        assert response.json['nwis_code_tables']['count'] == 18
+        assert set(response.json['nwis_code_tables']['loaded']) <= set(app.config['NWIS_CODE_LOOKUP'])
@@ -0,0 +1,306 @@
+"""
+HTTP transport shared by the classes and functions which call upstream services.
+
+Every upstream gets a session with a connection pool sized for the threads of a worker, connect and
+read timeouts, bounded retries with backoff and a circuit breaker. Within a deadline, a request is only
+retried while there is time left for the backoff and another connection. The settings come from the
+UPSTREAM_TRANSPORT configuration, where the 'default' entry is overridden by the entry for the upstream.
+
+The upstream calls which fail, or are skipped because the deadline has passed, are recorded for the current
+request so that a page built from fallback values is not cached for as long as a complete page.
+"""
+from contextvars import ContextVar
+from threading import Lock
+import time
+
+from requests import Session
+from requests.exceptions import ConnectionError as RequestsConnectionError, RequestException, Timeout
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from . import app
+from .deadline import DeadlineExceeded, get_remaining_time
+
+_UPSTREAM_FAILURES = ContextVar('waterdata_upstream_failures', default=None)
+
+
+def start_upstream_failure_record():
+    """
+    Start recording the upstream calls of the current request which fail or are skipped. The record is held
+    in a context variable, so the calls made in the threads used by utils.execute_concurrently are recorded too.
+    :return: token to pass to end_upstream_failure_record
+    """
+    return _UPSTREAM_FAILURES.set([])
+
+
+def end_upstream_failure_record(token):
+    """
+    Stop the record started when start_upstream_failure_record returned token.
+    :param token:
+    """
+    _UPSTREAM_FAILURES.reset(token)
+
+
+def record_upstream_failure(description):
+    """
+    Record that an upstream call failed or was skipped. Nothing is recorded outside of a record.
+    :param str description: the call and its error
+    """
+    failures = _UPSTREAM_FAILURES.get()
+    if failures is not None:
+        failures.append(description)
+
+
+def get_upstream_failures():
+    """
+    Return the descriptions of the upstream calls which failed or were skipped since the record started.
+    :rtype: list of str
+    """
+    return list(_UPSTREAM_FAILURES.get() or [])
+
+
+class CircuitOpenError(RequestsConnectionError):
+    """
+    Raised instead of making a request while the circuit breaker for an upstream is open. It is a
+    ConnectionError so callers fall back the same way they do when the upstream is unreachable.
+    """
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of an upstream. After failure_threshold failures the circuit opens and
+    requests fail fast. Once reset_timeout seconds have passed, the circuit is half open and a single
+    probe request is allowed through. A successful probe closes the circuit and a failed one opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.time):
+        """
+        Constructor method.
+
+        :param int failure_threshold: number of consecutive failures which opens the circuit
+        :param int reset_timeout: seconds after opening before a probe request is allowed
+        :param function clock: returns the current time in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.short_circuited = 0
+        self._probing = False
+        self._lock = Lock()
+
+    def allow_request(self):
+        """
+        Return True if a request may be made to the upstream.
+        :rtype: bool
+        """
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._probing):
+                self._probing = self.state == self.HALF_OPEN
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        """
+        Record a successful request, closing the circuit.
+        """
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """
+        Record a failed request, opening the circuit if the threshold is reached or the probe failed.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+            self._probing = False
+
+    def record_inconclusive(self):
+        """
+        Record a request which ended without showing whether the upstream is healthy, such as a request
+        whose timeout was cut short by a deadline. A probe request may then be made again.
+        """
+        with self._lock:
+            self._probing = False
+
+    def status(self):
+        """
+        Return the state of the circuit breaker for monitoring.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'short_circuited': self.short_circuited
+            }
+
+
+_CIRCUIT_BREAKERS = {}
+
+
+def get_circuit_breaker_status():
+    """
+    Return the state of the circuit breaker of each upstream for which a session has been created.
+    :rtype: dict
+    """
+    return {upstream: breaker.status() for upstream, breaker in _CIRCUIT_BREAKERS.items()}
+
+
+def _bound_timeout(timeout, remaining):
+    """
+    Limit each part of a requests timeout to remaining seconds.
+    :param timeout: float or tuple of connect and read timeouts
+    :param float remaining:
+    """
+    if isinstance(timeout, tuple):
+        return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+class DeadlineRetry(Retry):
+    """
+    Retry configuration which stops retrying when the request deadline would pass before another attempt
+    could connect, that is when the time remaining is less than the backoff plus min_attempt_time.
+    """
+
+    def __init__(self, *args, min_attempt_time=0, **kwargs):
+        """
+        Constructor method. The other arguments are those of urllib3.util.retry.Retry.
+
+        :param float min_attempt_time: seconds another attempt needs, such as the connect timeout
+        """
+        super().__init__(*args, **kwargs)
+        self.min_attempt_time = min_attempt_time
+
+    def new(self, **kw):
+        kw.setdefault('min_attempt_time', self.min_attempt_time)
+        return super().new(**kw)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new_retry = super().increment(method=method, url=url, response=response, error=error, _pool=_pool,
+                                      _stacktrace=_stacktrace)
+        remaining = get_remaining_time()
+        if remaining is not None and remaining < new_retry.get_backoff_time() + self.min_attempt_time:
+            raise MaxRetryError(_pool, url, error or ResponseError('Not enough time left before the deadline'))
+        return new_retry
+
+
+class TimeoutSession(Session):
+    """
+    Session which applies a default timeout to requests made without one. Within a request deadline,
+    the timeouts are limited to the time remaining and requests raise DeadlineExceeded once the deadline
+    has passed. If it has a circuit breaker, requests raise CircuitOpenError while the circuit is open,
+    and request errors, including timeouts, and 5xx responses count as failures. A timeout which was cut
+    short by the deadline does not count, since it does not show that the upstream is slow. Request errors and
+    5xx responses are recorded as upstream failures.
+    """
+
+    def __init__(self, timeout, circuit_breaker=None):
+        """
+        Constructor method.
+
+        :param tuple timeout: connect and read timeouts in seconds
+        :param CircuitBreaker circuit_breaker: optional circuit breaker for the upstream
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.circuit_breaker = circuit_breaker
+
+    def request(self, method, url, **kwargs):  # pylint: disable=W0221
+        try:
+            response = self._request(method, url, **kwargs)
+        except RequestException as err:
+            record_upstream_failure(f'{method} {url}: {err!r}')
+            raise
+        if response.status_code >= 500:
+            record_upstream_failure(f'{method} {url}: {response.status_code}')
+        return response
+
+    def _request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        cut_short = False
+        remaining = get_remaining_time()
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceeded(f'Deadline passed before requesting {url}')
+            timeout = _bound_timeout(kwargs['timeout'], remaining)
+            cut_short = timeout != kwargs['timeout']
+            kwargs['timeout'] = timeout
+        if self.circuit_breaker is None:
+            return super().request(method, url, **kwargs)
+
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError(f'Circuit breaker is open for {url}')
+        try:
+            response = super().request(method, url, **kwargs)
+        except Timeout:
+            if cut_short:
+                self.circuit_breaker.record_inconclusive()
+            else:
+                self.circuit_breaker.record_failure()
+            raise
+        except RequestException:
+            self.circuit_breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return response
+
+
+def get_transport_settings(upstream):
+    """
+    Return the transport settings for upstream.
+    :param str upstream: name of the upstream in UPSTREAM_TRANSPORT
+    :rtype: dict
+    """
+    transport_config = app.config['UPSTREAM_TRANSPORT']
+    return dict(transport_config['default'], **transport_config.get(upstream, {}))
+
+
+def create_session(upstream):
+    """
+    Create a session for upstream. Connections are kept alive and reused by later requests
+    made with the same session. The session's circuit breaker replaces any previous one for
+    upstream in the monitoring status.
+
+    :param str upstream: name of the upstream in UPSTREAM_TRANSPORT
+    :rtype: TimeoutSession
+    """
+    settings = get_transport_settings(upstream)
+    # Read timeouts are not retried because they have already used the full read timeout.
+    retry = DeadlineRetry(
+        total=settings['retries'],
+        read=0,
+        backoff_factor=settings['backoff_factor'],
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+        min_attempt_time=settings['connect_timeout']
+    )
+    adapter = HTTPAdapter(pool_connections=settings['pool_connections'],
+                          pool_maxsize=settings['pool_maxsize'],
+                          max_retries=retry)
+    circuit_breaker = CircuitBreaker(failure_threshold=settings['failure_threshold'],
+                                     reset_timeout=settings['reset_timeout'])
+    _CIRCUIT_BREAKERS[upstream] = circuit_breaker
+    session = TimeoutSession((settings['connect_timeout'], settings['read_timeout']),
+                             circuit_breaker=circuit_breaker)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -2,23 +2,48 @@
 Utility functions
 
 """
+import codecs
+import itertools
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from flask import request
 from functools import update_wrapper
+from threading import Lock
 from urllib.parse import urlencode, urljoin
 from email.message import EmailMessage
 
 import requests as r
 
 from . import app
+from .deadline import get_remaining_time
+from .transport import create_session, record_upstream_failure
 
 
-def execute_get_request(hostname, path=None, params=None):
+_SESSIONS = {}
+_SESSIONS_LOCK = Lock()
+
+
+def _get_session(upstream):
+    """
+    Return the session shared by requests to upstream, creating it on first use.
+    :param str upstream: name of the upstream in UPSTREAM_TRANSPORT
+    :rtype: requests.Session
+    """
+    with _SESSIONS_LOCK:
+        if upstream not in _SESSIONS:
+            _SESSIONS[upstream] = create_session(upstream)
+        return _SESSIONS[upstream]
+
+
+def execute_get_request(hostname, path=None, params=None, upstream='default'):
     """
     Do a get request against a service endpoint.
 
     :param str hostname: Scheme and hostname of the target service
     :param str path: path part of the url
     :param dict params: dictionary of query parameters
+    :param str upstream: name of the upstream in UPSTREAM_TRANSPORT which determines timeouts and retries
     :return: response of the web service call or an empty response object if call is unsuccessful
     :rtype: requests.Response
 
@@ -27,13 +52,59 @@ def execute_get_request(hostname, path=None, params=None):
     target = urljoin(hostname, path)
     try:
         app.logger.debug(f'Requesting data from {target}')
-        resp = r.get(target, params=params)
+        resp = _get_session(upstream).get(target, params=params)
     except (r.exceptions.Timeout, r.exceptions.ConnectionError) as err:
         app.logger.error(repr(err))
         resp = r.Response()  # return an empty response object
     return resp
 
 
+_EXECUTOR = None
+_EXECUTOR_LOCK = Lock()
+
+
+def _get_executor():
+    """
+    Return the thread pool used to fan out upstream requests. The pool is created on first use so that
+    each gunicorn worker gets its own threads rather than inheriting a pool from the master process.
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    global _EXECUTOR  # pylint: disable=W0603
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=app.config['UPSTREAM_MAX_WORKERS'],
+                                           thread_name_prefix='upstream')
+    return _EXECUTOR
+
+
+def execute_concurrently(calls):
+    """
+    Run independent calls in parallel on a bounded thread pool and wait for all of them to finish.
+    Each call is isolated from the others: if it raises, or is still running when the request
+    deadline passes, the error is logged and recorded as an upstream failure, and its fallback value is used as
+    its result.
+
+    :param dict calls: maps a name to a tuple of (function, tuple of positional arguments, fallback value)
+    :return: dictionary mapping each name to the result of its call or to its fallback
+    :rtype: dict
+    """
+    executor = _get_executor()
+    # Each call runs in a copy of the caller's context so that it sees the request deadline
+    futures = {
+        name: executor.submit(copy_context().run, func, *args)
+        for name, (func, args, _) in calls.items()
+    }
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=get_remaining_time())
+        except Exception as err:  # pylint: disable=W0703
+            app.logger.error(f'Concurrent call {name} failed: {err!r}')
+            record_upstream_failure(f'{name}: {err!r}')
+            results[name] = calls[name][2]
+    return results
+
+
 def create_message(target_email, form_data, user_system_data, timestamp):
     """
     Uses data from a form to create and format a message that can be sent in an email using the Python SMTP library.
@@ -86,10 +157,11 @@ def construct_url(netloc, path, parameters=()):
 def set_cookie_for_banner_message(full_function_response_object):
     """
     Checks if a cookie is desired and has not been set. If so it will set a cooke that will turn off
-    the special banner messages, such as the one for pandemics
+    the special banner messages, such as the one for pandemics. The cookie is set by a script instead when
+    responses are CDN cacheable.
     :param full_function_response_object: standard HTTP response object
     """
-    if app.config['SET_COOKIE_TO_HIDE_BANNER_NOTICES']:
+    if app.config['SET_COOKIE_TO_HIDE_BANNER_NOTICES'] and not app.config['CDN_CACHEABLE_RESPONSES']:
         previously_set_cookie = request.cookies.get('no-show-banner-message')
         if previously_set_cookie is None:
             full_function_response_object.set_cookie('no-show-banner-message', 'no-show', max_age=60*60*24*30)
@@ -124,6 +196,251 @@ def parse_rdb(rdb_iter_lines):
         yield dict(zip(headers, record_values))
 
 
+def iter_rdb_lines(response, chunk_size=64 * 1024):
+    """
+    Iterate over the lines of an RDB response body, decoding it in large chunks rather than
+    line by line.
+
+    :param requests.Response response: response whose body has not been read
+    :param int chunk_size: number of bytes to read and decode at a time
+    :rtype: Iterator of str
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    remainder = ''
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        lines = (remainder + decoder.decode(chunk)).split('\n')
+        remainder = lines.pop()
+        yield from lines
+    remainder += decoder.decode(b'', final=True)
+    if remainder:
+        yield remainder
+
+
+class RdbRecord(Mapping):
+    """
+    Read only mapping of column names to the values in one RDB record. All records parsed from an
+    RDB file share one column index, so a record only holds its own values.
+    """
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        """
+        Constructor method.
+
+        :param dict index: maps each column name to the position of its value
+        :param values: sequence of the record's values
+        """
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._index[key]]
+        except IndexError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        position = self._index.get(key)
+        if position is None or position >= len(self._values):
+            return default
+        return self._values[position]
+
+    def __contains__(self, key):
+        position = self._index.get(key)
+        return position is not None and position < len(self._values)
+
+    def __iter__(self):
+        return (key for key, position in self._index.items() if position < len(self._values))
+
+    def __len__(self):
+        return min(len(self._index), len(self._values))
+
+    def __repr__(self):
+        return f'RdbRecord({dict(self)!r})'
+
+    def __getstate__(self):
+        return self._index, self._values
+
+    def __setstate__(self, state):
+        self._index, self._values = state
+
+
+def _read_rdb_header(rdb_iter_lines, columns=None):
+    """
+    Read the column headers of an RDB file and the line after them.
+
+    :param iterator rdb_iter_lines: iterator containing lines from an RDB file
+    :param columns: optional iterable of the column names to keep. Columns which are not in the
+        file are ignored. If None, all columns are kept.
+    :returns
+        - index - dict of each kept column name to the position of its value in a record
+        - project - function which returns the kept values of a line's values, or None if all are kept
+    """
+    for line in rdb_iter_lines:
+        if line and line[0] != '#':
+            headers = line.rstrip('\r').split('\t')
+            break
+    else:
+        raise Exception('RDB column headers not found.')
+    # skip the next line in the RDB file
+    next(rdb_iter_lines, None)
+
+    if columns is None:
+        return {header: position for position, header in enumerate(headers)}, None
+    columns = set(columns)
+    kept = [(header, position) for position, header in enumerate(headers) if header in columns]
+    index = {header: kept_position for kept_position, (header, _) in enumerate(kept)}
+    positions = [position for _, position in kept]
+    return index, lambda values: tuple(values[position] for position in positions if position < len(values))
+
+
+def _iter_rdb_records(rdb_iter_lines, index, project):
+    """
+    Generate the RdbRecord of each line after the headers of an RDB file.
+    """
+    for record in rdb_iter_lines:
+        # Ignore empty lines
+        if not record or record.isspace():
+            continue
+        values = record.rstrip('\r').split('\t')
+        yield RdbRecord(index, project(values) if project else tuple(values))
+
+
+def parse_rdb_records(rdb_iter_lines, columns=None):
+    """
+    Parse records in an RDB file into RdbRecord mappings. This is a faster, more compact alternative
+    to parse_rdb.
+
+    :param iterator rdb_iter_lines: iterator containing lines from an RDB file
+    :param columns: optional iterable of the column names to keep. Columns which are not in the
+        file are ignored. If None, all columns are kept.
+    :rtype: Iterator of RdbRecord
+    """
+    index, project = _read_rdb_header(rdb_iter_lines, columns=columns)
+    yield from _iter_rdb_records(rdb_iter_lines, index, project)
+
+
+class RdbRowView(Mapping):
+    """
+    Read only mapping of column names to the values in one row of an RdbTable. The values are read
+    from the table's columns when accessed.
+    """
+    __slots__ = ('_columns', '_row')
+
+    def __init__(self, columns, row):
+        """
+        Constructor method.
+
+        :param dict columns: maps each column name to the list of its values
+        :param int row: position of the row in the column lists
+        """
+        self._columns = columns
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._columns[key][self._row]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        return f'RdbRowView({dict(self)!r})'
+
+
+class RdbTable(Sequence):
+    """
+    Columnar RDB result. Each column is held as one list of values and the rows are lazy RdbRowView
+    objects. Sorting and filtering return new tables which share the columns and only hold the positions
+    of their rows.
+    """
+
+    def __init__(self, columns, rows=None):
+        """
+        Constructor method.
+
+        :param dict columns: maps each column name to the list of its values. All lists are the same length.
+        :param rows: optional sequence of the positions of the rows in the table. If None, every row is
+            in the table in its original order.
+        """
+        self.columns = columns
+        if rows is None:
+            rows = range(len(next(iter(columns.values()))) if columns else 0)
+        self.rows = rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RdbTable(self.columns, self.rows[index])
+        return RdbRowView(self.columns, self.rows[index])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(row == other_row for row, other_row in zip(self, other))
+
+    def column(self, name):
+        """
+        Return the values of a column for the rows in the table.
+        :param str name: column name
+        :rtype: list
+        """
+        values = self.columns[name]
+        return [values[row] for row in self.rows]
+
+    def sorted_by(self, *names, reverse=False):
+        """
+        Return a table with the rows sorted by the values of the named columns.
+        :param names: column names
+        :param bool reverse: if True, sort in descending order
+        :rtype: RdbTable
+        """
+        keys = [self.columns[name] for name in names]
+        if len(keys) == 1:
+            key_values = keys[0]
+            sort_key = key_values.__getitem__
+        else:
+            sort_key = lambda row: tuple(key_values[row] for key_values in keys)
+        return RdbTable(self.columns, sorted(self.rows, key=sort_key, reverse=reverse))
+
+    def filter_by(self, name, values):
+        """
+        Return a table with the rows whose value in the named column is one of values.
+        :param str name: column name
+        :param values: iterable of the values to keep
+        :rtype: RdbTable
+        """
+        column_values = self.columns[name]
+        values = set(values)
+        return RdbTable(self.columns, [row for row in self.rows if column_values[row] in values])
+
+
+def parse_rdb_table(rdb_iter_lines, columns=None):
+    """
+    Parse the records in an RDB file into an RdbTable. Repeated values within a column are stored once.
+    A file without records gives a table with an empty list for each column.
+
+    :param iterator rdb_iter_lines: iterator containing lines from an RDB file
+    :param columns: optional iterable of the column names to keep. Columns which are not in the
+        file are ignored. If None, all columns are kept.
+    :rtype: RdbTable
+    """
+    index, project = _read_rdb_header(rdb_iter_lines, columns=columns)
+    table_columns = {name: [] for name in index}
+    builders = [(table_columns[name], {}, position) for name, position in index.items()]
+    for record in _iter_rdb_records(rdb_iter_lines, index, project):
+        values = record._values  # pylint: disable=W0212
+        row_length = len(values)
+        for column_values, unique_values, position in builders:
+            value = values[position] if position < row_length else ''
+            column_values.append(unique_values.setdefault(value, value))
+    return RdbTable(table_columns)
+
+
 def defined_when(condition, fallback):
     """
     Decorator that fallsback to a specified function if `condition` is False.
@@ -2,31 +2,67 @@
 Main application views.
 """
 import datetime
+import hashlib
+import hmac
+import itertools
 import json
+import os
+import pickle
 import smtplib
 
-from flask import abort, render_template, redirect, request, Markup, make_response, url_for
+from flask import abort, g, jsonify, render_template, redirect, request, Markup, make_response, url_for
 
 from markdown import markdown
 
 from . import app, __version__
-from .location_utils import build_linked_data, get_disambiguated_values, rollup_dataseries, \
-    get_period_of_record_by_parm_cd, get_default_parameter_code
-from .utils import defined_when, set_cookie_for_banner_message, create_message
+from .cache import LRUCache, ResponseCache, create_cache_backend, make_cache_key
+from .deadline import call_within_deadline, get_remaining_time, reset_deadline, set_deadline
+from .edge_cache import EdgePurger, add_cache_headers, add_surrogate_keys, get_site_surrogate_keys, \
+    hide_banner_notices, is_internet_explorer
+from .transport import end_upstream_failure_record, get_circuit_breaker_status, start_upstream_failure_record
+from .location_utils import build_linked_data, get_disambiguated_series, get_disambiguated_values, rollup_dataseries, \
+    get_period_of_record_by_data_type, get_default_parameter_code
+from .utils import defined_when, set_cookie_for_banner_message, create_message, execute_concurrently
 from .services.camera import get_monitoring_location_camera_details
 from .services.nwissite import SiteService
 from .services.ogc import MonitoringLocationNetworkService
 from .services.sifta import SiftaService
-from .services.timezone import TimeZoneService
+from .services.timezone import LocalTimeZoneResolver, TimeZoneService
 
 # Station Fields Mapping to Descriptions
 from .constants import STATION_FIELDS_D
 
-site_service = SiteService(app.config['SITE_DATA_ENDPOINT'])
+upstream_cache = ResponseCache(create_cache_backend(app.config['UPSTREAM_CACHE_BACKEND'],
+                                                    app.config['UPSTREAM_CACHE_MAX_SIZE'],
+                                                    sqlite_path=app.config['UPSTREAM_CACHE_SQLITE_PATH'] or
+                                                    os.path.join(app.instance_path, 'upstream_cache.sqlite')),
+                               stale_while_revalidate=app.config['UPSTREAM_CACHE_STALE_WHILE_REVALIDATE'],
+                               stale_if_error=app.config['UPSTREAM_CACHE_STALE_IF_ERROR'])
+site_service = SiteService(app.config['SITE_DATA_ENDPOINT'],
+                           cache=upstream_cache,
+                           cache_ttls=app.config['SITE_SERVICE_CACHE_TTLS'])
 monitoring_location_network_service = \
-    MonitoringLocationNetworkService(app.config['MONITORING_LOCATIONS_OBSERVATIONS_ENDPOINT'])
-time_zone_service = TimeZoneService(app.config['WEATHER_SERVICE_ENDPOINT'])
-sifta_service = SiftaService(app.config['COOPERATOR_SERVICE_ENDPOINT'])
+    MonitoringLocationNetworkService(app.config['MONITORING_LOCATIONS_OBSERVATIONS_ENDPOINT'],
+                                     cache=upstream_cache,
+                                     cache_ttl=app.config['MONITORING_LOCATIONS_OBSERVATIONS_CACHE_TTL'])
+time_zone_service = TimeZoneService(app.config['WEATHER_SERVICE_ENDPOINT'],
+                                    cache=upstream_cache,
+                                    cache_ttl=app.config['WEATHER_SERVICE_CACHE_TTL'],
+                                    local_resolver=LocalTimeZoneResolver.from_geojson_file(
+                                        app.config['TIME_ZONE_BOUNDARIES_FILE'])
+                                    if app.config['TIME_ZONE_BOUNDARIES_FILE'] else None,
+                                    remote_fallback=app.config['WEATHER_SERVICE_TIME_ZONE_FALLBACK_ENABLED'])
+sifta_service = SiftaService(app.config['COOPERATOR_SERVICE_ENDPOINT'],
+                             cache=upstream_cache,
+                             cache_ttl=app.config['COOPERATOR_SERVICE_CACHE_TTL'])
+edge_purger = EdgePurger(app.config['EDGE_PURGE_ENDPOINT'], headers=app.config['EDGE_PURGE_HEADERS'])
+
+# Settings which change the rendered monitoring-location page, so are part of its page cache key
+MONITORING_LOCATION_PAGE_SETTINGS = ('GROUNDWATER_LEVELS_ENABLED', 'MONITORING_LOCATION_CAMERA_ENABLED',
+                                     'DAILY_VALUE_HYDROGRAPH_ENABLED', 'EMBED_IMAGE_FEATURE_ENABLED',
+                                     'BANNER_NOTICES')
+monitoring_location_page_cache = LRUCache(max_size=app.config['MONITORING_LOCATION_PAGE_CACHE_MAX_SIZE'],
+                                          default_ttl=app.config['MONITORING_LOCATION_PAGE_CACHE_TTL'])
 
 def has_feedback_link():
     """
@@ -44,6 +80,57 @@ def inject_has_feedback_link():
     return dict(has_feedback_link=has_feedback_link())
 
 
+@app.context_processor
+def inject_page_variant():
+    return dict(is_internet_explorer=is_internet_explorer(), hide_banner_notices=hide_banner_notices())
+
+
+@app.before_request
+def start_request_deadline():
+    """
+    Start the deadline for the upstream calls made by this request if its route has one.
+    """
+    seconds = app.config['REQUEST_DEADLINES'].get(request.endpoint)
+    if seconds is not None:
+        g.deadline_token = set_deadline(seconds)
+
+
+@app.before_request
+def start_request_upstream_failure_record():
+    """
+    Start recording the upstream calls of this request which fail or are skipped.
+    """
+    g.upstream_failure_token = start_upstream_failure_record()
+
+
+@app.teardown_request
+def end_request_deadline(exc):  # pylint: disable=W0613
+    """
+    Remove the deadline started for this request.
+    """
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        reset_deadline(token)
+
+
+@app.teardown_request
+def end_request_upstream_failure_record(exc):  # pylint: disable=W0613
+    """
+    Stop recording the upstream calls of this request.
+    """
+    token = g.pop('upstream_failure_token', None)
+    if token is not None:
+        end_upstream_failure_record(token)
+
+
+@app.after_request
+def set_cache_headers(response):
+    """
+    Add the headers which let shared caches store the response when responses are CDN cacheable.
+    """
+    return add_cache_headers(response)
+
+
 @app.route('/')
 def home():
     """Render the home page."""
@@ -105,122 +192,220 @@ def iv_data_availability():
     return render_template('iv_data_availability_statement.html')
 
 
+def _get_monitoring_location_variant(site_no, agency_cd):
+    """
+    Return the inputs which select the monitoring-location response for a site. Besides the site, these are
+    the requested representation, the parts of the request which the page template reads and the settings
+    which change the page.
+
+    :param str site_no: USGS site number
+    :param str agency_cd: agency code requested, which may be empty
+    :rtype: dict
+    """
+    variant = {
+        'site_no': site_no,
+        'agency_cd': agency_cd,
+        'accept': 'json-ld' if request.headers.get('Accept', '').lower() == 'application/ld+json' else 'html',
+        'host': request.host_url,
+        'hide_banner': hide_banner_notices(),
+        'msie': is_internet_explorer()
+    }
+    variant.update((name.lower(), app.config[name]) for name in MONITORING_LOCATION_PAGE_SETTINGS)
+    return variant
+
+
+def _get_data_version(payloads):
+    """
+    Return a digest of the upstream payloads a monitoring-location response is built from. It identifies the
+    data shown on the page, whatever the page variant.
+
+    The payloads are pickled rather than converted to text because it is several times faster for a site with a
+    long period of record. Equal payloads which share objects differently may get different digests, which only
+    costs a full response.
+
+    :param tuple payloads: upstream responses
+    :rtype: str
+    """
+    return hashlib.sha256(pickle.dumps(payloads, protocol=4)).hexdigest()
+
+
+def _get_monitoring_location_etag(page_key, data_version):
+    """
+    Return a strong entity tag for a monitoring-location response, derived from the upstream payloads the
+    response is built from, the page variant and the application version.
+
+    :param str page_key: cache key of the page variant
+    :param str data_version: digest of the upstream payloads returned by _get_data_version
+    :rtype: str
+    """
+    return hashlib.sha256(f'{__version__}\n{page_key}\n{data_version}'.encode('utf-8')).hexdigest()
+
+
+def _get_monitoring_location_upstream_results(site_no, agency_cd, unique_site):
+    """
+    Call the upstream services which only depend on the site metadata in parallel.
+
+    :param str site_no: USGS site number
+    :param str agency_cd: agency code requested, which may be empty
+    :param unique_site: site metadata
+    :rtype: dict
+    """
+    # If the request deadline is nearly spent, the optional calls are given no time so that
+    # they are served from the cache or skipped.
+    remaining_time = get_remaining_time()
+    optional_deadline = 0 if remaining_time is not None and \
+        remaining_time < app.config['REQUEST_DEADLINE_OPTIONAL_RESERVE'] else None
+    upstream_calls = {
+        'period_of_record': (site_service.get_period_of_record, (site_no, agency_cd), (500, '', [])),
+        'cooperators': (call_within_deadline,
+                        (optional_deadline, sifta_service.get_cooperators, site_no), []),
+        'time_zone': (call_within_deadline,
+                      (optional_deadline, time_zone_service.get_iana_time_zone,
+                       unique_site.get('dec_lat_va', ''), unique_site.get('dec_long_va', '')), None)
+    }
+    if app.config['MONITORING_LOCATION_CAMERA_ENABLED']:
+        upstream_calls['cameras'] = (call_within_deadline,
+                                     (optional_deadline, get_monitoring_location_camera_details, site_no), [])
+    return execute_concurrently(upstream_calls)
+
+
+def _get_monitoring_location_context(site_no, site_data, upstream_results):
+    """
+    Build the template context and the linked data for a single monitoring location.
+
+    :param str site_no: USGS site number
+    :param list site_data: site metadata, containing a single site
+    :param dict upstream_results: results of _get_monitoring_location_upstream_results
+    :returns
+        - context - dict
+        - json_ld - dict
+    """
+    unique_site = site_data[0]
+    _, _, period_of_record = upstream_results['period_of_record']
+    period_of_record = period_of_record or []
+    period_of_record_by_data_type = get_period_of_record_by_data_type(period_of_record)
+    iv_period_of_record = period_of_record_by_data_type.get('uv', {})
+    gw_period_of_record = period_of_record_by_data_type.get('gw', {}) if app.config[
+        'GROUNDWATER_LEVELS_ENABLED'] else {}
+    site_dataseries = get_disambiguated_series(period_of_record, app.config['LOOKUP_INDEX'])
+    grouped_dataseries = rollup_dataseries(site_dataseries)
+    available_parameter_codes = set(itertools.chain.from_iterable(period_of_record_by_data_type.values()))
+    available_data_types = set(period_of_record_by_data_type)
+
+    json_ld = build_linked_data(
+        site_no,
+        unique_site.get('station_nm'),
+        unique_site.get('agency_cd'),
+        unique_site.get('dec_lat_va', ''),
+        unique_site.get('dec_long_va', ''),
+        available_parameter_codes
+    )
+    location_with_values = get_disambiguated_values(unique_site, app.config['LOOKUP_INDEX'])
+    try:
+        site_owner_state = (
+            location_with_values['district_cd']['abbreviation']
+            if location_with_values['district_cd']['abbreviation']
+            else location_with_values['state_cd']['abbreviation']
+        )
+    except KeyError:
+        site_owner_state = None
+
+    cooperators = upstream_results['cooperators']
+
+    if site_owner_state is not None:
+        email_for_data_questions = \
+            app.config['EMAIL_TARGET']['contact'].format(state_district_code=site_owner_state.lower())
+    else:
+        email_for_data_questions = app.config['EMAIL_TARGET']['report']
+
+    time_zone = upstream_results['time_zone']
+
+    context = {
+        'status_code': 200,
+        'stations': site_data,
+        'location_with_values': location_with_values,
+        'STATION_FIELDS_D': STATION_FIELDS_D,
+        'json_ld': Markup(json.dumps(json_ld, indent=4)),
+        'available_data_types': available_data_types,
+        'time_zone': time_zone if time_zone else 'local',
+        'iv_period_of_record': iv_period_of_record,
+        'gw_period_of_record': gw_period_of_record,
+        'default_parameter_code': get_default_parameter_code(iv_period_of_record, gw_period_of_record),
+        'parm_grp_summary': grouped_dataseries,
+        'cooperators': cooperators,
+        'email_for_data_questions': email_for_data_questions,
+        'referring_page_type': 'monitoring',
+        'cameras': upstream_results.get('cameras', [])
+    }
+    return context, json_ld
+
+
 @app.route('/monitoring-location/<site_no>/', methods=['GET'])
 def monitoring_location(site_no):
     """
     Monitoring Location view
 
+    Responses are tagged with a strong ETag derived from the upstream payloads. A request whose If-None-Match
+    contains the current tag gets a 304 without the page being built, and a rendered page is reused for as long
+    as its tag is unchanged.
+
     :param site_no: USGS site number
 
     """
     agency_cd = request.args.get('agency_cd', '')
     site_status, site_status_reason, site_data = site_service.get_site_data(site_no, agency_cd)
-    json_ld = None
-
+    variant = _get_monitoring_location_variant(site_no, agency_cd)
+    is_json_ld = variant['accept'] == 'json-ld'
+
+    if not (site_status == 200 or 400 <= site_status < 500):
+        http_code = 503 if 500 <= site_status <= 511 else 500
+        if is_json_ld:
+            return app.response_class(json.dumps(None), status=http_code, mimetype='application/ld+json')
+        response = make_response(render_template('errors/500.html'), http_code)
+        set_cookie_for_banner_message(response)
+        return response
+
+    upstream_results = {}
     if site_status == 200:
-        template = 'monitoring_location.html'
-        context = {
-            'status_code': site_status,
-            'stations': site_data,
-            'STATION_FIELDS_D': STATION_FIELDS_D
-        }
+        for site in site_data:
+            add_surrogate_keys(*get_site_surrogate_keys(site))
+    if site_status == 200 and len(site_data) == 1:
+        upstream_results = _get_monitoring_location_upstream_results(site_no, agency_cd, site_data[0])
 
-        if len(site_data) == 1:
-            unique_site = site_data[0]
-
-            _, _, period_of_record = site_service.get_period_of_record(site_no, agency_cd)
-            iv_period_of_record = get_period_of_record_by_parm_cd(period_of_record, 'uv')
-            gw_period_of_record = get_period_of_record_by_parm_cd(period_of_record, 'gw') if app.config[
-                'GROUNDWATER_LEVELS_ENABLED'] else {}
-            site_dataseries = [
-                get_disambiguated_values(
-                    param_datum,
-                    app.config['NWIS_CODE_LOOKUP'],
-                    {},
-                    app.config['HUC_LOOKUP']
-                )
-                for param_datum in period_of_record
-            ]
-            grouped_dataseries = rollup_dataseries(site_dataseries)
-            available_parameter_codes = set(param_datum['parm_cd'] for param_datum in period_of_record)
-            available_data_types = set(param_datum['data_type_cd'] for param_datum in period_of_record)
-
-            json_ld = build_linked_data(
-                site_no,
-                unique_site.get('station_nm'),
-                unique_site.get('agency_cd'),
-                unique_site.get('dec_lat_va', ''),
-                unique_site.get('dec_long_va', ''),
-                available_parameter_codes
-            )
-            location_with_values = get_disambiguated_values(
-                unique_site,
-                app.config['NWIS_CODE_LOOKUP'],
-                app.config['COUNTRY_STATE_COUNTY_LOOKUP'],
-                app.config['HUC_LOOKUP']
-            )
-            try:
-                site_owner_state = (
-                    location_with_values['district_cd']['abbreviation']
-                    if location_with_values['district_cd']['abbreviation']
-                    else location_with_values['state_cd']['abbreviation']
-                )
-            except KeyError:
-                site_owner_state = None
-
-            cooperators = sifta_service.get_cooperators(site_no)
-
-            if site_owner_state is not None:
-                email_for_data_questions = \
-                    app.config['EMAIL_TARGET']['contact'].format(state_district_code=site_owner_state.lower())
-            else:
-                email_for_data_questions = app.config['EMAIL_TARGET']['report']
-
-            # Get the time zone for the location
-            time_zone = time_zone_service.get_iana_time_zone(unique_site.get('dec_lat_va', ''), unique_site.get('dec_long_va', ''))
-
-            context = {
-                'status_code': site_status,
-                'stations': site_data,
-                'location_with_values': location_with_values,
-                'STATION_FIELDS_D': STATION_FIELDS_D,
-                'json_ld': Markup(json.dumps(json_ld, indent=4)),
-                'available_data_types': available_data_types,
-                'time_zone': time_zone if time_zone else 'local',
-                'iv_period_of_record': iv_period_of_record,
-                'gw_period_of_record': gw_period_of_record,
-                'default_parameter_code': get_default_parameter_code(iv_period_of_record, gw_period_of_record),
-                'parm_grp_summary': grouped_dataseries,
-                'cooperators': cooperators,
-                'email_for_data_questions': email_for_data_questions,
-                'referring_page_type': 'monitoring',
-                'cameras': get_monitoring_location_camera_details(site_no) if app.config[
-                    'MONITORING_LOCATION_CAMERA_ENABLED'] else []
-            }
-
-        http_code = 200
-    elif 400 <= site_status < 500:
-        template = 'monitoring_location.html'
-        context = {'status_code': site_status, 'reason': site_status_reason}
-        http_code = 200
-    elif 500 <= site_status <= 511:
-        template = 'errors/500.html'
-        context = {}
-        http_code = 503
+    page_key = make_cache_key('monitoring_location', variant)
+    data_version = _get_data_version((site_status, site_status_reason, site_data, sorted(upstream_results.items())))
+    etag = _get_monitoring_location_etag(page_key, data_version)
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
     else:
-        template = 'errors/500.html'
-        context = {}
-        http_code = 500
-    if request.headers.get('Accept', '').lower() == 'application/ld+json':
-        # did not use flask.json.jsonify because changing it's default
-        # mimetype would require changing the app's JSONIFY_MIMETYPE,
-        # which defaults to application/json... didn't really want to change that
-        return app.response_class(json.dumps(json_ld), status=http_code, mimetype='application/ld+json')
-    # At this point 'resp' is not a full response object in the Flask world.
-    # In order to set a cookie to the 'resp', we need to have the full response object, so let's create that here
-    full_function_response_object = make_response(render_template(template, **context), http_code)
-    set_cookie_for_banner_message(full_function_response_object)
-    return full_function_response_object
+        cached_page = monitoring_location_page_cache.get(page_key)
+        if cached_page is not None and cached_page[0] == etag:
+            body = cached_page[1]
+        else:
+            json_ld = None
+            if site_status != 200:
+                context = {'status_code': site_status, 'reason': site_status_reason}
+            elif len(site_data) == 1:
+                context, json_ld = _get_monitoring_location_context(site_no, site_data, upstream_results)
+                context['data_version'] = data_version
+            else:
+                context = {
+                    'status_code': site_status,
+                    'stations': site_data,
+                    'STATION_FIELDS_D': STATION_FIELDS_D
+                }
+            # did not use flask.json.jsonify because changing it's default
+            # mimetype would require changing the app's JSONIFY_MIMETYPE,
+            # which defaults to application/json... didn't really want to change that
+            body = json.dumps(json_ld) if is_json_ld else render_template('monitoring_location.html', **context)
+            monitoring_location_page_cache.set(page_key, (etag, body))
+        response = app.response_class(body, mimetype='application/ld+json' if is_json_ld else 'text/html')
+
+    response.set_etag(etag)
+    if not is_json_ld:
+        set_cookie_for_banner_message(response)
+    return response
 
 
 def return_404():
@@ -241,7 +426,7 @@ def hydrological_unit(huc_cd, show_locations=False):
     # Get the data corresponding to this HUC
     monitoring_locations = []
     if huc_cd:
-        huc = app.config['HUC_LOOKUP']['hucs'].get(huc_cd, None)
+        huc = app.config['LOOKUP_INDEX'].get_huc(huc_cd)
         # If this is a HUC8 site, get the monitoring locations within it.
         if huc and show_locations:
             _, _, monitoring_locations = site_service.get_huc_sites(huc_cd)
@@ -250,7 +435,7 @@ def hydrological_unit(huc_cd, show_locations=False):
     else:
         huc = {
             'huc_nm': 'HUC2',
-            'children': app.config['HUC_LOOKUP']['classes']['HUC2']
+            'children': app.config['LOOKUP_INDEX'].get_huc_class('HUC2')
         }
 
     http_code = 200 if huc else 404
@@ -330,20 +515,19 @@ def states_counties(state_cd, county_cd, show_locations=False):
     # Get the data associated with this county
     if state_cd and county_cd:
         state_county_cd = state_cd + county_cd
-        political_unit = app.config['COUNTRY_STATE_COUNTY_LOOKUP']['US']['state_cd'].get(state_cd, None)['county_cd']\
-            .get(county_cd, None)
+        political_unit = app.config['LOOKUP_INDEX'].get_county('US', state_cd, county_cd)
         if show_locations:
             _, _, monitoring_locations = site_service.get_county_sites(state_county_cd)
 
     # Get the data corresponding to this state
     elif state_cd and not county_cd:
-        political_unit = app.config['COUNTRY_STATE_COUNTY_LOOKUP']['US']['state_cd'].get(state_cd, None)
+        political_unit = app.config['LOOKUP_INDEX'].get_state('US', state_cd)
 
     # If no state and or state and county code is available, display list of states.
     elif not state_cd and not county_cd:
         political_unit = {
             'name': 'United States',
-            'children': app.config['COUNTRY_STATE_COUNTY_LOOKUP']['US']['state_cd']
+            'children': app.config['LOOKUP_INDEX'].get_states('US')
         }
 
     http_code = 200 if political_unit else 404
@@ -375,3 +559,110 @@ def time_series_component(site_no):
     Returns an unadorned page with the time series component for a site.
     """
     return render_template('monitoring_location_embed.html', site_no=site_no)
+
+
+def is_upstream_cache_shared():
+    """
+    Return True if all the workers on the host share the upstream cache, so responses removed from it by one
+    worker are not served by another.
+    :rtype: bool
+    """
+    return app.config['UPSTREAM_CACHE_BACKEND'] == 'sqlite'
+
+
+def purge_surrogate_keys(keys):
+    """
+    Remove the cached upstream responses which the pages tagged with keys were built from and purge the keys
+    from the edge cache. A site key also purges the keys of the county and hydrologic unit which list the site,
+    using the site metadata fetched again from the site service. Since monitoring-location pages have the keys of
+    their county and hydrologic unit, the edge also purges the pages of the other sites listed there. Keys naming a
+    route, such as 'monitoring_location', purge every page of that route. Rendered monitoring-location pages are
+    not removed because they are only reused while the upstream responses they were built from are unchanged.
+    Callers must check is_upstream_cache_shared first, since otherwise the other workers keep the stale responses.
+
+    :param keys: iterable of surrogate keys, such as 'site/01646500', 'county/24/031', 'huc/02070008'
+        or 'network/RTS'
+    :returns
+        - keys - list of the keys purged
+        - edge_purged - True if the edge cache accepted the purge
+    """
+    purged_keys = list(dict.fromkeys(keys))
+    for key in list(purged_keys):
+        prefix, _, value = key.partition('/')
+        if prefix == 'site' and value:
+            site_service.invalidate_site(value)
+            sifta_service.invalidate_cooperators(value)
+            _, _, site_data = site_service.get_site_data(value)
+            for site in site_data or []:
+                site_service.invalidate_site(value, site.get('agency_cd', ''))
+                purged_keys.extend(get_site_surrogate_keys(site))
+        elif prefix == 'network':
+            monitoring_location_network_service.invalidate_networks(value)
+    purged_keys = list(dict.fromkeys(purged_keys))
+
+    for key in purged_keys:
+        prefix, _, value = key.partition('/')
+        if prefix == 'county' and value:
+            site_service.invalidate_county_sites(value.replace('/', ''))
+        elif prefix == 'huc' and value:
+            site_service.invalidate_huc_sites(value)
+        elif key == 'networks':
+            monitoring_location_network_service.invalidate_networks()
+        elif key == 'monitoring_location':
+            monitoring_location_page_cache.clear()
+
+    return purged_keys, edge_purger.purge(purged_keys)
+
+
+@app.route('/purge/', methods=['POST'])
+def purge():
+    """
+    Purges the surrogate keys listed in the JSON request body, {"keys": [...]}, from the in-app caches and the
+    edge cache. The request must have PURGE_API_TOKEN as a bearer token. The purge is refused with a 409 if the
+    upstream cache is not shared by the workers.
+    """
+    token = app.config['PURGE_API_TOKEN']
+    if not token:
+        abort(404)
+    authorization = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(authorization.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        abort(401)
+    keys = (request.get_json(silent=True) or {}).get('keys')
+    if not keys or not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+        abort(400)
+    if not is_upstream_cache_shared():
+        app.logger.warning('Refusing to purge because the upstream cache is not shared by the workers')
+        return jsonify({
+            'error': 'Purging requires the sqlite UPSTREAM_CACHE_BACKEND, which is shared by all workers'
+        }), 409
+
+    purged_keys, edge_purged = purge_surrogate_keys(keys)
+    return jsonify({
+        'keys': purged_keys,
+        'edge_purged': edge_purged
+    })
+
+
+@app.route('/status/upstreams/', methods=['GET'])
+def upstream_status():
+    """
+    Returns the state of the upstream circuit breakers and the upstream cache counters for monitoring.
+    """
+    return jsonify({
+        'circuit_breakers': get_circuit_breaker_status(),
+        'cache': upstream_cache.stats()
+    })
+
+
+@app.route('/status/lookups/', methods=['GET'])
+def lookup_status():
+    """
+    Returns the NWIS code tables which have been loaded by this worker, so unused tables can be identified.
+    """
+    code_lookups = app.config['NWIS_CODE_LOOKUP']
+    return jsonify({
+        'nwis_code_tables': {
+            'loaded': code_lookups.loaded_tables,
+            'count': len(code_lookups)
+        }
+    })